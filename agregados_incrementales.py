@@ -0,0 +1,603 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import athena_utils as athena
+from importacion_diferida import modulo_diferido
+
+pd = modulo_diferido('pandas')
+
+
+# ============================================================================
+# DEFINICIÓN DE AGREGADOS
+# ============================================================================
+#
+# Cada agregado se calcula en Athena envolviendo la query base del informe (ya
+# registrada como plantilla). Las bases filtran por `:desde` sobre la fecha de la
+# tabla de hechos (sesión o log), así el delta solo escanea desde la marca de
+# agua; las filas de las fechas >= desde se reemplazan en el almacén sin
+# recalcular el histórico.
+#
+# Lo que no es sumable entre semanas (alumnos distintos, sesiones distintas) se
+# guarda como claves (salón-alumno, sesión, alumno-mes) y se cuenta al leer.
+# Las notas no tienen fecha: se guardan como foto de la semana de corte.
+
+AGREGADOS = {
+    'asistencia_semanal': {
+        'base': 'asistencias',
+        'tabla': 'asistencia_semanal',
+        'fecha': 'semana',
+        'columnas': ['semana', 'tipo', 'estado', 'institucion', 'grado', 'registros'],
+        'numericas': ['grado', 'registros'],
+        'sql': """
+SELECT
+    date_trunc('week', CAST(start_date AS date)) AS semana,
+    content_definition AS tipo,
+    attendance_status AS estado,
+    institution AS institucion,
+    grade AS grado,
+    count(DISTINCT attendance_id) AS registros
+FROM (
+{base}
+) base
+GROUP BY 1, 2, 3, 4, 5
+""",
+    },
+    'asistentes_salon': {
+        'base': 'asistencias',
+        'tabla': 'asistentes_salon',
+        'fecha': 'semana',
+        'columnas': ['semana', 'room_id', 'student_id'],
+        'sql': """
+SELECT DISTINCT
+    date_trunc('week', CAST(start_date AS date)) AS semana,
+    room_id,
+    object_id AS student_id
+FROM (
+{base}
+) base
+WHERE attendance_status = 'A'
+""",
+    },
+    'sesiones': {
+        'base': 'cancelaciones',
+        'tabla': 'sesiones',
+        'fecha': 'fecha',
+        'columnas': ['sesion_id', 'fecha', 'estado', 'motivo', 'institucion', 'grado'],
+        'sql': """
+SELECT DISTINCT
+    sesionID AS sesion_id,
+    CAST("Fecha" AS date) AS fecha,
+    state AS estado,
+    Motivo AS motivo,
+    institucion,
+    grado
+FROM (
+{base}
+) base
+""",
+    },
+    'campus_dia_hora': {
+        'base': 'uso_campus',
+        'tabla': 'campus_dia_hora',
+        'fecha': 'semana',
+        'columnas': ['semana', 'dia_semana', 'hora', 'interacciones'],
+        'numericas': ['dia_semana', 'hora', 'interacciones'],
+        'sql': """
+SELECT
+    CAST(date_trunc('week', hora_local) AS date) AS semana,
+    day_of_week(hora_local) AS dia_semana,
+    hour(hora_local) AS hora,
+    count(*) AS interacciones
+FROM (
+    SELECT with_timezone(CAST(timecreated AS timestamp), 'UTC') AT TIME ZONE 'America/Bogota' AS hora_local
+    FROM (
+{base}
+    ) base
+    WHERE moodle_id IS NOT NULL
+) t
+-- La base corta en UTC: la semana anterior (hora local) queda incompleta y no se toca
+WHERE CAST(date_trunc('week', hora_local) AS date) >= :desde
+GROUP BY 1, 2, 3
+""",
+    },
+    'campus_alumnos': {
+        'base': 'uso_campus',
+        'tabla': 'campus_alumnos',
+        'fecha': 'semana',
+        'columnas': ['semana', 'mes', 'moodle_id'],
+        'sql': """
+SELECT DISTINCT
+    CAST(date_trunc('week', hora_local) AS date) AS semana,
+    date_format(hora_local, '%Y-%m') AS mes,
+    moodle_id
+FROM (
+    SELECT moodle_id, with_timezone(CAST(timecreated AS timestamp), 'UTC') AT TIME ZONE 'America/Bogota' AS hora_local
+    FROM (
+{base}
+    ) base
+    WHERE moodle_id IS NOT NULL
+) t
+WHERE CAST(date_trunc('week', hora_local) AS date) >= :desde
+""",
+    },
+    'notas': {
+        'base': 'calificaciones',
+        'tabla': 'notas',
+        'fecha': None,
+        'columnas': ['student_id', 'course_id', 'institucion', 'grado', 'nota'],
+        'numericas': ['nota'],
+        'sql': """
+SELECT DISTINCT
+    student_id,
+    moodle_course_id AS course_id,
+    institution AS institucion,
+    grade AS grado,
+    nota_final_ponderada AS nota
+FROM (
+{base}
+) base
+""",
+    },
+}
+
+FECHA_INICIAL = date(2000, 1, 1)
+
+# Cambia cuando cambian las tablas: un almacén con otra versión se recalcula desde cero
+VERSION_ESQUEMA = 2
+
+_BORRAR_ESQUEMA = """
+DROP TABLE IF EXISTS asistencia_semanal;
+DROP TABLE IF EXISTS asistentes_salon;
+DROP TABLE IF EXISTS sesiones;
+DROP TABLE IF EXISTS sesiones_semanal;
+DROP TABLE IF EXISTS campus_dia_hora;
+DROP TABLE IF EXISTS campus_alumnos;
+DROP TABLE IF EXISTS notas;
+DROP TABLE IF EXISTS histograma_notas;
+DROP TABLE IF EXISTS marcas_agua;
+"""
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS asistencia_semanal (
+    project_id TEXT, semana TEXT, tipo TEXT, estado TEXT, institucion TEXT, grado INTEGER, registros INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_asistencia_semanal ON asistencia_semanal (project_id, semana);
+CREATE TABLE IF NOT EXISTS asistentes_salon (
+    project_id TEXT, semana TEXT, room_id TEXT, student_id TEXT,
+    PRIMARY KEY (project_id, semana, room_id, student_id)
+);
+CREATE TABLE IF NOT EXISTS sesiones (
+    project_id TEXT, sesion_id TEXT, fecha TEXT, estado TEXT, motivo TEXT, institucion TEXT, grado TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_sesiones ON sesiones (project_id, fecha);
+CREATE TABLE IF NOT EXISTS campus_dia_hora (
+    project_id TEXT, semana TEXT, dia_semana INTEGER, hora INTEGER, interacciones INTEGER,
+    PRIMARY KEY (project_id, semana, dia_semana, hora)
+);
+CREATE TABLE IF NOT EXISTS campus_alumnos (
+    project_id TEXT, semana TEXT, mes TEXT, moodle_id TEXT,
+    PRIMARY KEY (project_id, semana, mes, moodle_id)
+);
+CREATE TABLE IF NOT EXISTS notas (
+    project_id TEXT, semana_corte TEXT, student_id TEXT, course_id TEXT, institucion TEXT, grado TEXT, nota REAL
+);
+CREATE INDEX IF NOT EXISTS ix_notas ON notas (project_id, semana_corte);
+CREATE TABLE IF NOT EXISTS marcas_agua (
+    project_id TEXT, agregado TEXT, hasta TEXT, actualizado TEXT,
+    PRIMARY KEY (project_id, agregado)
+);
+"""
+
+
+def _sin_punto_y_coma(sql: str) -> str:
+    return sql.strip().rstrip(';').rstrip()
+
+
+def _lunes(fecha: date) -> date:
+    return fecha - timedelta(days=fecha.weekday())
+
+
+def _proyectos(projects_id) -> List[str]:
+    """'72', '72,73', 72 o [72, 73] -> lista de project_id como texto."""
+    if isinstance(projects_id, str):
+        return [p.strip() for p in projects_id.split(',') if p.strip()]
+    if isinstance(projects_id, (list, tuple, set)):
+        return [str(p) for p in projects_id]
+    return [str(projects_id)]
+
+
+def _filtro_proyectos(projects_id) -> tuple:
+    """Marcadores y parámetros para `project_id IN (...)`."""
+    proyectos = _proyectos(projects_id)
+    return ', '.join('?' * len(proyectos)), tuple(proyectos)
+
+
+def plantilla_delta(agregado: str) -> athena.QueryTemplate:
+    """
+    Registra (una sola vez) y retorna la plantilla incremental de un agregado.
+
+    La plantilla hereda los parámetros (incluido `:desde` si la base filtra por
+    fecha) y las tablas de staging (`{{nombre}}`) de la query base; las tablas se
+    indican al ejecutarla.
+    """
+    nombre = f"delta_{agregado}"
+    try:
+        return athena.get_query(nombre)
+    except KeyError:
+        pass
+
+    definicion = AGREGADOS[agregado]
+    plantilla_base = athena.get_query(definicion['base'])
+    if definicion['fecha'] is not None and 'desde' not in plantilla_base.params:
+        raise ValueError(f"La query '{plantilla_base.name}' debe filtrar por :desde (date) para '{agregado}'")
+
+    # Pocas filas por semana: get_query_results, con reutilización de resultados
+    return athena.register_query(
+        nombre,
+        definicion['sql'].format(base=_sin_punto_y_coma(plantilla_base.source)),
+        plantilla_base.params,
+        result_size='small'
+    )
+
+
+def _extractos_proyecto(nombres: List[str], valores: Dict[str, Any], tables: Optional[Dict[str, Any]],
+                        budget: Optional[athena.QueryBudget], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Tablas de staging para las plantillas delta de un proyecto.
+
+    Las que no vienen en `tables` se obtienen con stage_extract y la plantilla
+    registrada con ese nombre (p. ej. 'dim_matriculas'): si otra ejecución del
+    mismo proyecto ya la materializó y no venció, se reutiliza.
+    """
+    tablas = dict(tables or {})
+    destino = {k: v for k, v in kwargs.items() if k in ('region', 'bucket')}
+    for nombre in nombres:
+        if nombre in tablas:
+            continue
+        plantilla = athena.get_query(nombre)
+        tablas[nombre] = athena.stage_extract(plantilla, {p: valores.get(p) for p in plantilla.params},
+                                              budget=budget, tables=tablas, **destino)
+    return tablas
+
+
+class AlmacenAgregados:
+    """
+    Agregados por proyecto persistidos en SQLite, actualizados por delta.
+
+    Para cada proyecto y agregado se guarda una marca de agua (fecha hasta la que
+    se agregó). En cada actualización solo se consulta desde el lunes de esa
+    semana (menos `semanas_revision` semanas, para absorber datos cargados tarde),
+    se borran esas fechas del almacén y se insertan las filas nuevas. Las notas,
+    sin fecha, se vuelven a traer completas como foto de la semana.
+
+    Los lectores (asistencia_semanal, sesiones_por, ...) aceptan uno o varios
+    proyectos, en el mismo formato que actualizar, y combinan sus datos; con
+    ellos se arman las secciones de asistencia, cancelaciones, calificaciones y
+    campus sin traer las filas del histórico.
+
+    Ejemplo:
+        >>> almacen = AlmacenAgregados()
+        >>> almacen.actualizar('72')
+        >>> almacen.asistencia_semanal('72')
+    """
+
+    def __init__(self, ruta: str = 'agregados_incrementales.sqlite', semanas_revision: int = 1):
+        self.ruta = ruta
+        self.semanas_revision = semanas_revision
+        self._lock = threading.Lock()
+        with self._conectar() as con:
+            if con.execute("PRAGMA user_version").fetchone()[0] != VERSION_ESQUEMA:
+                # Almacén de otra versión: se descarta y la próxima actualización trae todo
+                con.executescript(_BORRAR_ESQUEMA)
+                con.execute(f"PRAGMA user_version = {VERSION_ESQUEMA}")
+            con.executescript(_ESQUEMA)
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def marca_agua(self, project_id: str, agregado: str) -> Optional[date]:
+        """Fecha hasta la que el agregado está al día (None si nunca se calculó)."""
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT hasta FROM marcas_agua WHERE project_id = ? AND agregado = ?",
+                (str(project_id), agregado)
+            ).fetchone()
+        return date.fromisoformat(fila[0]) if fila else None
+
+    def _desde(self, project_id: str, agregado: str) -> date:
+        marca = self.marca_agua(project_id, agregado)
+        if marca is None:
+            return FECHA_INICIAL
+        return max(FECHA_INICIAL, _lunes(marca) - timedelta(weeks=self.semanas_revision))
+
+    def actualizar(self, projects_id, var_ie=None, agregados: Optional[List[str]] = None,
+                   budget: Optional[athena.QueryBudget] = None, tables: Optional[Dict[str, Any]] = None,
+                   **kwargs: Any) -> Dict[str, Dict[str, int]]:
+        """
+        Trae de Athena solo las fechas nuevas de cada agregado y las incorpora al almacén.
+
+        Args:
+            projects_id: Proyecto o lista de proyectos ('72', '72,73' o [72, 73]).
+            var_ie: Filtro opcional de institución (mismo formato que en el notebook).
+            agregados: Subconjunto de agregados a actualizar (por defecto todos).
+            budget: Budget de escaneo compartido con el resto del informe.
+            tables: Tablas de staging ya materializadas para estos proyectos (p. ej.
+                {'dim_matriculas': extracto} del informe). Solo se reutilizan al
+                actualizar un único proyecto; las que falten, o con varios
+                proyectos, se obtienen por proyecto con athena.stage_extract.
+            **kwargs: Se pasan a athena.run_query_template (region, bucket, ...).
+
+        Returns:
+            dict: {project_id: {agregado: filas_actualizadas}}
+        """
+        proyectos = _proyectos(projects_id)
+        agregados = agregados or list(AGREGADOS)
+
+        plantillas = {agregado: plantilla_delta(agregado) for agregado in agregados}
+        necesarias = sorted({tabla for plantilla in plantillas.values() for tabla in plantilla.tables})
+        compartidas = tables if len(proyectos) == 1 else None
+
+        resumen = {}
+        hoy = date.today()
+        for project_id in proyectos:
+            resumen[project_id] = {}
+            base = {'projects_id': project_id, 'var_ie': var_ie}
+            tablas = _extractos_proyecto(necesarias, base, compartidas, budget, kwargs)
+            for agregado, plantilla in plantillas.items():
+                valores = dict(base)
+                if AGREGADOS[agregado]['fecha'] is not None:
+                    valores['desde'] = self._desde(project_id, agregado)
+                df = athena.run_query_template(
+                    plantilla, {p: valores.get(p) for p in plantilla.params}, budget=budget,
+                    tables=tablas, **kwargs
+                )
+                resumen[project_id][agregado] = self._guardar(project_id, agregado, df, valores, hoy)
+        return resumen
+
+    def _guardar(self, project_id: str, agregado: str, df: pd.DataFrame, valores: Dict[str, Any],
+                 hoy: date) -> int:
+        project_id = str(project_id)
+        definicion = AGREGADOS[agregado]
+        tabla = definicion['tabla']
+        columnas = definicion['columnas']
+        if definicion['fecha'] is None:
+            borrar = (f"DELETE FROM {tabla} WHERE project_id = ? AND semana_corte = ?",
+                      (project_id, _lunes(hoy).isoformat()))
+            prefijo = [project_id, _lunes(hoy).isoformat()]
+        else:
+            borrar = (f"DELETE FROM {tabla} WHERE project_id = ? AND {definicion['fecha']} >= ?",
+                      (project_id, valores['desde'].isoformat()))
+            prefijo = [project_id]
+
+        filas = []
+        if not df.empty:
+            df = df[columnas].copy()
+            for col in ('semana', 'fecha'):
+                if col in df:
+                    df[col] = pd.to_datetime(df[col], format='ISO8601').dt.strftime('%Y-%m-%d')
+            # get_query_results trae todo como texto
+            for col in definicion.get('numericas', []):
+                df[col] = pd.to_numeric(df[col])
+            # NULL de SQLite para los faltantes (pandas/Arrow los traen como NaN o NA)
+            df = df.astype(object).where(df.notna(), None)
+            filas = [prefijo + list(fila) for fila in df.itertuples(index=False, name=None)]
+
+        marcadores = ', '.join('?' * (len(columnas) + len(prefijo)))
+        with self._lock, self._conectar() as con:
+            con.execute(*borrar)
+            con.executemany(f"INSERT OR REPLACE INTO {tabla} VALUES ({marcadores})", filas)
+            con.execute(
+                "INSERT OR REPLACE INTO marcas_agua VALUES (?, ?, ?, datetime('now'))",
+                (project_id, agregado, hoy.isoformat())
+            )
+        return len(filas)
+
+    def _leer(self, sql: str, params: tuple) -> pd.DataFrame:
+        # Mismos tipos que los resultados de Athena (ver athena.set_result_dtype_backend)
+        kwargs = {'dtype_backend': 'pyarrow'} if athena.result_dtype_backend() == 'pyarrow' else {}
+        with self._conectar() as con:
+            return pd.read_sql_query(sql, con, params=params, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Asistencia
+    # ------------------------------------------------------------------
+
+    def asistencia_semanal(self, project_id, tipo: str = 'Alumno') -> pd.DataFrame:
+        """
+        % de asistencia por semana (A, T y J cuentan como asistencia).
+        """
+        marcas, proyectos = _filtro_proyectos(project_id)
+        df = self._leer(
+            f"""
+            SELECT semana,
+                   SUM(registros) AS Total_registros,
+                   SUM(CASE WHEN estado IN ('A', 'T', 'J') THEN registros ELSE 0 END) AS Asistencias
+            FROM asistencia_semanal
+            WHERE project_id IN ({marcas}) AND tipo = ?
+            GROUP BY semana ORDER BY semana
+            """,
+            proyectos + (tipo,)
+        )
+        df['% Asistencia'] = round(df['Asistencias'] / df['Total_registros'] * 100, 1)
+        df['% Falta'] = round(100 - df['% Asistencia'], 1)
+        return df
+
+    def asistencia_por(self, project_id, agrupacion: Optional[str] = None, tipo: str = 'Alumno') -> pd.DataFrame:
+        """
+        % de asistencia y de falta en toda la vida del proyecto.
+
+        Args:
+            agrupacion: None (una fila con el total), 'institucion' o 'grado'; los
+                registros sin ese dato no se incluyen en el desglose.
+        """
+        if agrupacion not in (None, 'institucion', 'grado'):
+            raise ValueError(f"Agrupación no soportada: {agrupacion!r}")
+        marcas, proyectos = _filtro_proyectos(project_id)
+        columna = f"{agrupacion}, " if agrupacion else ''
+        filtro = f"AND {agrupacion} IS NOT NULL" if agrupacion else ''
+        df = self._leer(
+            f"""
+            SELECT {columna}
+                   SUM(registros) AS Total_registros,
+                   SUM(CASE WHEN estado IN ('A', 'T', 'J') THEN registros ELSE 0 END) AS Asistencias
+            FROM asistencia_semanal
+            WHERE project_id IN ({marcas}) AND tipo = ? {filtro}
+            {f'GROUP BY {agrupacion}' if agrupacion else ''}
+            """,
+            proyectos + (tipo,)
+        )
+        if agrupacion == 'grado':
+            df['grado'] = df['grado'].astype(int)
+        df['% Asistencia'] = round(df['Asistencias'] / df['Total_registros'] * 100, 1)
+        df['% Falta'] = round(100 - df['% Asistencia'], 1)
+        return df.drop(columns=['Total_registros', 'Asistencias'])
+
+    def promedio_asistentes_por_salon(self, project_id) -> float:
+        """Promedio por salón de alumnos distintos con al menos una asistencia ('A')."""
+        marcas, proyectos = _filtro_proyectos(project_id)
+        return float(self._leer(
+            f"""
+            SELECT AVG(alumnos) AS promedio FROM (
+                SELECT room_id, COUNT(DISTINCT student_id) AS alumnos
+                FROM asistentes_salon
+                WHERE project_id IN ({marcas})
+                GROUP BY room_id
+            )
+            """,
+            proyectos
+        )['promedio'].iloc[0] or 0)
+
+    # ------------------------------------------------------------------
+    # Sesiones y cancelaciones
+    # ------------------------------------------------------------------
+
+    def sesiones_por(self, project_id, agrupacion: Optional[str] = None,
+                     hasta: Optional[date] = None) -> pd.DataFrame:
+        """
+        Sesiones distintas programadas y dictadas (fecha <= hasta, por defecto hoy)
+        y canceladas (state = 'false', de cualquier fecha).
+
+        Args:
+            agrupacion: None (una fila con el total), 'project_id', 'institucion',
+                'grado', 'mes' (YYYY-MM) o 'semana' (lunes de la semana).
+        """
+        expresiones = {
+            None: None,
+            'project_id': 'project_id',
+            'institucion': 'institucion',
+            'grado': 'grado',
+            'mes': "strftime('%Y-%m', fecha)",
+            'semana': "date(fecha, '-6 days', 'weekday 1')",
+        }
+        if agrupacion not in expresiones:
+            raise ValueError(f"Agrupación no soportada: {agrupacion!r}")
+        marcas, proyectos = _filtro_proyectos(project_id)
+        hasta = (hasta or date.today()).isoformat()
+        expresion = expresiones[agrupacion]
+        return self._leer(
+            f"""
+            SELECT {f'{expresion} AS {agrupacion},' if expresion else ''}
+                   COUNT(DISTINCT CASE WHEN fecha <= ? THEN sesion_id END) AS sesiones_programadas,
+                   COUNT(DISTINCT CASE WHEN estado = 'false' THEN sesion_id END) AS sesiones_canceladas,
+                   COUNT(DISTINCT CASE WHEN estado = 'true' AND fecha <= ? THEN sesion_id END) AS sesiones_dictadas
+            FROM sesiones
+            WHERE project_id IN ({marcas})
+            {f'GROUP BY 1 HAVING sesiones_programadas + sesiones_canceladas > 0 ORDER BY 1' if expresion else ''}
+            """,
+            (hasta, hasta) + proyectos
+        )
+
+    def motivos_cancelacion(self, project_id, agrupacion: Optional[str] = None) -> pd.DataFrame:
+        """
+        Sesiones canceladas distintas por motivo en toda la vida del proyecto,
+        opcionalmente por 'institucion' o 'grado'.
+        """
+        if agrupacion not in (None, 'institucion', 'grado'):
+            raise ValueError(f"Agrupación no soportada: {agrupacion!r}")
+        marcas, proyectos = _filtro_proyectos(project_id)
+        columna = f"{agrupacion}, " if agrupacion else ''
+        return self._leer(
+            f"""
+            SELECT {columna}motivo, COUNT(DISTINCT sesion_id) AS sesiones
+            FROM sesiones
+            WHERE project_id IN ({marcas}) AND estado = 'false'
+            GROUP BY {columna}motivo ORDER BY sesiones DESC
+            """,
+            proyectos
+        )
+
+    # ------------------------------------------------------------------
+    # Campus
+    # ------------------------------------------------------------------
+
+    def campus_dia_hora(self, project_id) -> pd.DataFrame:
+        """Interacciones en campus por día de la semana (1 = lunes) y hora local."""
+        marcas, proyectos = _filtro_proyectos(project_id)
+        return self._leer(
+            f"""
+            SELECT dia_semana, hora, SUM(interacciones) AS interacciones
+            FROM campus_dia_hora
+            WHERE project_id IN ({marcas})
+            GROUP BY dia_semana, hora ORDER BY dia_semana, hora
+            """,
+            proyectos
+        )
+
+    def alumnos_campus_por_mes(self, project_id) -> pd.DataFrame:
+        """Alumnos distintos con alguna interacción en campus por mes (YYYY-MM, hora local)."""
+        marcas, proyectos = _filtro_proyectos(project_id)
+        return self._leer(
+            f"""
+            SELECT mes, COUNT(DISTINCT moodle_id) AS alumnos
+            FROM campus_alumnos
+            WHERE project_id IN ({marcas})
+            GROUP BY mes ORDER BY mes
+            """,
+            proyectos
+        )
+
+    def alumnos_campus(self, project_id) -> int:
+        """Alumnos distintos con alguna interacción en campus en toda la vida del proyecto."""
+        marcas, proyectos = _filtro_proyectos(project_id)
+        return int(self._leer(
+            f"SELECT COUNT(DISTINCT moodle_id) AS alumnos FROM campus_alumnos WHERE project_id IN ({marcas})",
+            proyectos
+        )['alumnos'].iloc[0])
+
+    # ------------------------------------------------------------------
+    # Notas
+    # ------------------------------------------------------------------
+
+    def notas(self, project_id, semana_corte: Optional[str] = None) -> pd.DataFrame:
+        """
+        Nota final por alumno y curso de la última foto de cada proyecto (o de la
+        semana de corte indicada), con las columnas de la query calificaciones.
+        """
+        marcas, proyectos = _filtro_proyectos(project_id)
+        if semana_corte is None:
+            filtro = "semana_corte = (SELECT MAX(semana_corte) FROM notas m WHERE m.project_id = notas.project_id)"
+            params = proyectos
+        else:
+            filtro, params = "semana_corte = ?", proyectos + (semana_corte,)
+        return self._leer(
+            f"""
+            SELECT project_id, student_id, course_id AS moodle_course_id, institucion AS institution,
+                   grado AS grade, nota AS nota_final_ponderada
+            FROM notas
+            WHERE project_id IN ({marcas}) AND {filtro}
+            """,
+            params
+        )
+
+    def histograma_notas(self, project_id, semana_corte: Optional[str] = None) -> pd.DataFrame:
+        """Alumnos distintos por rango de nota final (de 5 en 5) de la última foto."""
+        df = self.notas(project_id, semana_corte)
+        inicio = (df['nota_final_ponderada'] // 5 * 5).clip(upper=95)
+        rango = (inicio.astype('Int64').astype(str) + '-' + (inicio + 4).clip(upper=100).astype('Int64').astype(str))
+        rango = rango.where(inicio < 95, '95-100').where(df['nota_final_ponderada'].notna(), 'Sin nota')
+        return (df.assign(rango=rango).groupby('rango')['student_id'].nunique()
+                .rename('alumnos').reset_index())
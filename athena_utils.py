@@ -1,124 +1,1172 @@
-import boto3
-import pandas as pd
+from __future__ import annotations
+
 import time
 import io
+import os
+import re
+import csv
+import json
+import atexit
+import random
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: el gobernador limita solo dentro del proceso
+    fcntl = None
+
+from importacion_diferida import modulo_diferido
+
+# boto3, pandas y pyarrow se importan en el primer uso (ver importacion_diferida)
+boto3 = modulo_diferido('boto3')
+pd = modulo_diferido('pandas')
+pa = modulo_diferido('pyarrow')
+pc = modulo_diferido('pyarrow.compute')
+pq = modulo_diferido('pyarrow.parquet')
+botocore_exceptions = modulo_diferido('botocore.exceptions')
 
 
-def run_athena_query(query: str, name: str = '', region: str = 'us-east-1', bucket: str = 'data-lake-athena-querys') -> pd.DataFrame:
+# Prefijo S3 donde run_athena_query deja los resultados CTAS temporales
+TEMP_PREFIX = 'python/temporales/'
+TEMP_TABLE_PATTERN = re.compile(r'^python_table_.*_(\d+)$')
+# Extractos de staging reutilizables: nombre estable, vencen por antigüedad (ver stage_extract)
+STAGE_TABLE_PATTERN = re.compile(r'^python_table_stage_.*_h[0-9a-f]{8}$')
+
+
+class AthenaJanitor:
     """
-    Ejecuta una consulta en Athena, guarda el resultado en Parquet en S3, lo carga en un DataFrame y limpia los recursos.
+    Limpia en segundo plano las tablas CTAS temporales y sus prefijos en S3.
 
-    Si la consulta no devuelve filas, retorna un DataFrame vacío.
-    En caso de error, asegura la eliminación de recursos (S3 y tabla) antes de propagar la excepción.
+    Las tareas se encolan con enqueue() y un hilo daemon las procesa en lotes:
+    los objetos S3 se borran con delete_objects (hasta 1000 claves por llamada) y
+    los DROP TABLE de un lote se lanzan juntos y se esperan con una sola ronda
+    de batch_get_query_execution. Las tareas repetidas se descartan; el registro
+    de tareas ya eliminadas guarda solo las últimas max_recordados. Las que
+    fallan se reencolan hasta max_intentos veces y luego quedan sin registrar,
+    de modo que un enqueue o sweep_orphans posterior las vuelve a intentar.
+    """
+
+    def __init__(self, region: str = 'us-east-1', database: str = 'datalake',
+                 batch_size: int = 25, poll_interval: float = 1.0,
+                 max_recordados: int = 10000, max_intentos: int = 3):
+        self.region = region
+        self.database = database
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_recordados = max_recordados
+        self.max_intentos = max_intentos
+
+        self._athena = boto3.client('athena', region_name=region)
+        self._s3 = boto3.client('s3', region_name=region)
+
+        self._cond = threading.Condition()
+        self._prefijos: Dict[Tuple[str, str], None] = {}
+        self._tablas: Dict[str, str] = {}
+        self._procesados: OrderedDict = OrderedDict()
+        self._intentos: Dict[tuple, int] = {}
+        self._en_curso = 0
+        self._hilo: Optional[threading.Thread] = None
+
+    def enqueue(self, bucket: str, s3_prefix: Optional[str] = None,
+                table_name: Optional[str] = None, force: bool = False) -> None:
+        """
+        Encola un prefijo S3 y/o una tabla temporal para su eliminación.
+
+        Args:
+            bucket (str): Bucket donde viven los archivos y el log de Athena.
+            s3_prefix (str): Prefijo S3 a vaciar (opcional).
+            table_name (str): Tabla de Athena a eliminar (opcional).
+            force (bool): Encolar aunque ya se haya eliminado antes (recursos con
+                nombre estable, como los extractos de staging, se vuelven a crear).
+        """
+        with self._cond:
+            if s3_prefix and (force or ('s3', bucket, s3_prefix) not in self._procesados):
+                self._prefijos[(bucket, s3_prefix)] = None
+            if table_name and (force or ('table', table_name) not in self._procesados):
+                self._tablas[table_name] = bucket
+            self._iniciar_hilo()
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que la cola quede vacía.
+
+        Returns:
+            bool: True si no quedan tareas pendientes, False si venció el timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._prefijos and not self._tablas and self._en_curso == 0,
+                timeout=timeout
+            )
+
+    def pending(self) -> int:
+        """Cantidad de tareas pendientes o en curso."""
+        with self._cond:
+            return len(self._prefijos) + len(self._tablas) + self._en_curso
+
+    def _iniciar_hilo(self) -> None:
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._loop, name=f'athena-janitor-{self.region}', daemon=True)
+            self._hilo.start()
+
+    def _tomar_lote(self) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        prefijos = list(self._prefijos)[:self.batch_size]
+        for key in prefijos:
+            del self._prefijos[key]
+        tablas = list(self._tablas.items())[:self.batch_size]
+        for nombre, _ in tablas:
+            del self._tablas[nombre]
+        self._en_curso += len(prefijos) + len(tablas)
+        return prefijos, tablas
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._prefijos or self._tablas)
+                prefijos, tablas = self._tomar_lote()
+            eliminados: List[tuple] = []
+            try:
+                eliminados += [('s3', b, p) for b, p in self._eliminar_prefijos(prefijos)]
+                eliminados += [('table', t) for t in self._eliminar_tablas(tablas)]
+            except Exception as e:
+                # Un error inesperado no debe matar el hilo: lo no eliminado se reintenta
+                print(f"⚠️ Error en la limpieza de {len(prefijos)} prefijos y {len(tablas)} tablas: {e!r}")
+            finally:
+                with self._cond:
+                    self._recordar(eliminados)
+                    self._reintentar(prefijos, tablas, set(eliminados))
+                    self._en_curso -= len(prefijos) + len(tablas)
+                    self._cond.notify_all()
+
+    def _recordar(self, claves: List[tuple]) -> None:
+        # LRU acotado: descarta las tareas eliminadas más antiguas
+        for clave in claves:
+            self._intentos.pop(clave, None)
+            self._procesados[clave] = None
+            self._procesados.move_to_end(clave)
+        while len(self._procesados) > self.max_recordados:
+            self._procesados.popitem(last=False)
+
+    def _reintentar(self, prefijos: List[Tuple[str, str]], tablas: List[Tuple[str, str]],
+                    eliminados: set) -> None:
+        # Reencola lo que no se pudo eliminar; agotados los intentos queda sin registrar
+        fallidos = [(('s3', b, p), (b, p)) for b, p in prefijos if ('s3', b, p) not in eliminados]
+        fallidos += [(('table', t), (t, b)) for t, b in tablas if ('table', t) not in eliminados]
+        for clave, tarea in fallidos:
+            intentos = self._intentos.get(clave, 0) + 1
+            if intentos >= self.max_intentos:
+                self._intentos.pop(clave, None)
+                print(f"⚠️ No se pudo eliminar {clave[-1]} tras {intentos} intentos; queda para un próximo enqueue o sweep_orphans")
+                continue
+            self._intentos[clave] = intentos
+            if clave[0] == 's3':
+                self._prefijos[tarea] = None
+            else:
+                self._tablas[tarea[0]] = tarea[1]
+
+    def _eliminar_prefijos(self, prefijos: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Vacía los prefijos y retorna los que quedaron eliminados por completo."""
+        # Agrupar las claves por bucket para borrar en bloques de 1000
+        claves_por_bucket: Dict[str, List[Dict[str, str]]] = {}
+        prefijo_de: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        fallidos = set()
+        paginator = self._s3.get_paginator('list_objects_v2')
+        for bucket, prefix in prefijos:
+            try:
+                for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                    for obj in page.get('Contents', []):
+                        claves_por_bucket.setdefault(bucket, []).append({'Key': obj['Key']})
+                        prefijo_de[(bucket, obj['Key'])] = (bucket, prefix)
+            except botocore_exceptions.ClientError as e:
+                print(f"⚠️ Error al listar archivos de S3 ({prefix}): {e}")
+                fallidos.add((bucket, prefix))
+
+        for bucket, claves in claves_por_bucket.items():
+            for i in range(0, len(claves), 1000):
+                bloque = claves[i:i + 1000]
+                try:
+                    resp = self._s3.delete_objects(Bucket=bucket, Delete={'Objects': bloque, 'Quiet': True})
+                    errores = [err['Key'] for err in resp.get('Errors', [])]
+                except botocore_exceptions.ClientError as e:
+                    print(f"⚠️ Error al eliminar archivos de S3: {e}")
+                    errores = [c['Key'] for c in bloque]
+                fallidos.update(prefijo_de[(bucket, key)] for key in errores if (bucket, key) in prefijo_de)
+
+        return [key for key in prefijos if key not in fallidos]
+
+    def _eliminar_tablas(self, tablas: List[Tuple[str, str]]) -> List[str]:
+        """Lanza los DROP TABLE del lote, los espera juntos y retorna las tablas eliminadas."""
+        pendientes: Dict[str, str] = {}
+        for table_name, bucket in tablas:
+            try:
+                resp = get_governor().start(
+                    self._athena,
+                    QueryString=f"DROP TABLE IF EXISTS {table_name};",
+                    QueryExecutionContext={'Database': self.database},
+                    ResultConfiguration={'OutputLocation': f's3://{bucket}/'}
+                )
+                pendientes[resp['QueryExecutionId']] = table_name
+            except botocore_exceptions.ClientError as e:
+                print(f"⚠️ Error al eliminar la tabla {table_name} en Athena: {e}")
+
+        eliminadas = []
+        while pendientes:
+            ids = list(pendientes)[:50]
+            try:
+                resp = self._athena.batch_get_query_execution(QueryExecutionIds=ids)
+            except botocore_exceptions.ClientError as e:
+                print(f"⚠️ Error al consultar el estado de los DROP TABLE: {e}")
+                return eliminadas
+            for q in resp.get('QueryExecutions', []):
+                estado = q['Status']['State']
+                if estado == 'SUCCEEDED':
+                    eliminadas.append(pendientes.pop(q['QueryExecutionId']))
+                elif estado in ['FAILED', 'CANCELLED']:
+                    print(f"⚠️ DROP TABLE {pendientes.pop(q['QueryExecutionId'])} terminó en {estado}")
+            # Sin estado disponible: no se puede confirmar, se reintenta la tabla
+            for u in resp.get('UnprocessedQueryExecutionIds', []):
+                pendientes.pop(u['QueryExecutionId'], None)
+            if pendientes:
+                time.sleep(self.poll_interval)
+        return eliminadas
+
+    def sweep_orphans(self, bucket: str = 'data-lake-athena-querys', max_age_seconds: int = 6 * 3600) -> int:
+        """
+        Encola tablas python_table_* y prefijos temporales abandonados por ejecuciones caídas.
+
+        Solo se consideran huérfanos los recursos cuyo timestamp (sufijo del nombre)
+        es más antiguo que max_age_seconds, para no tocar consultas en curso. Los
+        extractos de staging reutilizables (nombre estable) se eliminan cuando su
+        fecha de creación en el catálogo supera esa antigüedad.
+
+        Returns:
+            int: Cantidad de recursos encolados.
+        """
+        limite = int(time.time()) - max_age_seconds
+        encolados = 0
+
+        glue = boto3.client('glue', region_name=self.region)
+        try:
+            for page in glue.get_paginator('get_tables').paginate(DatabaseName=self.database, Expression='python_table_.*'):
+                for tabla in page.get('TableList', []):
+                    match = TEMP_TABLE_PATTERN.match(tabla['Name'])
+                    if match:
+                        creada = int(match.group(1))
+                    elif STAGE_TABLE_PATTERN.match(tabla['Name']) and tabla.get('CreateTime'):
+                        creada = tabla['CreateTime'].timestamp()
+                    else:
+                        continue
+                    if creada >= limite:
+                        continue
+                    location = tabla.get('StorageDescriptor', {}).get('Location', '')
+                    loc_bucket, _, loc_prefix = location.replace('s3://', '', 1).partition('/')
+                    if loc_prefix.startswith(TEMP_PREFIX):
+                        self.enqueue(loc_bucket, loc_prefix if loc_prefix.endswith('/') else loc_prefix + '/',
+                                     tabla['Name'], force=True)
+                    else:
+                        self.enqueue(bucket, table_name=tabla['Name'], force=True)
+                    encolados += 1
+        except botocore_exceptions.ClientError as e:
+            print(f"⚠️ Error al listar tablas temporales en Glue: {e}")
+
+        try:
+            paginator = self._s3.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket, Prefix=TEMP_PREFIX, Delimiter='/'):
+                for cp in page.get('CommonPrefixes', []):
+                    match = re.search(r'_(\d+)/$', cp['Prefix'])
+                    if match and int(match.group(1)) < limite:
+                        self.enqueue(bucket, cp['Prefix'])
+                        encolados += 1
+        except botocore_exceptions.ClientError as e:
+            print(f"⚠️ Error al listar prefijos temporales en S3: {e}")
+
+        return encolados
+
+
+_janitors: Dict[str, AthenaJanitor] = {}
+_janitors_lock = threading.Lock()
+
+
+def get_janitor(region: str = 'us-east-1') -> AthenaJanitor:
+    """Retorna el janitor compartido de la región (se crea en el primer uso)."""
+    with _janitors_lock:
+        if region not in _janitors:
+            _janitors[region] = AthenaJanitor(region)
+        return _janitors[region]
+
+
+def flush_cleanup(timeout: Optional[float] = None) -> bool:
+    """
+    Espera a que todos los janitors terminen la limpieza pendiente.
+
+    Útil al final de un batch o de un notebook antes de cerrar el proceso.
+    """
+    with _janitors_lock:
+        janitors = list(_janitors.values())
+    return all(j.flush(timeout) for j in janitors)
+
+
+def sweep_orphan_resources(region: str = 'us-east-1', bucket: str = 'data-lake-athena-querys',
+                           max_age_seconds: int = 6 * 3600) -> int:
+    """Encola la limpieza de tablas y prefijos temporales huérfanos. Ver AthenaJanitor.sweep_orphans."""
+    return get_janitor(region).sweep_orphans(bucket, max_age_seconds)
+
+
+# Al salir del intérprete, dar un margen para vaciar la cola de limpieza
+atexit.register(flush_cleanup, 30)
+
+
+# ============================================================================
+# GOBERNADOR DE CONCURRENCIA (entre hilos y procesos)
+# ============================================================================
+
+QUERY_PRIORITIES = ('interactive', 'batch')
+THROTTLING_ERRORS = ('TooManyRequestsException', 'ThrottlingException')
+
+_query_priority: ContextVar[str] = ContextVar('athena_query_priority', default='interactive')
+
+
+@contextmanager
+def query_priority(priority: str) -> Iterator[None]:
+    """
+    Prioridad de las consultas lanzadas dentro del bloque (y de los hilos que
+    copien el contexto): 'interactive' (por defecto) o 'batch'.
+
+    Example:
+        >>> with query_priority('batch'):
+        ...     df = run_athena_query_auto(query, 'asistencias')
+    """
+    if priority not in QUERY_PRIORITIES:
+        raise ValueError(f"Prioridad desconocida: {priority!r}. Opciones: {QUERY_PRIORITIES}")
+    token = _query_priority.set(priority)
+    try:
+        yield
+    finally:
+        _query_priority.reset(token)
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """True si el error es un rechazo de Athena por cuota o tasa de llamadas."""
+    if not isinstance(error, botocore_exceptions.ClientError):
+        return False
+    code = error.response.get('Error', {}).get('Code', '')
+    return code in THROTTLING_ERRORS or 'Rate exceeded' in str(error)
+
+
+class AthenaGovernor:
+    """
+    Limita las consultas de Athena de todos los procesos de la máquina.
+
+    - Consultas activas: `max_active` ranuras, cada una un archivo de lock
+      (flock) en `lock_dir`. Una consulta ocupa su ranura desde el
+      start_query_execution hasta que termina; si el proceso muere, el sistema
+      operativo libera el lock.
+    - Inicios por segundo: token bucket (`starts_per_second`, ráfaga `burst`)
+      guardado en `lock_dir` y compartido por todos los procesos.
+    - Prioridad: `reserved_interactive` ranuras son solo para consultas
+      interactivas, y las batch no toman ranura mientras haya una interactiva
+      esperando.
+    - Throttling: TooManyRequestsException / ThrottlingException se reintentan
+      con espera exponencial con jitter, y vacían el bucket para que el resto
+      de los procesos también frene.
+
+    Sin fcntl (Windows) los límites aplican solo dentro del proceso.
+
+    Example:
+        >>> configure_governor(max_active=8, starts_per_second=4)
+        >>> with query_priority('batch'):
+        ...     dataframes = ejecutar_queries_paralelo(queries)
+    """
+
+    def __init__(self, max_active: int = 5, starts_per_second: float = 2.0, burst: int = 5,
+                 reserved_interactive: int = 1, lock_dir: Optional[str] = None,
+                 max_attempts: int = 8, base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 poll_seconds: float = 0.25):
+        if not 0 <= reserved_interactive < max_active:
+            raise ValueError("reserved_interactive debe estar entre 0 y max_active - 1")
+        self.max_active = max_active
+        self.starts_per_second = starts_per_second
+        self.burst = burst
+        self.reserved_interactive = reserved_interactive
+        self.lock_dir = lock_dir or os.path.join(tempfile.gettempdir(), 'athena_governor')
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_seconds = poll_seconds
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        # Locks en memoria cuando no hay fcntl: ruta -> [compartidos, exclusivo]
+        self._local_locks: Dict[str, List] = {}
+        self._local_guard = threading.Lock()
+
+    # ---- Locks -------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.lock_dir, name)
+
+    def _try_lock(self, path: str, shared: bool = False):
+        """Intenta tomar el lock sin bloquear; retorna un handle o None."""
+        if fcntl is not None:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return None
+            return fd
+
+        with self._local_guard:
+            estado = self._local_locks.setdefault(path, [0, False])
+            if estado[1] or (estado[0] and not shared):
+                return None
+            if shared:
+                estado[0] += 1
+            else:
+                estado[1] = True
+            return (path, shared)
+
+    def _unlock(self, handle) -> None:
+        if isinstance(handle, int):
+            os.close(handle)  # cerrar el descriptor libera el flock
+            return
+        path, shared = handle
+        with self._local_guard:
+            if shared:
+                self._local_locks[path][0] -= 1
+            else:
+                self._local_locks[path][1] = False
+
+    def _lock(self, path: str, shared: bool = False):
+        while True:
+            handle = self._try_lock(path, shared)
+            if handle is not None:
+                return handle
+            time.sleep(0.01)
+
+    # ---- Token bucket de inicios --------------------------------------------
+
+    def _update_bucket(self, drain: bool = False) -> float:
+        """
+        Recarga el bucket y consume un token si hay (o lo vacía con drain).
+
+        Returns:
+            Segundos a esperar antes de reintentar (0 si se consumió).
+        """
+        handle = self._lock(self._path('bucket.lock'))
+        try:
+            ruta = self._path('bucket.json')
+            ahora = time.time()
+            try:
+                with open(ruta) as f:
+                    estado = json.load(f)
+                tokens = estado['tokens'] + (ahora - estado['updated']) * self.starts_per_second
+            except (OSError, ValueError, KeyError):
+                tokens = self.burst
+            tokens = min(self.burst, tokens)
+
+            espera = 0.0
+            if drain:
+                tokens = min(tokens, 0.0)
+            elif tokens >= 1:
+                tokens -= 1
+            else:
+                espera = (1 - tokens) / self.starts_per_second
+
+            with open(ruta, 'w') as f:
+                json.dump({'tokens': tokens, 'updated': ahora}, f)
+            return espera
+        finally:
+            self._unlock(handle)
+
+    def acquire_start(self) -> None:
+        """Bloquea hasta que el bucket compartido permite un nuevo inicio de consulta."""
+        while True:
+            espera = self._update_bucket()
+            if not espera:
+                return
+            time.sleep(espera)
+
+    # ---- Ranuras de consultas activas ---------------------------------------
+
+    def _interactive_waiting(self) -> bool:
+        handle = self._try_lock(self._path('interactive.lock'))
+        if handle is None:
+            return True
+        self._unlock(handle)
+        return False
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None) -> Iterator[None]:
+        """Ocupa una ranura de consulta activa mientras dura el bloque."""
+        interactive = (priority or _query_priority.get()) == 'interactive'
+        candidatas = list(range(0 if interactive else self.reserved_interactive, self.max_active))
+        # Los interactivos en espera se anuncian con un lock compartido
+        aviso = self._lock(self._path('interactive.lock'), shared=True) if interactive else None
+        try:
+            handle = None
+            while handle is None:
+                if interactive or not self._interactive_waiting():
+                    random.shuffle(candidatas)
+                    for i in candidatas:
+                        handle = self._try_lock(self._path(f'slot_{i}.lock'))
+                        if handle is not None:
+                            break
+                if handle is None:
+                    time.sleep(self.poll_seconds * random.uniform(0.5, 1.5))
+        finally:
+            if aviso is not None:
+                self._unlock(aviso)
+
+        try:
+            yield
+        finally:
+            self._unlock(handle)
+
+    # ---- Inicio con reintentos ----------------------------------------------
+
+    def start(self, athena, **kwargs) -> dict:
+        """
+        start_query_execution respetando el bucket compartido y reintentando el
+        throttling con espera exponencial con jitter ("full jitter").
+        """
+        for intento in range(self.max_attempts):
+            self.acquire_start()
+            try:
+                return athena.start_query_execution(**kwargs)
+            except botocore_exceptions.ClientError as e:
+                if not is_throttling_error(e) or intento == self.max_attempts - 1:
+                    raise
+                self._update_bucket(drain=True)
+                espera = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** intento))
+                print(f"⏳ Athena limitó la consulta ({e.response['Error'].get('Code')}); "
+                      f"reintento {intento + 1}/{self.max_attempts - 1} en {espera:.1f}s")
+                time.sleep(espera)
+
+
+_governor: Optional[AthenaGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def configure_governor(**kwargs) -> AthenaGovernor:
+    """
+    Reemplaza la configuración del gobernador compartido (ver AthenaGovernor).
+
+    Todos los procesos que comparten `lock_dir` deberían usar el mismo `max_active`.
+    """
+    global _governor
+    with _governor_lock:
+        _governor = AthenaGovernor(**kwargs)
+        return _governor
+
+
+def get_governor() -> AthenaGovernor:
+    """Retorna el gobernador compartido (se crea con valores por defecto en el primer uso)."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = AthenaGovernor()
+        return _governor
+
+
+# ============================================================================
+# LECTURA DE RESULTADOS (tipos NumPy o Arrow)
+# ============================================================================
+
+RESULT_DTYPE_BACKENDS = ('numpy', 'pyarrow')
+
+# Con 'pyarrow', las columnas de texto con a lo sumo esta proporción de valores
+# distintos (estados, días, instituciones...) se codifican como diccionario
+DICTIONARY_MAX_RATIO = 0.5
+
+_result_dtype_backend = 'numpy'
+
+
+def set_result_dtype_backend(backend: str) -> None:
+    """
+    Tipos de los DataFrames que retornan las consultas (salvo que se indique
+    `dtype_backend` en la llamada):
+
+    - 'numpy' (por defecto): tipos NumPy, el texto como object.
+    - 'pyarrow': el texto como string[pyarrow], las columnas de texto repetitivas
+      como pd.ArrowDtype(dictionary) y el resto como pd.ArrowDtype. Ocupa varias
+      veces menos memoria y acelera groupby/nunique sobre claves de texto.
+    """
+    global _result_dtype_backend
+    _result_dtype_backend = _dtype_backend(backend)
+
+
+def result_dtype_backend() -> str:
+    """Backend de tipos configurado (ver set_result_dtype_backend)."""
+    return _result_dtype_backend
+
+
+def _dtype_backend(backend: Optional[str]) -> str:
+    backend = backend or _result_dtype_backend
+    if backend not in RESULT_DTYPE_BACKENDS:
+        raise ValueError(f"Backend de tipos desconocido: {backend!r}. Opciones: {RESULT_DTYPE_BACKENDS}")
+    return backend
+
+
+def _es_texto(tipo) -> bool:
+    return pa.types.is_string(tipo) or pa.types.is_large_string(tipo)
+
+
+def _arrow_types_mapper(tipo):
+    if _es_texto(tipo):
+        return pd.StringDtype('pyarrow')
+    return pd.ArrowDtype(tipo)
+
+
+def arrow_to_pandas(table: pa.Table, dtype_backend: Optional[str] = None) -> pd.DataFrame:
+    """
+    Convierte una tabla Arrow al backend de tipos indicado (o al configurado).
+
+    Con 'pyarrow' los datos no se copian a objetos de Python: las columnas de
+    texto con pocos valores distintos se codifican como diccionario.
+    """
+    if _dtype_backend(dtype_backend) == 'numpy':
+        return table.to_pandas()
+
+    for i, campo in enumerate(table.schema):
+        if _es_texto(campo.type) and table.num_rows:
+            columna = table.column(i)
+            if pc.count_distinct(columna).as_py() <= DICTIONARY_MAX_RATIO * table.num_rows:
+                table = table.set_column(i, campo.name, columna.dictionary_encode())
+    return table.to_pandas(types_mapper=_arrow_types_mapper)
+
+
+def _read_parquet_table(location: str) -> pa.Table:
+    # Mismo sistema de archivos que usa pandas (fsspec/s3fs) si está disponible
+    try:
+        import fsspec
+    except ImportError:
+        return pq.read_table(location)
+    fs, path = fsspec.core.url_to_fs(location)
+    return pq.read_table(path, filesystem=fs)
+
+
+def read_parquet_result(location: str, dtype_backend: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lee los Parquet que dejó una consulta en `location` (prefijo S3).
+
+    Si no hay archivos (la consulta no devolvió filas) retorna un DataFrame vacío.
+    """
+    try:
+        if _dtype_backend(dtype_backend) == 'numpy':
+            return pd.read_parquet(location, engine='pyarrow')
+        return arrow_to_pandas(_read_parquet_table(location), 'pyarrow')
+    except (FileNotFoundError, OSError, ValueError):
+        return pd.DataFrame()
+
+
+# ============================================================================
+# PLAN DE EJECUCIÓN, BUDGET DE BYTES E HISTORIAL DE COSTO POR QUERY
+# ============================================================================
+
+QUERY_HISTORY_FILE = 'historial_queries.csv'
+QUERY_HISTORY_COLUMNS = ['fecha_hora', 'name', 'method', 'query_execution_id',
+                         'data_scanned_bytes', 'engine_execution_ms', 'total_execution_ms']
+_history_lock = threading.Lock()
+
+_SIZE_UNITS = {'B': 1, 'kB': 1024, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4, 'PB': 1024 ** 5}
+_SCAN_NODE = re.compile(r'\b(?:TableScan|ScanFilter|ScanProject|ScanFilterProject)\[table = ([^,\]\s]+)')
+_JOIN_NODE = re.compile(r'\b(InnerJoin|LeftJoin|RightJoin|FullJoin|CrossJoin|SemiJoin|Join)\[')
+_ESTIMATE = re.compile(r'Estimates: \{rows: ([\d.,?]+) \(([\d.,?]+)\s*([kKMGTP]?B)?\)')
+_PHYSICAL_INPUT = re.compile(r'Physical input: ([\d.,]+)\s*([kKMGTP]?B)')
+
+
+class BudgetExceededError(Exception):
+    """La consulta superaría el budget de bytes escaneados por query o por informe."""
+
+
+def _parse_size(value: str, unit: Optional[str]) -> Optional[int]:
+    if not value or '?' in value:
+        return None
+    return int(float(value.replace(',', '')) * _SIZE_UNITS.get(unit or 'B', 1))
+
+
+def parse_query_plan(plan: str) -> Dict[str, Any]:
+    """
+    Extrae del texto de EXPLAIN / EXPLAIN ANALYZE las tablas escaneadas, la
+    estimación de bytes por scan y la estructura de joins.
+
+    Returns:
+        dict con las claves:
+            - plan: texto original
+            - scans: lista de {'table', 'estimated_bytes'} (None si Athena no tiene estadísticas)
+            - tables: tablas únicas escaneadas
+            - joins: conteo por tipo de join (InnerJoin, LeftJoin, SemiJoin, ...)
+            - replicated_joins: joins con distribución REPLICATED (broadcast)
+            - estimated_bytes: suma de las estimaciones conocidas
+            - estimate_complete: True si todos los scans tienen estimación
+            - physical_input_bytes: bytes leídos realmente (solo EXPLAIN ANALYZE)
+    """
+    scans: List[Dict[str, Any]] = []
+    joins: Counter = Counter()
+    replicated = 0
+    physical_input = None
+    scan_actual = None
+
+    for line in plan.splitlines():
+        scan = _SCAN_NODE.search(line)
+        if scan:
+            table = re.split(r'[:.]', scan.group(1))[-1]
+            scan_actual = {'table': table, 'estimated_bytes': None}
+            scans.append(scan_actual)
+            continue
+
+        join = _JOIN_NODE.search(line)
+        if join:
+            joins[join.group(1)] += 1
+            if 'REPLICATED' in line:
+                replicated += 1
+            scan_actual = None
+            continue
+
+        # La primera línea de estimaciones después de un scan corresponde a ese scan
+        estimate = _ESTIMATE.search(line)
+        if estimate and scan_actual is not None:
+            scan_actual['estimated_bytes'] = _parse_size(estimate.group(2), estimate.group(3))
+            scan_actual = None
+
+        physical = _PHYSICAL_INPUT.search(line)
+        if physical:
+            physical_input = (physical_input or 0) + _parse_size(physical.group(1), physical.group(2))
+
+    conocidos = [s['estimated_bytes'] for s in scans if s['estimated_bytes'] is not None]
+    return {
+        'plan': plan,
+        'scans': scans,
+        'tables': sorted({s['table'] for s in scans}),
+        'joins': dict(joins),
+        'replicated_joins': replicated,
+        'estimated_bytes': sum(conocidos),
+        'estimate_complete': len(conocidos) == len(scans),
+        'physical_input_bytes': physical_input,
+    }
+
+
+def explain_query(query: str, analyze: bool = False, region: str = 'us-east-1',
+                  bucket: str = 'data-lake-athena-querys', params: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Ejecuta EXPLAIN (o EXPLAIN ANALYZE) sobre la consulta y retorna el plan parseado.
+
+    EXPLAIN no escanea datos. EXPLAIN ANALYZE ejecuta la consulta completa (y se
+    cobra como tal), pero reporta bytes y filas reales por etapa.
+
+    Returns:
+        dict: Ver parse_query_plan.
     """
     athena = boto3.client('athena', region_name=region)
-    s3 = boto3.client('s3', region_name=region)
-    timestamp = int(time.time())
-    table_name = f"python_table_{name}_{timestamp}"
-    s3_prefix = f"python/temporales/{name}_{timestamp}/"
-    parquet_output_path = f's3://{bucket}/{s3_prefix}'
+    prefijo = 'EXPLAIN ANALYZE' if analyze else 'EXPLAIN (TYPE DISTRIBUTED)'
+    qid, _ = execute_query(athena, f"{prefijo} {query.strip().rstrip(';')}", f's3://{bucket}/temp/', params=params)
+
+    lineas = []
+    for page in athena.get_paginator('get_query_results').paginate(QueryExecutionId=qid):
+        for row in page['ResultSet']['Rows']:
+            lineas.extend(col.get('VarCharValue', '') for col in row['Data'])
+    if lineas and lineas[0].strip() == 'Query Plan':
+        lineas = lineas[1:]
+
+    return parse_query_plan('\n'.join(lineas))
+
+
+def record_query_stats(name: str, execution: dict, method: str = '',
+                       budget: Optional['QueryBudget'] = None) -> None:
+    """
+    Registra DataScannedInBytes y EngineExecutionTimeInMillis de una ejecución.
+
+    La fila se anexa a QUERY_HISTORY_FILE (sin reescribir el archivo) y, si se
+    indica, los bytes se descuentan del budget. Las consultas sin nombre no se
+    guardan en el historial.
+    """
+    stats = execution.get('Statistics', {})
+    scanned = int(stats.get('DataScannedInBytes', 0))
+
+    if budget is not None:
+        budget.record(name, scanned)
+    if not name:
+        return
+
+    fila = [
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        name,
+        method,
+        execution.get('QueryExecutionId', ''),
+        scanned,
+        int(stats.get('EngineExecutionTimeInMillis', 0)),
+        int(stats.get('TotalExecutionTimeInMillis', 0)),
+    ]
+    try:
+        with _history_lock:
+            nuevo = not os.path.exists(QUERY_HISTORY_FILE)
+            with open(QUERY_HISTORY_FILE, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                if nuevo:
+                    writer.writerow(QUERY_HISTORY_COLUMNS)
+                writer.writerow(fila)
+    except OSError as e:
+        print(f"⚠️ No se pudo registrar el historial de la query {name}: {e}")
+
+
+def query_history(name: Optional[str] = None) -> pd.DataFrame:
+    """Retorna el historial de ejecuciones (opcionalmente filtrado por nombre de query)."""
+    if not os.path.exists(QUERY_HISTORY_FILE):
+        return pd.DataFrame(columns=QUERY_HISTORY_COLUMNS)
+    df = pd.read_csv(QUERY_HISTORY_FILE, parse_dates=['fecha_hora'])
+    if name is not None:
+        df = df[df['name'] == name]
+    return df
+
+
+def detect_regressions(factor: float = 1.5, window: int = 5) -> pd.DataFrame:
+    """
+    Compara la última ejecución de cada query con la mediana de las `window` anteriores.
+
+    Returns:
+        DataFrame con las queries cuyo escaneo o tiempo de motor creció más de `factor` veces.
+    """
+    df = query_history()
+    filas = []
+    for (name, method), grupo in df.sort_values('fecha_hora').groupby(['name', 'method']):
+        if len(grupo) < 2:
+            continue
+        ultima = grupo.iloc[-1]
+        previas = grupo.iloc[-(window + 1):-1]
+        base_bytes = previas['data_scanned_bytes'].median()
+        base_ms = previas['engine_execution_ms'].median()
+        ratio_bytes = ultima['data_scanned_bytes'] / base_bytes if base_bytes else float('nan')
+        ratio_ms = ultima['engine_execution_ms'] / base_ms if base_ms else float('nan')
+        filas.append({
+            'name': name,
+            'method': method,
+            'data_scanned_bytes': ultima['data_scanned_bytes'],
+            'mediana_bytes': base_bytes,
+            'ratio_bytes': ratio_bytes,
+            'engine_execution_ms': ultima['engine_execution_ms'],
+            'mediana_ms': base_ms,
+            'ratio_ms': ratio_ms,
+        })
+
+    resultado = pd.DataFrame(filas)
+    if resultado.empty:
+        return resultado
+    return resultado[(resultado['ratio_bytes'] > factor) | (resultado['ratio_ms'] > factor)]
+
+
+class QueryBudget:
+    """
+    Límite de bytes escaneados por query y por informe, validado antes de ejecutar.
+
+    La estimación sale de EXPLAIN; si Athena no tiene estadísticas para alguna
+    tabla, se usa el máximo de las últimas ejecuciones registradas de esa query.
+    Un mismo budget puede compartirse entre las queries paralelas de un informe:
+    cada ejecución reserva su estimación hasta que se registra su escaneo real.
+
+    Ejemplo:
+        >>> budget = QueryBudget(max_bytes_per_query=10 * 1024**3, max_bytes_per_report=40 * 1024**3)
+        >>> df = run_athena_query_auto(query, 'uso_campus', budget=budget)
+        >>> budget.summary()
+    """
+
+    def __init__(self, max_bytes_per_query: Optional[int] = None, max_bytes_per_report: Optional[int] = None,
+                 use_history: bool = True, strict: bool = False):
+        """
+        Args:
+            max_bytes_per_query: Máximo estimado permitido para una sola query.
+            max_bytes_per_report: Máximo acumulado (escaneado + reservado) del informe.
+            use_history: Completar estimaciones desconocidas con el historial de la query.
+            strict: Si True, una query sin estimación posible se rechaza.
+        """
+        self.max_bytes_per_query = max_bytes_per_query
+        self.max_bytes_per_report = max_bytes_per_report
+        self.use_history = use_history
+        self.strict = strict
+        self.spent_bytes = 0
+        self.per_query: Dict[str, int] = {}
+        self._reserved: Dict[str, List[int]] = {}
+        self._plans: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, query: str, name: str = '', region: str = 'us-east-1',
+                 bucket: str = 'data-lake-athena-querys', params: Optional[List[str]] = None) -> Optional[int]:
+        """Estima los bytes a escanear (None si no hay forma de estimarlos)."""
+        clave = (query, tuple(params or ()))
+        plan = self._plans.get(clave)
+        if plan is None:
+            plan = explain_query(query, region=region, bucket=bucket, params=params)
+            self._plans[clave] = plan
+
+        if plan['scans'] and plan['estimate_complete']:
+            return plan['estimated_bytes']
+
+        if self.use_history and name:
+            historial = query_history(name)
+            if not historial.empty:
+                return int(historial['data_scanned_bytes'].tail(5).max())
+        return None
 
-    ctas_query = f"""
+    def guard(self, query: str, name: str = '', region: str = 'us-east-1',
+              bucket: str = 'data-lake-athena-querys', params: Optional[List[str]] = None) -> Optional[int]:
+        """
+        Valida una ejecución contra el budget y reserva su estimación.
+
+        Se llama una vez por cada ejecución: si la misma query corre dos veces,
+        reserva dos veces (el plan de EXPLAIN sí se reutiliza). Cada reserva se
+        libera con el record() de esa ejecución.
+
+        Raises:
+            BudgetExceededError: Si la estimación supera algún límite.
+        """
+        estimado = self.estimate(query, name, region, bucket, params)
+        etiqueta = name or 'query sin nombre'
+
+        if estimado is None:
+            if self.strict:
+                raise BudgetExceededError(f"No se pudo estimar el escaneo de '{etiqueta}' y el budget es estricto")
+            print(f"⚠️ Sin estimación de escaneo para '{etiqueta}'; se ejecuta sin validar budget")
+            with self._lock:
+                self._reserved.setdefault(name, []).append(0)
+            return None
+
+        with self._lock:
+            if self.max_bytes_per_query is not None and estimado > self.max_bytes_per_query:
+                raise BudgetExceededError(
+                    f"'{etiqueta}' escanearía ~{estimado / 1024 ** 3:.2f} GB "
+                    f"(límite por query: {self.max_bytes_per_query / 1024 ** 3:.2f} GB)"
+                )
+            comprometido = self.spent_bytes + sum(sum(r) for r in self._reserved.values())
+            if self.max_bytes_per_report is not None and comprometido + estimado > self.max_bytes_per_report:
+                raise BudgetExceededError(
+                    f"'{etiqueta}' llevaría el informe a ~{(comprometido + estimado) / 1024 ** 3:.2f} GB "
+                    f"(límite por informe: {self.max_bytes_per_report / 1024 ** 3:.2f} GB)"
+                )
+            self._reserved.setdefault(name, []).append(estimado)
+        return estimado
+
+    def record(self, name: str, scanned_bytes: int) -> None:
+        """Descuenta el escaneo real y libera una reserva de la query."""
+        with self._lock:
+            reservas = self._reserved.get(name)
+            if reservas:
+                reservas.pop(0)
+                if not reservas:
+                    del self._reserved[name]
+            self.spent_bytes += scanned_bytes
+            self.per_query[name] = self.per_query.get(name, 0) + scanned_bytes
+
+    def summary(self) -> pd.DataFrame:
+        """Bytes escaneados por query en este budget."""
+        with self._lock:
+            df = pd.DataFrame(
+                [{'name': k, 'data_scanned_bytes': v} for k, v in self.per_query.items()],
+                columns=['name', 'data_scanned_bytes']
+            )
+        df['GB'] = (df['data_scanned_bytes'] / 1024 ** 3).round(3)
+        return df.sort_values('data_scanned_bytes', ascending=False)
+
+
+def start_query(athena, query: str, output_location: str, params: Optional[List[str]] = None,
+                reuse_max_age_minutes: Optional[int] = None, database: str = 'datalake') -> str:
+    """
+    Lanza una consulta y retorna su QueryExecutionId.
+
+    Args:
+        params: Valores (ya formateados como literales SQL) para los `?` de la consulta.
+        reuse_max_age_minutes: Si se indica, Athena puede devolver el resultado de una
+            ejecución idéntica (mismo texto y mismos parámetros) de hasta esa antigüedad.
+    """
+    kwargs = {
+        'QueryString': query,
+        'QueryExecutionContext': {'Database': database},
+        'ResultConfiguration': {'OutputLocation': output_location},
+    }
+    if params:
+        kwargs['ExecutionParameters'] = list(params)
+    if reuse_max_age_minutes:
+        kwargs['ResultReuseConfiguration'] = {
+            'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': int(reuse_max_age_minutes)}
+        }
+    return get_governor().start(athena, **kwargs)['QueryExecutionId']
+
+
+def wait_for_query(athena, qid: str, poll_seconds: float = 1) -> dict:
+    """
+    Espera a que termine una ejecución de Athena y retorna su QueryExecution.
+
+    Raises:
+        Exception: Si la consulta termina en FAILED o CANCELLED.
+    """
+    while True:
+        execution = athena.get_query_execution(QueryExecutionId=qid)['QueryExecution']
+        state = execution['Status']['State']
+        if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+            break
+        time.sleep(poll_seconds)
+
+    if state != 'SUCCEEDED':
+        raise Exception(execution['Status'].get('StateChangeReason'))
+    return execution
+
+
+def execute_query(athena, query: str, output_location: str, params: Optional[List[str]] = None,
+                  reuse_max_age_minutes: Optional[int] = None, poll_seconds: float = 1,
+                  priority: Optional[str] = None) -> Tuple[str, dict]:
+    """
+    Lanza la consulta y espera a que termine ocupando una ranura del gobernador
+    (ver AthenaGovernor), así el total de consultas activas de la máquina no
+    supera la cuota.
+
+    Returns:
+        (QueryExecutionId, QueryExecution)
+    """
+    with get_governor().slot(priority):
+        qid = start_query(athena, query, output_location, params=params,
+                          reuse_max_age_minutes=reuse_max_age_minutes)
+        return qid, wait_for_query(athena, qid, poll_seconds=poll_seconds)
+
+
+def _temp_label(name: str) -> str:
+    """Sufijo único para temporales ('<name>_<token>_<timestamp>', reconocible por sweep_orphans)."""
+    return f"{name}_{uuid.uuid4().hex[:8]}_{int(time.time())}"
+
+
+def _ctas_sql(table_name: str, location: str, query: str) -> str:
+    """CTAS que deja el resultado de la consulta en Parquet (Snappy) en `location`."""
+    return f"""
     CREATE TABLE {table_name}
     WITH (
       format = 'PARQUET',
-      external_location = '{parquet_output_path}',
+      external_location = '{location}',
       write_compression = 'SNAPPY'
     ) AS
     {query}
     """
 
-    # Helper to clean up resources
-    def clean_up():
-        # Eliminar archivos Parquet de S3
-        try:
-            objs = s3.list_objects_v2(Bucket=bucket, Prefix=s3_prefix)
-            if objs.get('Contents'):
-                delete_keys = [{'Key': obj['Key']} for obj in objs['Contents']]
-                s3.delete_objects(Bucket=bucket, Delete={'Objects': delete_keys})
-        except ClientError as e:
-            print(f"⚠️ Error al eliminar archivos de S3: {e}")
-
-        # Eliminar la tabla en Athena
-        try:
-            drop_query = f"DROP TABLE IF EXISTS {table_name};"
-            resp = athena.start_query_execution(
-                QueryString=drop_query,
-                QueryExecutionContext={'Database': 'datalake'},
-                ResultConfiguration={'OutputLocation': f's3://{bucket}/'}
-            )
-            drop_qid = resp['QueryExecutionId']
-            # Esperar a que termine el DROP
-            while True:
-                st = athena.get_query_execution(QueryExecutionId=drop_qid)['QueryExecution']['Status']['State']
-                if st in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                    break
-                time.sleep(1)
-        except ClientError as e:
-            print(f"⚠️ Error al eliminar la tabla en Athena: {e}")
+
+def run_athena_query(query: str, name: str = '', region: str = 'us-east-1', bucket: str = 'data-lake-athena-querys',
+                     budget: Optional['QueryBudget'] = None, params: Optional[List[str]] = None,
+                     dtype_backend: Optional[str] = None) -> pd.DataFrame:
+    """
+    Ejecuta una consulta en Athena, guarda el resultado en Parquet en S3, lo carga en un DataFrame y limpia los recursos.
+
+    Si la consulta no devuelve filas, retorna un DataFrame vacío.
+    Tanto en éxito como en error, la tabla temporal y su prefijo S3 se encolan en el
+    janitor de la región, que los elimina en lote fuera del camino crítico.
+    Si se indica un budget, se valida antes de ejecutar y se descuenta lo escaneado.
+    Los `params` se envían como ExecutionParameters (Athena no reutiliza resultados de CTAS).
+    Los tipos del DataFrame siguen `dtype_backend` (ver set_result_dtype_backend).
+    """
+    if budget is not None:
+        budget.guard(query, name, region=region, bucket=bucket, params=params)
+
+    athena = boto3.client('athena', region_name=region)
+    etiqueta = _temp_label(name)
+    table_name = f"python_table_{etiqueta}"
+    s3_prefix = f"{TEMP_PREFIX}{etiqueta}/"
+    parquet_output_path = f's3://{bucket}/{s3_prefix}'
+
+    ctas_query = _ctas_sql(table_name, parquet_output_path, query)
 
     # Ejecutar CTAS y procesar resultados
     try:
-        resp = athena.start_query_execution(
-            QueryString=ctas_query,
-            QueryExecutionContext={'Database': 'datalake'},
-            ResultConfiguration={'OutputLocation': f's3://{bucket}/'}
-        )
-        qid = resp['QueryExecutionId']
-        # Esperar a que termine la ejecución
-        while True:
-            status = athena.get_query_execution(QueryExecutionId=qid)['QueryExecution']['Status']['State']
-            if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                break
-            time.sleep(2)
+        _, execution = execute_query(athena, ctas_query, f's3://{bucket}/', params=params, poll_seconds=2)
+        record_query_stats(name, execution, method='ctas', budget=budget)
 
-        if status != 'SUCCEEDED':
-            raise Exception(athena.get_query_execution(QueryExecutionId=qid)['QueryExecution']['Status'].get('StateChangeReason'))
+        # Leer los Parquet; si no existen, devolver df vacío
+        return read_parquet_result(parquet_output_path, dtype_backend)
 
-        # Intentar leer los Parquet; si no existen, devolver df vacío
-        try:
-            df = pd.read_parquet(parquet_output_path, engine='pyarrow')
-        except (FileNotFoundError, OSError, ValueError):
-            df = pd.DataFrame()
+    finally:
+        # La limpieza (S3 + DROP TABLE) se delega al janitor en segundo plano,
+        # así la entrega del resultado no incluye la latencia del DROP.
+        get_janitor(region).enqueue(bucket, s3_prefix, table_name)
 
-        return df
 
-    except Exception as e:
-        # En caso de error, limpiar recursos y propagar
-        clean_up()
-        raise
+LARGE_RESULT_MODES = ('unload', 'ctas')
+RESULT_SIZES = ('small', 'large', None)
+UNLOAD_COMPRESSIONS = ('SNAPPY', 'GZIP', 'ZSTD', 'LZ4', None)
+
+
+def _unload_sql(location: str, query: str, partitioned_by: Optional[List[str]] = None,
+                compression: Optional[str] = 'SNAPPY') -> str:
+    """UNLOAD de la consulta a Parquet en `location`."""
+    if compression not in UNLOAD_COMPRESSIONS:
+        raise ValueError(f"Compresión no soportada: {compression!r}. Opciones: {UNLOAD_COMPRESSIONS}")
+    propiedades = ["format = 'PARQUET'"]
+    if compression:
+        propiedades.append(f"compression = '{compression}'")
+    if partitioned_by:
+        propiedades.append("partitioned_by = ARRAY[" + ', '.join(f"'{col}'" for col in partitioned_by) + "]")
+    cuerpo = query.strip().rstrip(';')
+    return f"""
+    UNLOAD (
+    {cuerpo}
+    )
+    TO '{location}'
+    WITH ({', '.join(propiedades)})
+    """
+
+
+def run_athena_query_unload(query: str, name: str = '', region: str = 'us-east-1',
+                            bucket: str = 'data-lake-athena-querys', budget: Optional['QueryBudget'] = None,
+                            params: Optional[List[str]] = None, partitioned_by: Optional[List[str]] = None,
+                            compression: Optional[str] = 'SNAPPY',
+                            dtype_backend: Optional[str] = None) -> pd.DataFrame:
+    """
+    Ejecuta la consulta con UNLOAD a Parquet en un prefijo S3 único y lo carga en un DataFrame.
+
+    A diferencia de run_athena_query (CTAS) no crea tabla en el catálogo: no hay
+    DROP TABLE que lanzar y esperar, y la limpieza es solo borrar el prefijo (en
+    el janitor, fuera del camino crítico).
+
+    Args:
+        partitioned_by: Columnas de partición (deben ser las últimas del SELECT);
+            vuelven como columnas al leer el resultado.
+        compression: Compresión de los Parquet ('SNAPPY', 'GZIP', 'ZSTD', 'LZ4' o None).
+    """
+    if budget is not None:
+        budget.guard(query, name, region=region, bucket=bucket, params=params)
+
+    athena = boto3.client('athena', region_name=region)
+    s3_prefix = f"{TEMP_PREFIX}unload_{_temp_label(name)}/"
+    parquet_output_path = f's3://{bucket}/{s3_prefix}'
 
+    try:
+        _, execution = execute_query(athena, _unload_sql(parquet_output_path, query, partitioned_by, compression),
+                                     f's3://{bucket}/temp/', params=params, poll_seconds=2)
+        record_query_stats(name, execution, method='unload', budget=budget)
+        return read_parquet_result(parquet_output_path, dtype_backend)
     finally:
-        # Siempre limpiar al final si hubo éxito o excepción
-        clean_up()
+        get_janitor(region).enqueue(bucket, s3_prefix)
 
 
 def run_athena_query_small(query: str, region: str = 'us-east-1', 
-                           bucket: str = 'data-lake-athena-querys') -> pd.DataFrame:
+                           bucket: str = 'data-lake-athena-querys', name: str = '',
+                           budget: Optional['QueryBudget'] = None, params: Optional[List[str]] = None,
+                           reuse_max_age_minutes: Optional[int] = None,
+                           dtype_backend: Optional[str] = None) -> pd.DataFrame:
     """
     Ejecuta consulta en Athena y obtiene resultados directamente via API.
-    Ideal para datasets pequeños (<1000 filas).
+    Ideal para datasets pequeños (<1000 filas). Todas las columnas llegan como texto.
     """
+    if budget is not None:
+        budget.guard(query, name, region=region, bucket=bucket, params=params)
+
     athena = boto3.client('athena', region_name=region)
     
-    # Ejecutar query
-    resp = athena.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={'Database': 'datalake'},
-        ResultConfiguration={'OutputLocation': f's3://{bucket}/temp/'}
-    )
-    qid = resp['QueryExecutionId']
-    
-    # Esperar finalización
-    while True:
-        status = athena.get_query_execution(QueryExecutionId=qid)
-        state = status['QueryExecution']['Status']['State']
-        if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-            break
-        time.sleep(1)
-    
-    if state != 'SUCCEEDED':
-        raise Exception(status['QueryExecution']['Status'].get('StateChangeReason'))
+    # Ejecutar query y esperar finalización
+    qid, execution = execute_query(athena, query, f's3://{bucket}/temp/', params=params,
+                                   reuse_max_age_minutes=reuse_max_age_minutes)
+    record_query_stats(name, execution, method='small', budget=budget)
     
     # Obtener resultados paginados
     results = []
@@ -132,47 +1180,509 @@ def run_athena_query_small(query: str, region: str = 'us-east-1',
         return pd.DataFrame()
     
     # Crear DataFrame (primera fila son headers)
+    if _dtype_backend(dtype_backend) == 'pyarrow':
+        columnas = [pa.array([fila[i] for fila in results[1:]], pa.string()) for i in range(len(results[0]))]
+        return arrow_to_pandas(pa.Table.from_arrays(columnas, names=results[0]), 'pyarrow')
     df = pd.DataFrame(results[1:], columns=results[0])
     return df
 
+def estimate_scan_bytes(query: str, name: str = '', region: str = 'us-east-1',
+                        bucket: str = 'data-lake-athena-querys', params: Optional[List[str]] = None,
+                        budget: Optional['QueryBudget'] = None) -> Optional[int]:
+    """
+    Estima los bytes que escaneará la consulta sin ejecutarla.
+
+    Con budget se usa su estimación (EXPLAIN, y el historial si faltan
+    estadísticas), que queda cacheada para el guard posterior. Sin budget se
+    consulta primero el historial de la query (gratis) y si no hay, EXPLAIN.
+
+    Returns:
+        int | None: Bytes estimados, o None si no hay forma de estimarlos.
+    """
+    if budget is not None:
+        return budget.estimate(query, name, region, bucket, params)
+    if name:
+        historial = query_history(name)
+        if not historial.empty:
+            return int(historial['data_scanned_bytes'].tail(5).max())
+    plan = explain_query(query, region=region, bucket=bucket, params=params)
+    if plan['scans'] and plan['estimate_complete']:
+        return plan['estimated_bytes']
+    return None
+
+
 def run_athena_query_auto(query: str, name: str = '', threshold_mb: float = 1.0, 
-                          region: str = 'us-east-1', bucket: str = 'data-lake-athena-querys') -> pd.DataFrame:
+                          region: str = 'us-east-1', bucket: str = 'data-lake-athena-querys',
+                          budget: Optional['QueryBudget'] = None, params: Optional[List[str]] = None,
+                          reuse_max_age_minutes: Optional[int] = None,
+                          dtype_backend: Optional[str] = None,
+                          large_result_mode: str = 'unload',
+                          result_size: Optional[str] = None) -> pd.DataFrame:
+    """
+    Elige el método y ejecuta la consulta una sola vez:
+    - Pequeño: get_query_results() (admite reutilización de resultados)
+    - Grande: UNLOAD a Parquet (o CTAS + Parquet con large_result_mode='ctas')
+
+    Con result_size='small' o 'large' se usa ese método sin estimar: es lo que
+    conviene cuando se sabe el tamaño del resultado (p. ej. un agregado de pocas
+    filas sobre una tabla grande, que sin esto iría siempre a UNLOAD). Si no se
+    indica, se decide por el escaneo estimado (EXPLAIN o historial, ver
+    estimate_scan_bytes): menos de threshold_mb va al método pequeño y sin
+    estimación va al grande.
+
+    Con budget, la ejecución se valida contra los límites por query y por informe
+    antes de lanzarla y los bytes escaneados se descuentan del budget.
+    reuse_max_age_minutes solo aplica al método pequeño (Athena no reutiliza
+    resultados de UNLOAD ni CTAS).
     """
-    Ejecuta query y elige método según tamaño:
-    - Pequeño (<threshold_mb): get_query_results()
-    - Grande: CTAS + Parquet
+    if large_result_mode not in LARGE_RESULT_MODES:
+        raise ValueError(f"Modo desconocido: {large_result_mode!r}. Opciones: {LARGE_RESULT_MODES}")
+    if result_size not in RESULT_SIZES:
+        raise ValueError(f"Tamaño de resultado desconocido: {result_size!r}. Opciones: {RESULT_SIZES}")
+
+    pequeno = result_size == 'small'
+    if result_size is None:
+        estimado = estimate_scan_bytes(query, name, region, bucket, params, budget=budget)
+        pequeno = estimado is not None and estimado / (1024 * 1024) < threshold_mb
+
+    # Si es pequeño, usar get_query_results
+    if pequeno:
+        return run_athena_query_small(query, region, bucket, name=name, budget=budget, params=params,
+                                      reuse_max_age_minutes=reuse_max_age_minutes,
+                                      dtype_backend=dtype_backend)
+
+    # Si es grande (o desconocido), bajar el resultado a Parquet
+    if large_result_mode == 'ctas':
+        return run_athena_query(query, name, region, bucket, budget=budget, params=params,
+                                dtype_backend=dtype_backend)
+    return run_athena_query_unload(query, name, region, bucket, budget=budget, params=params,
+                                   dtype_backend=dtype_backend)
+
+# ============================================================================
+# PLANTILLAS DE QUERIES PARAMETRIZADAS
+# ============================================================================
+
+QUERY_PARAM_TYPES = ('bigint', 'double', 'varchar', 'date', 'list')
+_LIST_TYPE = re.compile(r'list(?:\[(bigint|double|varchar|date)\])?')
+
+# Literales, comentarios o parámetros :nombre (los dos primeros se conservan tal cual)
+_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/|(?<![:\w]):([A-Za-z_]\w*)", re.S)
+
+# `?` fuera de literales y comentarios (para expandir las listas al ejecutar)
+_QMARK = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/|(\?)", re.S)
+
+# Un parámetro justo después de `IN (` se expande a un `?` por elemento
+_IN_OPEN = re.compile(r'\bIN\s*\(\s*$', re.I)
+
+# Ídem para las tablas de staging {{nombre}}, que se reemplazan al ejecutar (ver stage_extract)
+_TABLE_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/|\{\{\s*([A-Za-z_]\w*)\s*\}\}", re.S)
+
+
+class QueryTemplate:
+    """
+    Consulta con parámetros tipados (`:nombre` en el SQL).
+
+    El texto SQL es el mismo para todos los proyectos: los valores viajan como
+    ExecutionParameters, de modo que Athena puede reutilizar resultados de
+    ejecuciones idénticas y una sola definición sirve para cualquier proyecto.
+
+    Tipos soportados:
+        - bigint, double, varchar, date
+        - list[bigint], list[double], list[varchar], list[date] ('list' equivale a
+          list[varchar]). Dentro de `col IN (:projects_id)` se expande a un `?`
+          tipado por elemento, así la columna se compara sin CAST y Athena puede
+          filtrar particiones; una lista vacía queda como `IN (NULL)`. En cualquier
+          otra posición viaja como varchar separado por comas, p. ej. para un
+          filtro opcional: `(:var_ie = '' OR institution IN (:var_ie))`.
+
+    Las tablas de staging se referencian como `{{nombre}}` y se indican al
+    ejecutar (ver stage_extract). Como la tabla depende del proyecto, esas
+    plantillas no se publican como prepared statements; tampoco las que expanden
+    listas (la cantidad de `?` depende de los valores).
+
+    `result_size` declara el tamaño esperado del resultado ('small' para
+    agregados o catálogos de pocas filas, 'large' para extractos por fila): con
+    'small' la plantilla se ejecuta con get_query_results y reutiliza resultados
+    (ver run_athena_query_auto); sin declarar se decide por el escaneo estimado.
+    """
+
+    def __init__(self, name: str, sql: str, params: Dict[str, str], result_size: Optional[str] = None):
+        desconocidos = {tipo for tipo in params.values()
+                        if tipo not in QUERY_PARAM_TYPES and not _LIST_TYPE.fullmatch(tipo)}
+        if desconocidos:
+            raise ValueError(f"Tipos de parámetro no soportados: {sorted(desconocidos)}")
+        if result_size not in RESULT_SIZES:
+            raise ValueError(f"Tamaño de resultado desconocido: {result_size!r}. Opciones: {RESULT_SIZES}")
+
+        self.name = name
+        self.source = sql
+        self.params = dict(params)
+        self.result_size = result_size
+        self.order: List[str] = []
+        self.expanded: List[bool] = []
+
+        def _sustituir(match):
+            if match.group(1) is None:
+                return match.group(0)
+            nombre = match.group(1)
+            self.order.append(nombre)
+            self.expanded.append(
+                self._element_type(self.params.get(nombre, '')) is not None
+                and bool(_IN_OPEN.search(sql, 0, match.start()))
+            )
+            return '?'
+
+        self.sql = _PLACEHOLDER.sub(_sustituir, sql)
+        self.tables = sorted({tabla for tabla in _TABLE_PLACEHOLDER.findall(self.sql) if tabla})
+
+        sin_declarar = set(self.order) - set(self.params)
+        sin_usar = set(self.params) - set(self.order)
+        if sin_declarar or sin_usar:
+            raise ValueError(
+                f"Plantilla '{name}': parámetros sin declarar {sorted(sin_declarar)}, "
+                f"declarados sin usar {sorted(sin_usar)}"
+            )
+
+    @property
+    def statement_name(self) -> str:
+        """Nombre del prepared statement (versionado por el texto del SQL)."""
+        return f"informe_{self.name}_{zlib.crc32(self.sql.encode('utf-8')):08x}"
+
+    @property
+    def expands_lists(self) -> bool:
+        """True si algún parámetro de lista se expande dentro de un `IN (...)`."""
+        return any(self.expanded)
+
+    @staticmethod
+    def _element_type(tipo: str) -> Optional[str]:
+        """Tipo de los elementos de un parámetro de lista (None si no es lista)."""
+        match = _LIST_TYPE.fullmatch(tipo)
+        if match is None:
+            return None
+        return match.group(1) or 'varchar'
+
+    @staticmethod
+    def _items(valor: Any) -> List[str]:
+        if valor is None:
+            valor = []
+        elif isinstance(valor, str):
+            valor = valor.split(',')
+        elif not isinstance(valor, (list, tuple, set, pd.Series)):
+            valor = [valor]
+        # Acepta también listas escritas como SQL: "'A','B'"
+        items = (str(v).strip().strip("'\"").replace("''", "'") for v in valor)
+        return [item for item in items if item]
+
+    @classmethod
+    def _literal(cls, valor: Any, tipo: str) -> str:
+        if tipo == 'bigint':
+            return str(int(valor))
+        if tipo == 'double':
+            return repr(float(valor))
+        if tipo == 'date':
+            return f"DATE '{pd.Timestamp(valor).date().isoformat()}'"
+        if cls._element_type(tipo) is not None:
+            valor = ','.join(cls._items(valor))
+        return "'" + str(valor).replace("'", "''") + "'"
+
+    def bind(self, values: Dict[str, Any]) -> List[str]:
+        """
+        Convierte los valores a literales SQL en el orden de los `?` de render():
+        las listas dentro de `IN (...)` aportan un literal tipado por elemento.
+        """
+        faltantes = [p for p in self.params if p not in values]
+        if faltantes:
+            raise ValueError(f"Plantilla '{self.name}': faltan valores para {faltantes}")
+        literales = []
+        for nombre, expandir in zip(self.order, self.expanded):
+            tipo = self.params[nombre]
+            if expandir:
+                elemento = self._element_type(tipo)
+                literales.extend(self._literal(item, elemento) for item in self._items(values[nombre]))
+            else:
+                literales.append(self._literal(values[nombre], tipo))
+        return literales
+
+    def render(self, tables: Optional[Dict[str, Any]] = None,
+               values: Optional[Dict[str, Any]] = None) -> str:
+        """
+        SQL a ejecutar: tablas de staging reemplazadas (StagedExtract o nombre de
+        tabla) y listas expandidas a tantos `?` como elementos tengan en `values`.
+        """
+        sql = self.sql
+        if self.expands_lists:
+            if values is None:
+                raise ValueError(f"Plantilla '{self.name}': se necesitan los valores para expandir las listas")
+            posiciones = iter(zip(self.order, self.expanded))
+
+            def _expandir(match):
+                if match.group(1) is None:
+                    return match.group(0)
+                nombre, expandir = next(posiciones)
+                if not expandir:
+                    return '?'
+                return ', '.join('?' * len(self._items(values.get(nombre)))) or 'NULL'
+
+            sql = _QMARK.sub(_expandir, sql)
+
+        if not self.tables:
+            return sql
+        tables = tables or {}
+        faltantes = [t for t in self.tables if t not in tables]
+        if faltantes:
+            raise ValueError(f"Plantilla '{self.name}': faltan tablas de staging para {faltantes}")
+        return _TABLE_PLACEHOLDER.sub(
+            lambda match: match.group(0) if match.group(1) is None else str(tables[match.group(1)]), sql)
+
+
+_query_templates: Dict[str, QueryTemplate] = {}
+
+
+def register_query(name: str, sql: str, params: Dict[str, str],
+                   result_size: Optional[str] = None) -> QueryTemplate:
+    """
+    Registra (o reemplaza) una plantilla de consulta.
+
+    Ejemplo:
+        >>> register_query('proyectos', "SELECT ... WHERE p.id IN (:projects_id)",
+        ...                {'projects_id': 'list[bigint]'}, result_size='small')
+    """
+    template = QueryTemplate(name, sql, params, result_size)
+    _query_templates[name] = template
+    return template
+
+
+def get_query(name: str) -> QueryTemplate:
+    """Retorna la plantilla registrada con ese nombre."""
+    try:
+        return _query_templates[name]
+    except KeyError:
+        raise KeyError(f"No hay una query registrada con el nombre '{name}'") from None
+
+
+def prepare_queries(region: str = 'us-east-1', workgroup: str = 'primary') -> List[str]:
+    """
+    Publica las plantillas registradas como prepared statements del workgroup.
+
+    Los statements quedan disponibles para `EXECUTE informe_<name>_<hash> USING ...`
+    desde la consola u otras herramientas. Si ya existen, se actualizan.
+
+    Solo se publican plantillas sin tablas de staging y sin listas dentro de
+    `IN (...)`: su texto no depende de los valores. Las del informe de cierre
+    usan {{dim_matriculas}} o expanden :projects_id, así que no se publica
+    ninguna; para ellas la reutilización viene de result_size='small' (ver
+    QueryTemplate), no de esta función.
+
+    Returns:
+        list: Nombres de los statements creados o actualizados.
     """
     athena = boto3.client('athena', region_name=region)
-    
-    # Ejecutar query simple primero
-    resp = athena.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={'Database': 'datalake'},
-        ResultConfiguration={'OutputLocation': f's3://{bucket}/temp/'}
+    nombres = []
+    for template in _query_templates.values():
+        if template.tables or template.expands_lists:
+            motivo = 'usa tablas de staging' if template.tables else 'expande listas en IN (...)'
+            print(f"⚠️ La query '{template.name}' no se publica como prepared statement: {motivo}")
+            continue
+        kwargs = {
+            'StatementName': template.statement_name,
+            'WorkGroup': workgroup,
+            'QueryStatement': template.sql,
+            'Description': f"Query '{template.name}' del informe de cierre",
+        }
+        try:
+            athena.create_prepared_statement(**kwargs)
+        except botocore_exceptions.ClientError as e:
+            if 'already exists' not in str(e):
+                raise
+            athena.update_prepared_statement(**kwargs)
+        nombres.append(template.statement_name)
+    return nombres
+
+
+def run_query_template(template, values: Dict[str, Any], reuse_max_age_minutes: Optional[int] = 60,
+                       threshold_mb: float = 1.0, region: str = 'us-east-1',
+                       bucket: str = 'data-lake-athena-querys',
+                       budget: Optional[QueryBudget] = None,
+                       tables: Optional[Dict[str, Any]] = None,
+                       dtype_backend: Optional[str] = None,
+                       large_result_mode: str = 'unload',
+                       result_size: Optional[str] = None) -> pd.DataFrame:
+    """
+    Ejecuta una plantilla registrada con los valores indicados.
+
+    Args:
+        template: QueryTemplate o nombre con el que se registró.
+        values: Valores de los parámetros, p. ej. {'projects_id': '72'}.
+        reuse_max_age_minutes: Antigüedad máxima de un resultado reutilizable (None lo desactiva).
+        tables: Tablas de staging de la plantilla, p. ej. {'dim_matriculas': extracto}.
+        large_result_mode: 'unload' (por defecto) o 'ctas' para resultados grandes.
+        result_size: 'small' o 'large' para forzar el método; por defecto el
+            declarado en la plantilla (ver QueryTemplate).
+
+    Returns:
+        pd.DataFrame: Resultado de la consulta (ver run_athena_query_auto).
+    """
+    if isinstance(template, str):
+        template = get_query(template)
+    return run_athena_query_auto(
+        template.render(tables, values), template.name, threshold_mb=threshold_mb, region=region, bucket=bucket,
+        budget=budget, params=template.bind(values), reuse_max_age_minutes=reuse_max_age_minutes,
+        dtype_backend=dtype_backend, large_result_mode=large_result_mode,
+        result_size=result_size or template.result_size
     )
-    qid = resp['QueryExecutionId']
-    
-    # Esperar y verificar tamaño
-    while True:
-        exec_details = athena.get_query_execution(QueryExecutionId=qid)
-        state = exec_details['QueryExecution']['Status']['State']
-        if state in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-            break
-        time.sleep(1)
-    
-    if state != 'SUCCEEDED':
-        raise Exception(exec_details['QueryExecution']['Status'].get('StateChangeReason'))
-    
-    # Verificar tamaño escaneado
-    stats = exec_details['QueryExecution']['Statistics']
-    data_scanned_mb = stats.get('DataScannedInBytes', 0) / (1024 * 1024)
-    
-    # Si es pequeño, usar get_query_results
-    if data_scanned_mb < threshold_mb:
-        return run_athena_query_small(query, region, bucket)
-    
-    # Si es grande, usar tu método CTAS existente
-    return run_athena_query(query, name, region, bucket)
+
+
+# ============================================================================
+# EXTRACTOS DE STAGING (dimensiones compartidas por las queries de una ejecución)
+# ============================================================================
+
+class StagedExtract:
+    """
+    Resultado de una plantilla materializado con CTAS en Parquet. Las demás
+    plantillas lo usan como tabla (`{{nombre}}`) y pandas lo lee como DataFrame
+    (dataframe()), así las mismas dimensiones (proyecto, alumno, salón,
+    organizaciones...) no se vuelven a unir en cada consulta.
+
+    El nombre de la tabla depende solo de la plantilla y sus valores (ver
+    stage_extract): ejecuciones del mismo informe la reutilizan mientras no
+    venza, y el SQL que la usa es idéntico entre ejecuciones. drop() (o salir
+    del bloque with) la elimina antes de tiempo; las vencidas las recoge
+    sweep_orphan_resources o las reemplaza el siguiente stage_extract.
+
+    Example:
+        >>> dim = stage_extract('dim_matriculas', {'projects_id': '72'})
+        >>> df = run_query_template('asistencias', {}, tables={'dim_matriculas': dim})
+        >>> matriculas = dim.dataframe()
+    """
+
+    def __init__(self, name: str, table_name: str, s3_prefix: str, region: str = 'us-east-1',
+                 bucket: str = 'data-lake-athena-querys', database: str = 'datalake',
+                 reused: bool = False):
+        self.name = name
+        self.table_name = table_name
+        self.s3_prefix = s3_prefix
+        self.region = region
+        self.bucket = bucket
+        self.database = database
+        self.reused = reused
+        self.dropped = False
+        self._dfs: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def table(self) -> str:
+        """Nombre calificado de la tabla (lo que reemplaza a `{{nombre}}`)."""
+        return f"{self.database}.{self.table_name}"
+
+    @property
+    def location(self) -> str:
+        return f"s3://{self.bucket}/{self.s3_prefix}"
+
+    def __str__(self) -> str:
+        return self.table
+
+    def dataframe(self, dtype_backend: Optional[str] = None) -> pd.DataFrame:
+        """Extracto completo (se lee del Parquet una sola vez; no modificarlo in place)."""
+        backend = _dtype_backend(dtype_backend)
+        with self._lock:
+            if backend not in self._dfs:
+                self._dfs[backend] = read_parquet_result(self.location, backend)
+            return self._dfs[backend]
+
+    def drop(self) -> None:
+        """Encola la eliminación de la tabla y su prefijo en el janitor de la región."""
+        if not self.dropped:
+            get_janitor(self.region).enqueue(self.bucket, self.s3_prefix, self.table_name, force=True)
+            self.dropped = True
+
+    def __enter__(self) -> 'StagedExtract':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.drop()
+
+
+def _stage_created(athena, table_name: str, database: str = 'datalake') -> Optional[datetime]:
+    """Fecha de creación de la tabla en el catálogo (None si no existe)."""
+    try:
+        metadata = athena.get_table_metadata(CatalogName='AwsDataCatalog', DatabaseName=database,
+                                             TableName=table_name)['TableMetadata']
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'MetadataException':
+            return None
+        raise
+    return metadata.get('CreateTime')
+
+
+def stage_extract(template, values: Optional[Dict[str, Any]] = None, region: str = 'us-east-1',
+                  bucket: str = 'data-lake-athena-querys', budget: Optional[QueryBudget] = None,
+                  tables: Optional[Dict[str, Any]] = None,
+                  max_age_minutes: Optional[int] = 6 * 60) -> StagedExtract:
+    """
+    Materializa una plantilla como tabla de staging, o reutiliza la vigente.
+
+    El nombre de la tabla sale de la plantilla y de un hash del SQL y los valores
+    (`python_table_stage_<name>_h<hash>`): para el mismo proyecto es el mismo en
+    cada ejecución, así que si la tabla ya existe y tiene menos de
+    max_age_minutes se usa sin volver a ejecutar el CTAS, y las consultas que la
+    referencian conservan el mismo texto (lo que permite reutilizar resultados).
+
+    Args:
+        template: QueryTemplate o nombre con el que se registró.
+        values: Valores de los parámetros de la plantilla.
+        tables: Otras tablas de staging que use la plantilla.
+        max_age_minutes: Antigüedad máxima de una tabla reutilizable (None o 0
+            la vuelve a materializar siempre).
+
+    Returns:
+        StagedExtract: Extracto listo para usar en `tables` de run_query_template.
+    """
+    if isinstance(template, str):
+        template = get_query(template)
+    sql = template.render(tables, values or {})
+    params = template.bind(values or {})
+
+    clave = zlib.crc32('\x00'.join([sql] + params).encode('utf-8'))
+    etiqueta = f"stage_{template.name}_h{clave:08x}"
+    extract = StagedExtract(template.name, f"python_table_{etiqueta}", f"{TEMP_PREFIX}{etiqueta}/",
+                            region=region, bucket=bucket)
+
+    athena = boto3.client('athena', region_name=region)
+
+    def _vigente() -> bool:
+        creada = _stage_created(athena, extract.table_name, extract.database)
+        return bool(creada and max_age_minutes and time.time() - creada.timestamp() < max_age_minutes * 60)
+
+    if _vigente():
+        extract.reused = True
+        return extract
+
+    if budget is not None:
+        budget.guard(sql, template.name, region=region, bucket=bucket, params=params)
+
+    # La tabla vencida (o restos de un CTAS fallido) se elimina antes de recrearla:
+    # el CTAS exige que no exista la tabla y que el prefijo esté vacío
+    janitor = get_janitor(region)
+    if janitor._eliminar_tablas([(extract.table_name, bucket)]) != [extract.table_name]:
+        raise RuntimeError(f"No se pudo eliminar el extracto vencido {extract.table}")
+    if janitor._eliminar_prefijos([(bucket, extract.s3_prefix)]) != [(bucket, extract.s3_prefix)]:
+        raise RuntimeError(f"No se pudo vaciar {extract.location}")
+
+    try:
+        _, execution = execute_query(athena, _ctas_sql(extract.table_name, extract.location, sql),
+                                     f's3://{bucket}/', params=params, poll_seconds=2)
+    except Exception:
+        # Otra ejecución del mismo informe pudo crearla en paralelo: usar la suya
+        if _vigente():
+            if budget is not None:
+                budget.record(template.name, 0)
+            extract.reused = True
+            return extract
+        extract.drop()
+        raise
+    record_query_stats(template.name, execution, method='stage', budget=budget)
+    return extract
+
 
 def export_dataframe_to_s3_json(df, name, bucket='raw-data-lake-virginia', key='python/category_analysis', region='us-east-1', orient='records'):
     """
@@ -231,7 +1741,8 @@ def create_athena_table(table_name, s3_location, columns, database='datalake',
     TBLPROPERTIES ('has_encrypted_data'='false');
     """
 
-    response = athena.start_query_execution(
+    response = get_governor().start(
+        athena,
         QueryString=query,
         QueryExecutionContext={'Database': database},
         ResultConfiguration={'OutputLocation': f's3://{bucket}/'}
@@ -0,0 +1,586 @@
+from __future__ import annotations
+
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import closing, contextmanager, nullcontext
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from importacion_diferida import modulo_diferido
+
+pd = modulo_diferido('pandas')
+ia = modulo_diferido('openia_script')
+athena = modulo_diferido('athena_utils')
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# PIPELINE DEL INFORME
+# ============================================================================
+
+# Etapas con checkpoint, en orden. Un trabajo interrumpido sigue desde la
+# siguiente a la última guardada.
+ETAPAS = ('consultado', 'agregado', 'renderizado', 'escrito')
+
+
+class PipelineInforme:
+    """
+    Funciones de cada etapa del informe de un proyecto.
+
+    Cada función recibe el trabajo (dict con id, proyecto y parametros) y el
+    resultado de la etapa anterior (None en consultar), y retorna el suyo, que se
+    guarda como checkpoint (pickle) antes de seguir. Por eso deben retornar
+    objetos serializables (DataFrames, dicts, los bytes del .docx, ...) y estar
+    definidas a nivel de módulo (se envían a los procesos trabajadores).
+
+    Example:
+        >>> # informes_pipeline.py
+        >>> def consultar(trabajo, _):
+        ...     return ejecutar_queries_paralelo(queries_informe(trabajo['proyecto']))
+        >>> def agregar(trabajo, datos): ...
+        >>> def renderizar(trabajo, agregados): ...     # retorna los bytes del .docx
+        >>> def escribir(trabajo, docx): ...            # guarda/sube y retorna la ruta
+        >>> pipeline = PipelineInforme(consultar, agregar, renderizar, escribir)
+    """
+
+    def __init__(self, consultar: Callable, agregar: Callable, renderizar: Callable, escribir: Callable):
+        self.consultar = consultar
+        self.agregar = agregar
+        self.renderizar = renderizar
+        self.escribir = escribir
+
+    def pasos(self) -> List[Tuple[str, Callable]]:
+        return list(zip(ETAPAS, (self.consultar, self.agregar, self.renderizar, self.escribir)))
+
+
+# ============================================================================
+# ALMACENAMIENTO (SQLite)
+# ============================================================================
+
+_ESQUEMA_COLA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    proyecto TEXT NOT NULL,
+    parametros TEXT NOT NULL DEFAULT '{}',
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    etapa TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    max_intentos INTEGER NOT NULL DEFAULT 3,
+    trabajador TEXT,
+    latido REAL,
+    disponible_desde REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    resultado TEXT,
+    creado TEXT NOT NULL,
+    actualizado TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, disponible_desde);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    trabajo_id INTEGER NOT NULL,
+    etapa TEXT NOT NULL,
+    ruta TEXT NOT NULL,
+    segundos REAL,
+    fecha TEXT NOT NULL,
+    PRIMARY KEY (trabajo_id, etapa)
+);
+CREATE TABLE IF NOT EXISTS permisos (
+    recurso TEXT NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    desde REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS consumo (
+    recurso TEXT NOT NULL,
+    fecha REAL NOT NULL,
+    cantidad INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_consumo ON consumo (recurso, fecha);
+"""
+
+
+def _ahora() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class _AlmacenSQLite:
+    """Conexión a la base de la cola (modo WAL, esquema creado en el primer uso)."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._inicializado = False
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Sin transacción implícita: las que importan se abren con BEGIN IMMEDIATE
+        con = sqlite3.connect(self.ruta, timeout=60, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        if not self._inicializado:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_ESQUEMA_COLA)
+            self._inicializado = True
+        return con
+
+    @contextmanager
+    def _transaccion(self) -> Iterator[sqlite3.Connection]:
+        """Transacción con bloqueo de escritura desde el inicio (una a la vez entre procesos)."""
+        with closing(self._conectar()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+
+
+# ============================================================================
+# COLA DE TRABAJOS
+# ============================================================================
+
+class ColaInformes(_AlmacenSQLite):
+    """
+    Cola persistente de informes: un trabajo por proyecto, con checkpoints por etapa.
+
+    Estados: pendiente -> en_curso -> terminado, o de vuelta a pendiente (con
+    espera creciente) si falla y le quedan intentos; fallido si no. Un trabajo
+    en_curso cuyo trabajador dejó de dar latidos vuelve a tomarse y sigue desde
+    su último checkpoint.
+
+    Example:
+        >>> cola = ColaInformes()
+        >>> cola.encolar(['72', '73', '81'], parametros={'var_ia': True})
+        >>> ejecutar_trabajadores(cola, pipeline, n_trabajadores=4)
+        >>> cola.resumen()
+    """
+
+    def __init__(self, ruta: str = 'cola_informes.sqlite', directorio_checkpoints: str = 'checkpoints_informes'):
+        super().__init__(ruta)
+        self.directorio_checkpoints = directorio_checkpoints
+
+    # ---- Encolar y consultar ---------------------------------------------
+
+    def encolar(self, proyectos: Sequence[Any], parametros: Optional[Dict[str, Any]] = None,
+                max_intentos: int = 3) -> List[int]:
+        """
+        Agrega un trabajo por proyecto. Los proyectos que ya tienen un trabajo
+        pendiente o en curso se omiten.
+
+        Returns:
+            Ids de los trabajos creados.
+        """
+        ids = []
+        parametros_json = json.dumps(parametros or {}, ensure_ascii=False, default=str)
+        with self._transaccion() as con:
+            activos = {fila[0] for fila in con.execute(
+                "SELECT proyecto FROM trabajos WHERE estado IN ('pendiente', 'en_curso')")}
+            for proyecto in map(str, proyectos):
+                if proyecto in activos:
+                    continue
+                cursor = con.execute(
+                    "INSERT INTO trabajos (proyecto, parametros, max_intentos, creado, actualizado) "
+                    "VALUES (?, ?, ?, ?, ?)", (proyecto, parametros_json, max_intentos, _ahora(), _ahora()))
+                ids.append(cursor.lastrowid)
+                activos.add(proyecto)
+        logger.info(f"Encolados {len(ids)} trabajos ({len(proyectos) - len(ids)} ya estaban en la cola)")
+        return ids
+
+    def hay_trabajo(self) -> bool:
+        """True si queda algún trabajo pendiente o en curso."""
+        with closing(self._conectar()) as con:
+            return con.execute("SELECT 1 FROM trabajos WHERE estado IN ('pendiente', 'en_curso') LIMIT 1"
+                               ).fetchone() is not None
+
+    def trabajos(self, estado: Optional[str] = None) -> pd.DataFrame:
+        """Trabajos de la cola (opcionalmente de un estado), sin los parámetros."""
+        sql = ("SELECT id, proyecto, estado, etapa, intentos, max_intentos, trabajador, error, "
+               "resultado, creado, actualizado FROM trabajos")
+        params: tuple = ()
+        if estado is not None:
+            sql, params = sql + " WHERE estado = ?", (estado,)
+        with closing(self._conectar()) as con:
+            return pd.read_sql_query(sql + " ORDER BY id", con, params=params)
+
+    def resumen(self) -> pd.DataFrame:
+        """Cantidad de trabajos por estado y última etapa completada."""
+        with closing(self._conectar()) as con:
+            return pd.read_sql_query(
+                "SELECT estado, coalesce(etapa, '') AS etapa, count(*) AS trabajos "
+                "FROM trabajos GROUP BY estado, etapa ORDER BY estado, etapa", con)
+
+    def reintentar_fallidos(self) -> int:
+        """Vuelve a encolar los trabajos fallidos (desde su último checkpoint)."""
+        with self._transaccion() as con:
+            return con.execute(
+                "UPDATE trabajos SET estado = 'pendiente', intentos = 0, disponible_desde = 0, "
+                "actualizado = ? WHERE estado = 'fallido'", (_ahora(),)).rowcount
+
+    # ---- Ciclo de un trabajo ----------------------------------------------
+
+    def tomar(self, trabajador: str, vencimiento: float = 300) -> Optional[Dict[str, Any]]:
+        """
+        Asigna al trabajador el próximo trabajo disponible: uno pendiente o uno en
+        curso sin latido hace más de `vencimiento` segundos (su trabajador cayó).
+
+        Returns:
+            El trabajo (dict, con `parametros` ya decodificado) o None si no hay.
+        """
+        ahora = time.time()
+        with self._transaccion() as con:
+            while True:
+                fila = con.execute(
+                    "SELECT * FROM trabajos WHERE (estado = 'pendiente' AND disponible_desde <= ?) "
+                    "OR (estado = 'en_curso' AND latido < ?) ORDER BY id LIMIT 1",
+                    (ahora, ahora - vencimiento)).fetchone()
+                if fila is None:
+                    return None
+                trabajo = dict(fila)
+                if trabajo['intentos'] < trabajo['max_intentos']:
+                    break
+                # Tomado y abandonado tantas veces como intentos tenía
+                con.execute("UPDATE trabajos SET estado = 'fallido', error = coalesce(error, ?), "
+                            "actualizado = ? WHERE id = ?",
+                            ("El trabajador dejó de responder", _ahora(), trabajo['id']))
+
+            con.execute("UPDATE trabajos SET estado = 'en_curso', trabajador = ?, latido = ?, "
+                        "intentos = intentos + 1, actualizado = ? WHERE id = ?",
+                        (trabajador, ahora, _ahora(), trabajo['id']))
+
+        if trabajo['estado'] == 'en_curso':
+            logger.warning(f"Trabajo {trabajo['id']} ({trabajo['proyecto']}) retomado: "
+                           f"{trabajo['trabajador']} dejó de responder")
+        trabajo.update(estado='en_curso', trabajador=trabajador, intentos=trabajo['intentos'] + 1,
+                       parametros=json.loads(trabajo['parametros']))
+        return trabajo
+
+    def latido(self, trabajo_id: int, trabajador: str) -> bool:
+        """Renueva el latido; False si el trabajo ya no es de este trabajador."""
+        with closing(self._conectar()) as con:
+            return con.execute("UPDATE trabajos SET latido = ? WHERE id = ? AND trabajador = ? "
+                               "AND estado = 'en_curso'", (time.time(), trabajo_id, trabajador)).rowcount == 1
+
+    def liberar_trabajador(self, trabajador: str) -> int:
+        """Devuelve a pendiente los trabajos en curso de un trabajador que terminó mal."""
+        with self._transaccion() as con:
+            return con.execute("UPDATE trabajos SET estado = 'pendiente', actualizado = ? "
+                               "WHERE estado = 'en_curso' AND trabajador = ?", (_ahora(), trabajador)).rowcount
+
+    def _ruta_checkpoint(self, trabajo_id: int, etapa: str) -> str:
+        return os.path.join(self.directorio_checkpoints, str(trabajo_id), f"{etapa}.pkl")
+
+    def guardar_etapa(self, trabajo: Dict[str, Any], etapa: str, resultado: Any, segundos: float) -> None:
+        """Guarda el resultado de una etapa (escritura atómica) y la marca como completada."""
+        ruta = self._ruta_checkpoint(trabajo['id'], etapa)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'wb') as f:
+            pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+
+        with self._transaccion() as con:
+            con.execute("INSERT OR REPLACE INTO checkpoints (trabajo_id, etapa, ruta, segundos, fecha) "
+                        "VALUES (?, ?, ?, ?, ?)", (trabajo['id'], etapa, ruta, segundos, _ahora()))
+            con.execute("UPDATE trabajos SET etapa = ?, latido = ?, actualizado = ? WHERE id = ?",
+                        (etapa, time.time(), _ahora(), trabajo['id']))
+        trabajo['etapa'] = etapa
+
+    def reanudar(self, trabajo: Dict[str, Any]) -> Tuple[int, Any]:
+        """
+        Punto de partida del trabajo: (índice de la próxima etapa, resultado de la
+        última completada). Sin checkpoint legible se empieza desde el principio.
+        """
+        if not trabajo.get('etapa'):
+            return 0, None
+        ruta = self._ruta_checkpoint(trabajo['id'], trabajo['etapa'])
+        try:
+            with open(ruta, 'rb') as f:
+                resultado = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Checkpoint '{trabajo['etapa']}' del trabajo {trabajo['id']} ilegible ({e}); "
+                           f"se reinicia desde la primera etapa")
+            return 0, None
+        logger.info(f"Trabajo {trabajo['id']} ({trabajo['proyecto']}) sigue después de '{trabajo['etapa']}'")
+        return ETAPAS.index(trabajo['etapa']) + 1, resultado
+
+    def terminar(self, trabajo: Dict[str, Any], resultado: Any = None, conservar_checkpoints: bool = False) -> None:
+        """Marca el trabajo como terminado y borra sus checkpoints intermedios."""
+        with self._transaccion() as con:
+            con.execute("UPDATE trabajos SET estado = 'terminado', error = NULL, resultado = ?, "
+                        "actualizado = ? WHERE id = ?",
+                        (None if resultado is None else str(resultado), _ahora(), trabajo['id']))
+            if not conservar_checkpoints:
+                con.execute("DELETE FROM checkpoints WHERE trabajo_id = ?", (trabajo['id'],))
+        if not conservar_checkpoints:
+            directorio = os.path.join(self.directorio_checkpoints, str(trabajo['id']))
+            for etapa in ETAPAS:
+                ruta = self._ruta_checkpoint(trabajo['id'], etapa)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            if os.path.isdir(directorio) and not os.listdir(directorio):
+                os.rmdir(directorio)
+
+    def fallar(self, trabajo: Dict[str, Any], error: str, espera_base: float = 30) -> str:
+        """
+        Registra el error. Con intentos restantes el trabajo vuelve a pendiente tras
+        una espera exponencial (espera_base, 2x, 4x...); si no, queda fallido.
+
+        Returns:
+            El nuevo estado.
+        """
+        estado = 'pendiente' if trabajo['intentos'] < trabajo['max_intentos'] else 'fallido'
+        disponible = time.time() + espera_base * 2 ** (trabajo['intentos'] - 1)
+        with self._transaccion() as con:
+            con.execute("UPDATE trabajos SET estado = ?, error = ?, disponible_desde = ?, actualizado = ? "
+                        "WHERE id = ?", (estado, error, disponible, _ahora(), trabajo['id']))
+        return estado
+
+
+# ============================================================================
+# LÍMITES GLOBALES (entre procesos)
+# ============================================================================
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class LimitesGlobales(_AlmacenSQLite):
+    """
+    Límites compartidos por todos los procesos que usan la misma base:
+
+    - ranura(recurso, maximo): como mucho `maximo` bloques a la vez (p. ej. la
+      etapa de consultas a Athena).
+    - consumir(recurso, cantidad, por_minuto): ventana deslizante de 60 s (p. ej.
+      tokens por minuto del LLM).
+
+    Los permisos de procesos que murieron sin liberarlos se descartan solos.
+    """
+
+    def __init__(self, ruta: str = 'cola_informes.sqlite'):
+        super().__init__(ruta)
+        self.host = socket.gethostname()
+
+    @contextmanager
+    def ranura(self, recurso: str, maximo: int, espera: float = 0.5) -> Iterator[None]:
+        """Bloquea hasta obtener una de las `maximo` ranuras del recurso."""
+        while True:
+            with self._transaccion() as con:
+                for fila in con.execute("SELECT rowid, pid FROM permisos WHERE recurso = ? AND host = ?",
+                                        (recurso, self.host)).fetchall():
+                    if not _proceso_vivo(fila['pid']):
+                        con.execute("DELETE FROM permisos WHERE rowid = ?", (fila['rowid'],))
+                ocupadas = con.execute("SELECT count(*) FROM permisos WHERE recurso = ?", (recurso,)).fetchone()[0]
+                if ocupadas < maximo:
+                    permiso = con.execute("INSERT INTO permisos (recurso, host, pid, desde) VALUES (?, ?, ?, ?)",
+                                          (recurso, self.host, os.getpid(), time.time())).lastrowid
+                    break
+            time.sleep(espera)
+
+        try:
+            yield
+        finally:
+            with closing(self._conectar()) as con:
+                con.execute("DELETE FROM permisos WHERE rowid = ?", (permiso,))
+
+    def consumir(self, recurso: str, cantidad: int, por_minuto: int) -> None:
+        """
+        Registra el consumo de `cantidad` unidades; si en los últimos 60 s ya se
+        consumió el máximo, espera a que se libere cupo. Un pedido mayor que el
+        límite pasa solo cuando la ventana está vacía.
+        """
+        while True:
+            ahora = time.time()
+            with self._transaccion() as con:
+                con.execute("DELETE FROM consumo WHERE recurso = ? AND fecha < ?", (recurso, ahora - 60))
+                usado, primero = con.execute("SELECT coalesce(sum(cantidad), 0), min(fecha) FROM consumo "
+                                             "WHERE recurso = ?", (recurso,)).fetchone()
+                if usado == 0 or usado + cantidad <= por_minuto:
+                    con.execute("INSERT INTO consumo (recurso, fecha, cantidad) VALUES (?, ?, ?)",
+                                (recurso, ahora, int(cantidad)))
+                    return
+            time.sleep(max(0.1, primero + 60 - ahora))
+
+
+# ============================================================================
+# TRABAJADORES
+# ============================================================================
+
+class _Latido(threading.Thread):
+    """Renueva el latido del trabajo mientras se procesa."""
+
+    def __init__(self, cola: ColaInformes, trabajo_id: int, trabajador: str, intervalo: float):
+        super().__init__(name=f"latido_{trabajo_id}", daemon=True)
+        self.cola, self.trabajo_id, self.trabajador, self.intervalo = cola, trabajo_id, trabajador, intervalo
+        self._fin = threading.Event()
+
+    def run(self) -> None:
+        while not self._fin.wait(self.intervalo):
+            if not self.cola.latido(self.trabajo_id, self.trabajador):
+                logger.warning(f"Trabajo {self.trabajo_id} ya no pertenece a {self.trabajador}")
+                return
+
+    def detener(self) -> None:
+        self._fin.set()
+        self.join()
+
+
+def nombre_trabajador(pid: Optional[int] = None) -> str:
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+def procesar_trabajo(cola: ColaInformes, limites: LimitesGlobales, pipeline: PipelineInforme,
+                     trabajo: Dict[str, Any], config: Dict[str, Any]) -> str:
+    """
+    Ejecuta las etapas pendientes de un trabajo, guardando cada checkpoint.
+
+    Returns:
+        Estado final del trabajo ('terminado', 'pendiente' o 'fallido').
+    """
+    latido = _Latido(cola, trabajo['id'], trabajo['trabajador'], config['vencimiento'] / 3)
+    latido.start()
+    try:
+        inicio, resultado = cola.reanudar(trabajo)
+        with ia.proyecto_actual(trabajo['proyecto']):
+            for etapa, funcion in pipeline.pasos()[inicio:]:
+                t0 = time.perf_counter()
+                if etapa == 'consultado' and config['max_consultas_athena']:
+                    ranura = limites.ranura('athena', config['max_consultas_athena'])
+                else:
+                    ranura = nullcontext()
+                # Las consultas de la cola ceden ante las interactivas (ver athena_utils.AthenaGovernor)
+                with ranura, athena.query_priority('batch'):
+                    resultado = funcion(trabajo, resultado)
+                cola.guardar_etapa(trabajo, etapa, resultado, time.perf_counter() - t0)
+        cola.terminar(trabajo, resultado, config['conservar_checkpoints'])
+        logger.info(f"Trabajo {trabajo['id']} ({trabajo['proyecto']}) terminado")
+        return 'terminado'
+    except Exception:
+        estado = cola.fallar(trabajo, traceback.format_exc(), config['espera_reintento'])
+        logger.error(f"Trabajo {trabajo['id']} ({trabajo['proyecto']}) falló en intento "
+                     f"{trabajo['intentos']}/{trabajo['max_intentos']} -> {estado}")
+        return estado
+    finally:
+        latido.detener()
+
+
+def _bucle_trabajador(ruta: str, directorio: str, pipeline: PipelineInforme, config: Dict[str, Any]) -> None:
+    """Proceso trabajador: toma trabajos hasta que no quede ninguno pendiente ni en curso."""
+    cola = ColaInformes(ruta, directorio)
+    limites = LimitesGlobales(ruta)
+    if config['tokens_por_minuto']:
+        ia.configurar_limite_tokens(lambda n: limites.consumir('llm_tokens', n, config['tokens_por_minuto']))
+
+    nombre = nombre_trabajador()
+    while True:
+        trabajo = cola.tomar(nombre, config['vencimiento'])
+        if trabajo is not None:
+            procesar_trabajo(cola, limites, pipeline, trabajo, config)
+        elif cola.hay_trabajo():
+            # Quedan trabajos en espera de reintento o en curso en otro trabajador
+            time.sleep(config['espera'])
+        else:
+            return
+
+
+def ejecutar_trabajadores(cola: ColaInformes, pipeline: PipelineInforme, n_trabajadores: int = 4,
+                          max_consultas_athena: Optional[int] = 2, tokens_por_minuto: Optional[int] = None,
+                          vencimiento: float = 300, espera: float = 2, espera_reintento: float = 30,
+                          conservar_checkpoints: bool = False) -> pd.DataFrame:
+    """
+    Procesa la cola con `n_trabajadores` procesos y retorna el resumen final.
+
+    Un proceso que termina con error se reemplaza y sus trabajos en curso vuelven
+    a la cola de inmediato (siguen desde su último checkpoint).
+
+    Args:
+        max_consultas_athena: Trabajos en la etapa de consultas a la vez, entre todos
+            los procesos (None = sin límite).
+        tokens_por_minuto: Tope compartido de tokens del LLM (estimados antes de cada
+            llamada; None = sin límite).
+        vencimiento: Segundos sin latido tras los que un trabajo en curso se da por
+            abandonado.
+        espera: Segundos entre consultas a la cola cuando no hay trabajo disponible.
+        espera_reintento: Espera base (exponencial) antes de reintentar un trabajo fallido.
+    """
+    config = {
+        'max_consultas_athena': max_consultas_athena,
+        'tokens_por_minuto': tokens_por_minuto,
+        'vencimiento': vencimiento,
+        'espera': espera,
+        'espera_reintento': espera_reintento,
+        'conservar_checkpoints': conservar_checkpoints,
+    }
+    argumentos = (cola.ruta, cola.directorio_checkpoints, pipeline, config)
+
+    def _lanzar() -> multiprocessing.Process:
+        proceso = multiprocessing.Process(target=_bucle_trabajador, args=argumentos)
+        proceso.start()
+        return proceso
+
+    procesos = [_lanzar() for _ in range(n_trabajadores)]
+    while procesos:
+        time.sleep(espera)
+        for proceso in [p for p in procesos if not p.is_alive()]:
+            procesos.remove(proceso)
+            if proceso.exitcode != 0:
+                liberados = cola.liberar_trabajador(nombre_trabajador(proceso.pid))
+                logger.warning(f"Trabajador {proceso.pid} terminó con código {proceso.exitcode}; "
+                               f"{liberados} trabajo(s) vuelven a la cola")
+                if cola.hay_trabajo():
+                    procesos.append(_lanzar())
+
+    return cola.resumen()
+
+
+def cargar_pipeline(referencia: str) -> PipelineInforme:
+    """Importa un pipeline a partir de 'modulo:nombre'."""
+    modulo, _, nombre = referencia.partition(':')
+    return getattr(importlib.import_module(modulo), nombre or 'pipeline')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cola de generación de informes por proyecto.")
+    parser.add_argument("--cola", default="cola_informes.sqlite", help="Base SQLite de la cola")
+    parser.add_argument("--checkpoints", default="checkpoints_informes", help="Carpeta de checkpoints")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_encolar = sub.add_parser("encolar", help="Agregar proyectos a la cola")
+    p_encolar.add_argument("proyectos", nargs="+")
+    p_encolar.add_argument("--parametros", default="{}", help="JSON con parámetros del informe")
+    p_encolar.add_argument("--max-intentos", type=int, default=3)
+
+    sub.add_parser("estado", help="Resumen de la cola")
+    sub.add_parser("reintentar", help="Volver a encolar los trabajos fallidos")
+
+    p_trabajar = sub.add_parser("trabajar", help="Procesar la cola con varios procesos")
+    p_trabajar.add_argument("pipeline", help="Pipeline a ejecutar, como 'modulo:nombre'")
+    p_trabajar.add_argument("-n", "--trabajadores", type=int, default=4)
+    p_trabajar.add_argument("--max-athena", type=int, default=2)
+    p_trabajar.add_argument("--tokens-minuto", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    cola_cli = ColaInformes(args.cola, args.checkpoints)
+    if args.comando == "encolar":
+        cola_cli.encolar(args.proyectos, json.loads(args.parametros), args.max_intentos)
+    elif args.comando == "reintentar":
+        print(f"{cola_cli.reintentar_fallidos()} trabajos vuelven a la cola")
+    elif args.comando == "trabajar":
+        ejecutar_trabajadores(cola_cli, cargar_pipeline(args.pipeline), args.trabajadores,
+                              args.max_athena, args.tokens_minuto)
+    print(cola_cli.resumen().to_string(index=False))
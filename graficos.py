@@ -0,0 +1,589 @@
+from __future__ import annotations
+
+import textwrap
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+from importacion_diferida import modulo_diferido
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+# numpy, pandas y matplotlib se importan al crear el primer gráfico (ver importacion_diferida)
+np = modulo_diferido('numpy')
+pd = modulo_diferido('pandas')
+matplotlib = modulo_diferido('matplotlib')
+mcolors = modulo_diferido('matplotlib.colors')
+mpatches = modulo_diferido('matplotlib.patches')
+backend_agg = modulo_diferido('matplotlib.backends.backend_agg')
+mfigure = modulo_diferido('matplotlib.figure')
+
+
+# ============================================================================
+# ESTILO (se arma una sola vez al importar)
+# ============================================================================
+
+COLOR_TITULO = '#2E3F5F'
+COLOR_TEXTO = '#424242'
+COLOR_SIN_INFO = '#B0B0B0'
+
+# Argumentos de texto reutilizados por todos los gráficos
+TEXTO_TITULO = dict(fontsize=14, weight='bold', pad=20, color='black')
+TEXTO_ETIQUETA_BARRA = dict(va='center', fontsize=11, weight='bold', color=COLOR_TITULO)
+TEXTO_EJE = dict(fontsize=12, weight='bold', color=COLOR_TEXTO, labelpad=10)
+TEXTO_LIMITE_GAUGE = dict(ha='center', va='center', fontsize=12, weight='bold', color=COLOR_TEXTO)
+
+# Colores de los gauges: (excelente, bueno, regular) y semáforo
+COLORES_GAUGE_BARRAS = ('#A8D5E2', '#7FB3D5', '#5499C7')
+COLORES_SEMAFORO = ('#4CAF50', '#FFC107', '#F44336')
+COLORES_VELOCIMETRO = ('#E53935', '#FFA726', '#66BB6A')
+
+
+@lru_cache(maxsize=None)
+def _semicirculo() -> Tuple[Any, Any]:
+    """Semicírculo unitario de 180° a 0° (fondo de todos los gauges), calculado una vez."""
+    theta = np.radians(np.linspace(180, 0, 100))
+    return np.cos(theta), np.sin(theta)
+
+
+# ============================================================================
+# CICLO DE VIDA DE LAS FIGURAS
+# ============================================================================
+
+# Figuras creadas por este módulo que siguen vivas (no retiene referencias)
+_figuras_abiertas = weakref.WeakSet()
+
+
+def nueva_figura(figsize: Tuple[float, float] = (10, 6), nrows: Optional[int] = None,
+                 ncols: Optional[int] = None, squeeze: bool = True, **kwargs):
+    """
+    Crea una figura con canvas Agg, sin pasar por pyplot (no queda en su registro
+    global y es segura en hilos/procesos distintos).
+
+    Si se indican nrows/ncols retorna (fig, axes) como plt.subplots; si no, solo fig.
+    """
+    fig = mfigure.Figure(figsize=figsize, **kwargs)
+    backend_agg.FigureCanvasAgg(fig)
+    _figuras_abiertas.add(fig)
+    if nrows is None and ncols is None:
+        return fig
+    return fig, fig.subplots(nrows or 1, ncols or 1, squeeze=squeeze)
+
+
+def cerrar(*figuras: Figure) -> None:
+    """Libera los artistas de las figuras; después no se pueden volver a dibujar."""
+    for fig in figuras:
+        fig.clear()
+        _figuras_abiertas.discard(fig)
+
+
+def cerrar_todas() -> int:
+    """Cierra todas las figuras creadas por el módulo. Retorna cuántas cerró."""
+    figuras = list(_figuras_abiertas)
+    cerrar(*figuras)
+    return len(figuras)
+
+
+def renderizar(fig: Figure, formato: str = 'png', dpi: Optional[float] = None,
+               cerrar_figura: bool = False) -> bytes:
+    """
+    Retorna la figura codificada (png, svg, pdf...). word.insertar_figura y los
+    renderizadores aceptan directamente los bytes png.
+    """
+    buffer = BytesIO()
+    fig.savefig(buffer, format=formato, bbox_inches='tight', dpi=dpi or 'figure')
+    if cerrar_figura:
+        cerrar(fig)
+    return buffer.getvalue()
+
+
+def _renderizar_tarea(funcion: Callable, kwargs: Dict[str, Any], formato: str) -> bytes:
+    resultado = funcion(**kwargs)
+    fig = resultado[0] if isinstance(resultado, tuple) else resultado
+    return renderizar(fig, formato, cerrar_figura=True)
+
+
+def renderizar_lote(tareas: Dict[str, Tuple[Callable, Dict[str, Any]]], formato: str = 'png',
+                    max_workers: Optional[int] = None) -> Dict[str, bytes]:
+    """
+    Genera varios gráficos en procesos separados y retorna sus bytes por nombre.
+
+    Args:
+        tareas: {nombre: (funcion_de_este_modulo, kwargs)}
+        formato: Formato de salida de savefig
+        max_workers: Procesos en paralelo (None = núcleos disponibles)
+
+    Example:
+        >>> imagenes = renderizar_lote({
+        ...     'edad': (crear_grafico_distribucion, {'df_distribucion': dist_edad, ...}),
+        ...     'csat': (crear_gauge, {'valor': 87, 'valor_max': 100, 'titulo': 'CSAT'}),
+        ... })
+        >>> builder.figura(imagenes['edad'], pie="Figura 1: ...")
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {nombre: executor.submit(_renderizar_tarea, funcion, kwargs, formato)
+                   for nombre, (funcion, kwargs) in tareas.items()}
+        return {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+
+def _ocultar_bordes(ax, *lados: str) -> None:
+    for lado in lados:
+        ax.spines[lado].set_visible(False)
+
+
+# ============================================================================
+# GRÁFICOS
+# ============================================================================
+
+def crear_grafico_distribucion(
+    df_distribucion,
+    col_categoria,
+    col_cantidad,
+    titulo_grafico,
+    label_y,
+    colormap='#3182bd'
+    ):
+    """
+    Crea un gráfico de distribución con barras horizontales.
+
+    colormap puede ser:
+    - Color sólido: 'blue', '#005eff', 'darkgreen', (0.5, 0.2, 0.8)
+    - Paleta degradada: '#3182bd', 'Reds', 'viridis'
+    - Lista de colores: ['#FF5733', '#33FF57', ...]
+    """
+    dist_invertido = df_distribucion.iloc[::-1]
+
+    # "Sin información" al inicio para que quede ABAJO en barh, sin alterar el orden del resto
+    mask_sin_info = dist_invertido[col_categoria] == 'Sin información'
+    if mask_sin_info.any():
+        dist_invertido = pd.concat([dist_invertido[mask_sin_info], dist_invertido[~mask_sin_info]],
+                                   ignore_index=True)
+
+    fig, ax = nueva_figura(figsize=(10, 6), nrows=1)
+
+    n_categorias = len(dist_invertido)
+
+    if isinstance(colormap, list):
+        colores = colormap[:n_categorias]
+    else:
+        try:
+            mcolors.to_rgba(colormap)
+            colores = [colormap] * n_categorias
+        except (ValueError, TypeError):
+            try:
+                colores = list(matplotlib.colormaps[colormap](np.linspace(0.4, 0.9, n_categorias)))
+            except KeyError:
+                print(f"⚠️ '{colormap}' no es un color válido ni un colormap. Usando 'steelblue'")
+                colores = ['steelblue'] * n_categorias
+    # Forzar color gris para "Sin información" si quedó abajo (primera barra)
+    if n_categorias > 0 and mask_sin_info.any():
+        colores[0] = COLOR_SIN_INFO
+
+    cantidades = dist_invertido[col_cantidad].to_numpy()
+    bars = ax.barh(
+        dist_invertido[col_categoria],
+        cantidades,
+        color=colores,
+        edgecolor='white',
+        linewidth=2.5
+    )
+
+    # Etiquetas con cantidad y porcentaje (porcentajes en una sola operación)
+    porcentajes = cantidades / cantidades.sum() * 100
+    desplazamiento = cantidades.max() * 0.02
+    for bar, cantidad, porcentaje in zip(bars, cantidades, porcentajes):
+        ax.text(
+            cantidad + desplazamiento,
+            bar.get_y() + bar.get_height()/2,
+            f'{cantidad} ({porcentaje:.1f}%)',
+            **TEXTO_ETIQUETA_BARRA
+        )
+
+    ax.set_ylabel(label_y, fontsize=11, weight='bold', color=COLOR_TITULO)
+    ax.set_title(titulo_grafico, **TEXTO_TITULO)
+
+    ax.grid(False)
+    _ocultar_bordes(ax, 'top', 'right', 'bottom')
+    ax.spines['left'].set_color('#CCCCCC')
+    ax.tick_params(axis='x', which='both', bottom=False, labelbottom=False)
+    ax.tick_params(axis='y', colors=COLOR_TITULO, labelsize=10)
+    ax.set_xlim(0, cantidades.max() * 1.18)
+
+    fig.tight_layout()
+    return fig
+
+
+def crear_grafico_cards(datos_cards, titulo_general="Dashboard de Métricas",
+                        filas=1, columnas=None, figsize=None):
+    """
+    Crea un gráfico con múltiples cards de información.
+
+    Parámetros:
+    -----------
+    datos_cards : list of dict
+        Lista de diccionarios con la información de cada card.
+        Cada diccionario debe tener:
+        - 'titulo': str - Título de la card
+        - 'valor': float o str - Valor principal a mostrar
+        - 'subtitulo': str (opcional) - Texto debajo del valor
+        - 'sufijo': str (opcional) - Sufijo para el valor (ej: '%', 'hrs', etc.)
+    titulo_general : str
+        Título general del gráfico
+    filas : int
+        Número de filas para organizar las cards
+    columnas : int (opcional)
+        Número de columnas. Si no se especifica, se calcula automáticamente
+    figsize : tuple (opcional)
+        Tamaño de la figura (ancho, alto)
+
+    Returns:
+    --------
+    fig : matplotlib.figure.Figure
+    """
+    num_cards = len(datos_cards)
+
+    if columnas is None:
+        columnas = min(3, num_cards)  # Máximo 3 columnas
+        filas = (num_cards + columnas - 1) // columnas
+
+    if figsize is None:
+        figsize = (columnas * 5, filas * 3.5)
+
+    fig = nueva_figura(figsize=figsize)
+    fig.suptitle(titulo_general, fontsize=16, weight='bold', y=0.98, wrap=True)
+
+    gs = fig.add_gridspec(filas, columnas, hspace=0.4, wspace=0.3,
+                          left=0.08, right=0.92, top=0.92, bottom=0.08)
+
+    for idx, card_data in enumerate(datos_cards):
+        ax = fig.add_subplot(gs[idx // columnas, idx % columnas])
+        ax.axis('off')
+
+        titulo = card_data.get('titulo', 'Sin título')
+        valor = card_data.get('valor', 0)
+        subtitulo = card_data.get('subtitulo', '')
+        sufijo = card_data.get('sufijo', '')
+
+        ax.add_patch(mpatches.FancyBboxPatch(
+            (0.05, 0.1), 0.9, 0.8,
+            boxstyle="round,pad=0.05",
+            facecolor='#E3F2FD',
+            edgecolor='#1565C0',
+            linewidth=2.5,
+            transform=ax.transAxes,
+            zorder=1
+        ))
+
+        # Título en líneas de hasta 25 caracteres sin cortar palabras
+        lineas = textwrap.wrap(titulo, 25, break_long_words=False) or ['']
+        y_titulo = {1: 0.75, 2: 0.78}.get(len(lineas), 0.80)
+        ax.text(
+            0.5, y_titulo,
+            '\n'.join(lineas),
+            ha='center',
+            va='center',
+            fontsize=12,
+            weight='bold',
+            color='#0D47A1',
+            transform=ax.transAxes,
+            multialignment='center'
+        )
+
+        valor_texto = f'{valor}{sufijo}' if isinstance(valor, (int, float)) else str(valor)
+        if len(valor_texto) > 8:
+            fontsize_valor = 32
+        elif len(valor_texto) > 6:
+            fontsize_valor = 38
+        else:
+            fontsize_valor = 44
+
+        ax.text(
+            0.5, 0.45,
+            valor_texto,
+            ha='center',
+            va='center',
+            fontsize=fontsize_valor,
+            weight='bold',
+            color='black',
+            transform=ax.transAxes
+        )
+
+        if subtitulo:
+            ax.text(
+                0.5, 0.2,
+                subtitulo,
+                ha='center',
+                va='center',
+                fontsize=9,
+                color=COLOR_TEXTO,
+                transform=ax.transAxes,
+                style='italic'
+            )
+
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1)
+
+    return fig
+
+
+def grafico_columnas(df: pd.DataFrame, col_categoria: str, col_valor: str, titulo_grafico: str,
+                     xlabel: str = 'Mes', ylabel: str = '% Asistencia'):
+    """
+    Gráfico de columnas de porcentajes (p. ej. asistencia mensual o semanal),
+    en el orden en que vienen las filas de df.
+
+    Returns:
+    --------
+    fig : matplotlib.figure.Figure
+    """
+    fig, ax = nueva_figura(figsize=(12, 6), nrows=1, facecolor='white')
+
+    valores = df[col_valor].to_numpy()
+    bars = ax.bar(
+        df[col_categoria],
+        valores,
+        color='#3182bd',
+        edgecolor='#1565C0',
+        linewidth=1.5,
+        alpha=0.9,
+        width=0.7
+    )
+
+    for bar, porcentaje in zip(bars, valores):
+        ax.text(
+            bar.get_x() + bar.get_width() / 2,
+            bar.get_height() + 1.2,
+            f'{porcentaje:.1f}%',
+            ha='center',
+            va='bottom',
+            fontsize=11,
+            weight='bold',
+            color='#0D47A1'
+        )
+
+    ax.set_title(titulo_grafico, **dict(TEXTO_TITULO, fontsize=16))
+    ax.set_xlabel(xlabel, **TEXTO_EJE)
+    ax.set_ylabel(ylabel, **TEXTO_EJE)
+
+    ax.grid(axis='y', alpha=0.25, linestyle='--', linewidth=0.8, color='#BBDEFB')
+    ax.set_axisbelow(True)
+
+    _ocultar_bordes(ax, 'top', 'right')
+    for lado in ('left', 'bottom'):
+        ax.spines[lado].set_color('#90CAF9')
+        ax.spines[lado].set_linewidth(1.5)
+
+    ax.tick_params(axis='x', colors=COLOR_TEXTO, labelsize=10, rotation=45, length=5, width=1.5)
+    ax.tick_params(axis='y', colors=COLOR_TEXTO, labelsize=10, length=5, width=1.5)
+    ax.set_yticks([])
+    ax.set_ylim(0, 108)
+
+    fig.tight_layout()
+    return fig
+
+
+def _arco(ax, desde: float, hasta: float, color: str, linewidth: float, capstyle: str, zorder: int = 2) -> None:
+    """Dibuja el arco del gauge entre dos ángulos (grados)."""
+    theta = np.radians(np.linspace(desde, hasta, 100))
+    ax.plot(np.cos(theta), np.sin(theta), color=color, linewidth=linewidth,
+            solid_capstyle=capstyle, zorder=zorder)
+
+
+def crear_gauge(valor, valor_max, titulo, valor_min=0, ax=None, figsize=(6, 4), verde=80, amarillo=60):
+    """
+    Crea un gráfico tipo reloj (gauge) para visualizar un indicador.
+    Soporta rangos positivos, negativos y mixtos.
+    Para rangos con negativos, crea un velocímetro con segmentos de colores y aguja.
+
+    Parámetros:
+    -----------
+    valor : float
+        Valor actual del indicador
+    valor_max : int
+        Valor máximo posible
+    titulo : str
+        Título del gauge
+    valor_min : int
+        Valor mínimo posible (default: 0)
+    ax : matplotlib.axes.Axes, optional
+        Ejes donde dibujar. Si es None, crea una nueva figura
+    figsize : tuple
+        Tamaño de la figura (solo se usa si ax es None)
+    verde : int
+        Umbral para color verde (en porcentaje desde el mínimo)
+    amarillo : int
+        Umbral para color amarillo (en porcentaje desde el mínimo)
+
+    Returns:
+    --------
+    fig : matplotlib.figure.Figure
+    ax : matplotlib.axes.Axes
+    """
+    if ax is None:
+        fig, ax = nueva_figura(figsize=figsize, nrows=1)
+    else:
+        fig = ax.figure
+        ax.clear()
+
+    rango_total = valor_max - valor_min
+    porcentaje = ((valor - valor_min) / rango_total) * 100
+
+    tiene_negativos = valor_min < 0
+    tiene_positivos = valor_max > 0
+
+    if tiene_negativos and tiene_positivos:
+        # MODO VELOCÍMETRO con segmentos de colores y aguja
+        color_rojo, color_amarillo, color_verde = COLORES_VELOCIMETRO
+
+        angulo_cero = 180 - (abs(valor_min) / rango_total * 180)
+
+        # Rojo: lado negativo; amarillo: hasta el 40% del lado positivo; verde: el resto
+        valor_limite_rojo = 0
+        angulo_limite_rojo = angulo_cero
+        valor_limite_amarillo = valor_max * 0.4
+        angulo_limite_amarillo = 180 - ((valor_limite_amarillo - valor_min) / rango_total * 180)
+
+        ax.plot(*_semicirculo(), color='#E8E8E8', linewidth=25, solid_capstyle='butt', zorder=1)
+        _arco(ax, 180, angulo_limite_rojo, color_rojo, 25, 'butt')
+        _arco(ax, angulo_limite_rojo, angulo_limite_amarillo, color_amarillo, 25, 'butt')
+        _arco(ax, angulo_limite_amarillo, 0, color_verde, 25, 'butt')
+
+        # Aguja
+        angulo_aguja = np.radians(180 - ((valor - valor_min) / rango_total * 180))
+        ax.plot([0, 0.85 * np.cos(angulo_aguja)], [0, 0.85 * np.sin(angulo_aguja)],
+                color=COLOR_TITULO, linewidth=4, solid_capstyle='round', zorder=4)
+        ax.add_patch(mpatches.Circle((0, 0), 0.08, color=COLOR_TITULO, zorder=5))
+
+        # Marca en el 0
+        x_cero = 1.05 * np.cos(np.radians(angulo_cero))
+        y_cero = 1.05 * np.sin(np.radians(angulo_cero))
+        ax.plot([x_cero * 0.88, x_cero * 1.05], [y_cero * 0.88, y_cero * 1.05],
+                color=COLOR_TITULO, linewidth=3, solid_capstyle='round', zorder=3)
+
+        if valor < valor_limite_rojo:
+            color_valor = color_rojo
+        elif valor < valor_limite_amarillo:
+            color_valor = color_amarillo
+        else:
+            color_valor = color_verde
+
+        ax.text(0, 0.5, f'{valor:.0f}', ha='center', va='center',
+                fontsize=30, weight='bold', color=color_valor)
+
+    else:
+        # MODO ORIGINAL para rangos solo positivos o solo negativos
+        if porcentaje >= verde:
+            color_gauge = COLORES_SEMAFORO[0]
+        elif porcentaje >= amarillo:
+            color_gauge = COLORES_SEMAFORO[1]
+        else:
+            color_gauge = COLORES_SEMAFORO[2]
+
+        ax.plot(*_semicirculo(), color='#E0E0E0', linewidth=30, solid_capstyle='round')
+        _arco(ax, 180, 180 - (porcentaje/100) * 180, color_gauge, 30, 'round', zorder=None)
+
+        ax.text(0, 0.15, f'{valor:.0f}%', ha='center', va='center',
+                fontsize=40, weight='bold', color=color_gauge)
+
+    ax.set_xlim(-1.4, 1.4)
+    ax.set_ylim(-0.3, 1.3)
+    ax.set_aspect('equal')
+    ax.axis('off')
+
+    ax.text(-1.19, 0.05, valor_min, **TEXTO_LIMITE_GAUGE)
+    ax.text(1.19, 0.05, valor_max, **TEXTO_LIMITE_GAUGE)
+
+    # Si hay rango mixto, añadir el 0 en el centro
+    if tiene_negativos and tiene_positivos:
+        ax.text(0, 1.15, '0', **dict(TEXTO_LIMITE_GAUGE, fontsize=11))
+
+    ax.text(0, 1.3, titulo, ha='center', va='center', fontsize=16, weight='bold', color=COLOR_TITULO)
+
+    fig.tight_layout()
+    return fig, ax
+
+
+def crear_gauge_barras(df, columna_dimension, columna_valor, columna_max,
+                       titulo='Satisfacción por Dimensión',
+                       figsize_base=(10, 5),
+                       umbrales=(80, 60)
+                       ):
+    """
+    Crea un gráfico de barras tipo gauge para visualizar métricas con valores máximos.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        DataFrame con los datos a visualizar
+    columna_dimension : str
+        Nombre de la columna que contiene las dimensiones/categorías
+    columna_valor : str
+        Nombre de la columna con los valores actuales
+    columna_max : str
+        Nombre de la columna con los valores máximos/objetivo
+    titulo : str, optional
+        Título principal del gráfico (default: 'Satisfacción por Dimensión')
+    figsize_base : tuple, optional
+        Tamaño base de la figura (ancho, alto_por_dimension)
+    umbrales : tuple, optional
+        Umbrales de porcentaje para colores (excelente, bueno) (default: (80, 60))
+
+    Returns:
+    --------
+    fig : matplotlib.figure.Figure
+    """
+    color_fondo = '#EBF5FB'
+    n_dimensiones = len(df)
+    fig, axes = nueva_figura(figsize=(figsize_base[0], n_dimensiones * figsize_base[1]),
+                             nrows=n_dimensiones, squeeze=False)
+    axes = axes[:, 0]
+
+    # Color de cada barra según su porcentaje, para todas las filas a la vez
+    porcentajes = df[columna_valor].to_numpy() / df[columna_max].to_numpy() * 100
+    colores = np.select([porcentajes >= umbrales[0], porcentajes >= umbrales[1]],
+                        COLORES_GAUGE_BARRAS[:2], COLORES_GAUGE_BARRAS[2])
+
+    altura_barra = 0.5
+    filas = df[[columna_dimension, columna_valor, columna_max]].itertuples(index=False, name=None)
+    for idx, (ax, (dimension, valor, valor_max), color_barra) in enumerate(zip(axes, filas, colores)):
+        ax.add_patch(mpatches.FancyBboxPatch(
+            (0, -altura_barra/2), valor_max, altura_barra,
+            boxstyle=mpatches.BoxStyle("Round", pad=0.05),
+            facecolor=color_fondo,
+            edgecolor='#AED6F1',
+            linewidth=1.5,
+            alpha=0.8
+        ))
+        ax.add_patch(mpatches.FancyBboxPatch(
+            (0, -altura_barra/2), valor, altura_barra,
+            boxstyle=mpatches.BoxStyle("Round", pad=0.05),
+            facecolor=color_barra,
+            edgecolor='#5DADE2',
+            linewidth=2
+        ))
+
+        ax.set_xlim(-0.2, valor_max * 1.15)
+        ax.set_ylim(-0.6, 0.6)
+        ax.axis('off')
+
+        ax.text(-0.15, 0.45, dimension,
+                fontsize=13, weight='bold', color='#1B4F72', va='bottom', ha='left')
+
+        # Valor dentro de la barra si cabe, si no al lado
+        if valor > 1.5:
+            pos_x_valor, color_texto_valor = valor / 2, 'black'
+        else:
+            pos_x_valor, color_texto_valor = valor + 0.15, color_barra
+        ax.text(pos_x_valor, 0, f'{valor:.2f}',
+                fontsize=20, weight='bold', color=color_texto_valor,
+                ha='center', va='center')
+
+        if idx < n_dimensiones - 1:
+            ax.axhline(y=-0.55, color='#D6EAF8', linewidth=1, alpha=0.5)
+
+    fig.suptitle(titulo, fontsize=16, weight='bold', color='black', y=0.98)
+    fig.tight_layout()
+    return fig
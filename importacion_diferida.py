@@ -0,0 +1,57 @@
+import importlib
+from types import ModuleType
+
+
+# ============================================================================
+# IMPORTACIÓN DIFERIDA DE DEPENDENCIAS PESADAS
+# ============================================================================
+#
+# pandas, openai, boto3 y matplotlib se llevan la mayor parte del arranque
+# (python -X importtime). Los módulos del proyecto los declaran con
+#
+#     pd = modulo_diferido('pandas')
+#
+# y el import real ocurre en el primer uso de un atributo (pd.DataFrame, ...),
+# así un proceso que solo consulta o solo renderiza no paga por lo que no usa.
+# Las anotaciones de tipo no lo disparan: esos módulos usan
+# `from __future__ import annotations`.
+
+
+class ModuloDiferido:
+    """Representante de un módulo que se importa al acceder al primer atributo."""
+
+    __slots__ = ('_nombre', '_modulo')
+
+    def __init__(self, nombre: str):
+        object.__setattr__(self, '_nombre', nombre)
+        object.__setattr__(self, '_modulo', None)
+
+    def _cargar(self) -> ModuleType:
+        modulo = self._modulo
+        if modulo is None:
+            # import_module es seguro entre hilos (lock de importación por módulo)
+            modulo = importlib.import_module(self._nombre)
+            object.__setattr__(self, '_modulo', modulo)
+        return modulo
+
+    def __getattr__(self, atributo: str):
+        return getattr(self._cargar(), atributo)
+
+    def __setattr__(self, atributo: str, valor) -> None:
+        # Configuración del módulo, p. ej. openai.api_key = ...
+        setattr(self._cargar(), atributo, valor)
+
+    def __repr__(self) -> str:
+        estado = 'importado' if self._modulo is not None else 'sin importar'
+        return f"<módulo diferido '{self._nombre}' ({estado})>"
+
+
+def modulo_diferido(nombre: str) -> ModuleType:
+    """
+    Retorna un representante de `nombre` que lo importa recién en el primer uso.
+
+    Example:
+        >>> boto3 = modulo_diferido('boto3')
+        >>> boto3.client('s3')      # aquí se importa boto3
+    """
+    return ModuloDiferido(nombre)
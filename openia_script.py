@@ -1,30 +1,28 @@
-import pandas as pd
-import openai
-from typing import List, Union, Optional, Dict, Any
+from __future__ import annotations
+
+from typing import List, Union, Optional, Dict, Any, Iterator, Sequence, Callable, Tuple
 import os
 from datetime import datetime
 import json
 import logging
-from dotenv import load_dotenv
-
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+import sqlite3
+import time
+import itertools
+import math
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from contextvars import ContextVar, copy_context
+
+from importacion_diferida import modulo_diferido
+
+# pandas y openai se importan en el primer uso (ver importacion_diferida)
+pd = modulo_diferido('pandas')
+openai = modulo_diferido('openai')
+
+# El logging lo configura quien usa el módulo (p. ej. logging.basicConfig en el Notebook)
 logger = logging.getLogger(__name__)
 
-# Cargar variables de entorno
-load_dotenv()
-
-# Configurar la clave API de OpenAI desde variable de entorno
-openai.api_key = os.getenv("API_KEY")
-
-if not openai.api_key:
-    raise ValueError("API_KEY no encontrada en el archivo .env")
-
-# Lista global para registrar tokens (considera usar un sistema de logging más robusto)
-registro_tokens = []
 
 # Diccionario de precios por modelo (USD por 1M tokens)
 PRECIOS_MODELOS = {
@@ -58,6 +56,16 @@ PRECIOS_MODELOS = {
     'gpt-image-1':                   {'input': 5.00,  'output': 1.25},
 }
 
+# Precio de los tokens de entrada leídos del caché de prompts (USD por 1M tokens).
+# Los modelos que no aparecen se cobran al precio normal de entrada.
+PRECIOS_CACHE = {
+    'gpt-5': 0.125, 'gpt-5-mini': 0.025, 'gpt-5-nano': 0.005,
+    'gpt-4.1': 0.50, 'gpt-4.1-mini': 0.10, 'gpt-4.1-nano': 0.025,
+    'gpt-4o': 1.25, 'gpt-4o-mini': 0.075,
+    'o1': 7.50, 'o3': 0.50, 'o4-mini': 0.275, 'o3-mini': 0.55, 'o1-mini': 0.55,
+    'codex-mini-latest': 0.375,
+}
+
 
 # Prompts del sistema almacenados como constantes
 SYSTEM_PROMPT = """
@@ -99,6 +107,11 @@ Correcto: "La distribución por género muestra una participación del 70% de mu
 
 FORMATO_SALIDA_BASICO = "No uses markdown, solo texto plano. No uses titulos, solo párrafos. No uses emojis. No uses saltos de linea. Porcentajes con 1 decimal."
 
+# Prefijos de PRECIOS_MODELOS, del más largo (más específico) al más corto
+_PREFIJOS_PRECIOS = tuple(sorted(PRECIOS_MODELOS, key=len, reverse=True))
+
+
+@lru_cache(maxsize=None)
 def _detectar_modelo_base(modelo: str) -> str:
     """
     Detecta el modelo base a partir del nombre completo del modelo.
@@ -112,9 +125,8 @@ def _detectar_modelo_base(modelo: str) -> str:
     if modelo in PRECIOS_MODELOS:
         return modelo
 
-    # Buscar coincidencia parcial ordenada por longitud (más específico primero)
-    modelos_ordenados = sorted(PRECIOS_MODELOS.keys(), key=len, reverse=True)
-    for key in modelos_ordenados:
+    # Buscar coincidencia parcial (más específico primero)
+    for key in _PREFIJOS_PRECIOS:
         if modelo.startswith(key):
             return key
 
@@ -122,87 +134,425 @@ def _detectar_modelo_base(modelo: str) -> str:
     return modelo
 
 
+# ============================================================================
+# ENRUTAMIENTO DE MODELOS
+# ============================================================================
+
+# Con modelo='auto' el modelo se elige por tarea y tamaño estimado del prompt
+MODELO_AUTOMATICO = "auto"
+
+# Por política y tarea: candidatos (modelo, máximo de tokens de entrada estimados)
+# del más barato al más capaz; None = sin límite. Las secciones sin ruta propia
+# ('introduccion', 'resumen', 'observacion', 'conclusion') usan la de 'seccion';
+# 'sintesis' es insight_list.
+POLITICAS_MODELOS: Dict[str, Dict[str, Any]] = {
+    'economica': {
+        'timeout': 60,
+        'seccion': [('gpt-4.1-nano', 8000), ('gpt-4o-mini', 40000), ('gpt-4.1-mini', None)],
+        'sintesis': [('gpt-4.1-mini', 60000), ('gpt-4.1', None)],
+    },
+    'rapida': {
+        'timeout': 20,
+        'seccion': [('gpt-4.1-nano', 30000), ('gpt-4.1-mini', None)],
+        'sintesis': [('gpt-4.1-mini', None), ('gpt-4o-mini', None)],
+    },
+    'calidad': {
+        'timeout': 120,
+        'seccion': [('gpt-4.1-mini', 60000), ('gpt-4.1', None)],
+        'sintesis': [('gpt-4.1', None), ('gpt-4o', None)],
+    },
+}
+
+_politica_modelos = 'economica'
+
+
+def configurar_enrutamiento(politica: str = 'economica') -> None:
+    """Cambia la política de POLITICAS_MODELOS usada con modelo='auto'."""
+    global _politica_modelos
+    if politica not in POLITICAS_MODELOS:
+        raise ValueError(f"Política debe ser una de: {', '.join(POLITICAS_MODELOS)}")
+    _politica_modelos = politica
+
+
+def estimar_tokens(texto: str) -> int:
+    """Tokens aproximados de un texto (~4 caracteres por token)."""
+    return math.ceil(len(texto) / 4)
+
+
+def elegir_modelos(prompt: str, tarea: str = 'seccion') -> Tuple[List[str], Optional[float]]:
+    """
+    Modelos candidatos para un prompt según la política actual.
+
+    El primero es el más barato cuyo límite admite el tamaño estimado del prompt;
+    los siguientes (más capaces) quedan como respaldo ante errores o timeouts.
+
+    Returns:
+        (candidatos, timeout en segundos de cada intento)
+    """
+    politica = POLITICAS_MODELOS[_politica_modelos]
+    rutas = politica.get(tarea, politica['seccion'])
+    tokens = estimar_tokens(prompt)
+
+    inicio = next((i for i, (_, limite) in enumerate(rutas) if limite is None or tokens <= limite),
+                  len(rutas) - 1)
+    candidatos = [modelo for modelo, _ in rutas[inicio:]]
+    logger.info(f"Enrutamiento ({_politica_modelos}, {tarea}, ~{tokens} tokens): {' -> '.join(candidatos)}")
+    return candidatos, politica.get('timeout')
+
+
+def _modelos_para(modelo: str, prompt: str, tarea: str) -> Tuple[List[str], Optional[float]]:
+    if modelo == MODELO_AUTOMATICO:
+        return elegir_modelos(prompt, tarea)
+    return [modelo], None
+
+
+# ============================================================================
+# REGISTRO DE USO DE TOKENS
+# ============================================================================
+
+_ESQUEMA_REGISTRO = """
+CREATE TABLE IF NOT EXISTS llamadas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha_hora TEXT NOT NULL,
+    ejecucion_id TEXT NOT NULL,
+    proyecto TEXT,
+    modelo TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    costo_usd REAL NOT NULL,
+    cached_tokens INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llamadas_ejecucion ON llamadas (ejecucion_id);
+CREATE INDEX IF NOT EXISTS idx_llamadas_fecha ON llamadas (fecha_hora);
+"""
+
+# Agrupaciones disponibles en RegistroTokens.resumen()
+_AGRUPACIONES_REGISTRO = {
+    'dia': "substr(fecha_hora, 1, 10)",
+    'mes': "substr(fecha_hora, 1, 7)",
+    'modelo': "modelo",
+    'proyecto': "coalesce(proyecto, '')",
+    'ejecucion': "ejecucion_id",
+}
+
+
+class RegistroTokens:
+    """
+    Registro de uso de tokens en SQLite (modo WAL), solo de inserción.
+
+    Cada llamada agrega una fila (una sola sentencia INSERT), así que varios hilos
+    o procesos pueden registrar a la vez sin leer ni reescribir el archivo. Las
+    filas llevan la ejecución y el proyecto en curso; los costos se agregan con
+    consultas (resumen) sin tocar los datos.
+
+    Ejemplo:
+        >>> with proyecto_actual('72'):
+        ...     analyze_dataframe(df, seccion='resumen')
+        >>> registro.resumen(por=('dia', 'modelo'))
+    """
+
+    def __init__(self, ruta: str = 'registro_tokens.sqlite'):
+        self.ruta = ruta
+        self._inicializado = False
+
+    def _conectar(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.ruta, timeout=30)
+        if not self._inicializado:
+            # El archivo se crea con la primera llamada registrada, no al importar
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_ESQUEMA_REGISTRO)
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(llamadas)")}
+            if 'cached_tokens' not in columnas:
+                con.execute("ALTER TABLE llamadas ADD COLUMN cached_tokens INTEGER NOT NULL DEFAULT 0")
+            self._inicializado = True
+        return con
+
+    def registrar(self, modelo: str, input_tokens: int, output_tokens: int, costo_usd: float,
+                  proyecto: Optional[str] = None, ejecucion_id: Optional[str] = None,
+                  cached_tokens: int = 0) -> None:
+        """Agrega una llamada al registro (por defecto con la ejecución y proyecto en curso)."""
+        fila = (
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            ejecucion_id or _ejecucion_actual.get(),
+            proyecto if proyecto is not None else _proyecto_actual.get(),
+            modelo, int(input_tokens), int(output_tokens), float(costo_usd), int(cached_tokens),
+        )
+        with closing(self._conectar()) as con, con:
+            con.execute(
+                "INSERT INTO llamadas (fecha_hora, ejecucion_id, proyecto, modelo, input_tokens, "
+                "output_tokens, costo_usd, cached_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", fila
+            )
+
+    def resumen(self, por: Union[str, Sequence[str]] = ('ejecucion',), ejecucion_id: Optional[str] = None,
+                proyecto: Optional[str] = None, desde: Optional[str] = None) -> pd.DataFrame:
+        """
+        Tokens, costo y número de llamadas agrupados en SQL.
+
+        Args:
+            por: Agrupación (una columna o una lista), cualquier combinación de 'dia', 'mes',
+                'modelo', 'proyecto', 'ejecucion'.
+            ejecucion_id: Filtrar una ejecución.
+            proyecto: Filtrar un proyecto.
+            desde: Fecha mínima 'YYYY-MM-DD'.
+
+        Returns:
+            pd.DataFrame: Una fila por grupo con input_tokens, output_tokens, cached_tokens,
+            costo_usd, num_llamadas, fecha_inicio y fecha_fin.
+        """
+        if isinstance(por, str):
+            por = [por]
+        invalidas = set(por) - set(_AGRUPACIONES_REGISTRO)
+        if invalidas:
+            raise ValueError(f"Agrupación no soportada: {sorted(invalidas)}. Use {list(_AGRUPACIONES_REGISTRO)}")
+
+        columnas = [f"{_AGRUPACIONES_REGISTRO[c]} AS {c}" for c in por]
+        filtros, params = [], []
+        for condicion, valor in (("ejecucion_id = ?", ejecucion_id), ("proyecto = ?", proyecto),
+                                 ("fecha_hora >= ?", desde)):
+            if valor is not None:
+                filtros.append(condicion)
+                params.append(str(valor))
+
+        sql = f"""
+            SELECT {', '.join(columnas + [''])}
+                   sum(input_tokens) AS input_tokens,
+                   sum(output_tokens) AS output_tokens,
+                   sum(cached_tokens) AS cached_tokens,
+                   sum(costo_usd) AS costo_usd,
+                   count(*) AS num_llamadas,
+                   min(fecha_hora) AS fecha_inicio,
+                   max(fecha_hora) AS fecha_fin
+            FROM llamadas
+            {'WHERE ' + ' AND '.join(filtros) if filtros else ''}
+            {'GROUP BY ' + ', '.join(str(i) for i in range(1, len(por) + 1)) if por else ''}
+            ORDER BY fecha_inicio
+        """
+        with closing(self._conectar()) as con:
+            return pd.read_sql_query(sql, con, params=params)
+
+
+_ejecucion_actual: ContextVar[str] = ContextVar(
+    'ejecucion_actual', default=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+)
+_proyecto_actual: ContextVar[Optional[str]] = ContextVar('proyecto_actual', default=None)
+
+registro = RegistroTokens()
+
+
+def iniciar_ejecucion(ejecucion_id: Optional[str] = None, proyecto=None) -> str:
+    """
+    Inicia una nueva ejecución: las llamadas siguientes se registran con su id
+    (y con el proyecto, si se indica).
+
+    Returns:
+        str: El id de la ejecución.
+    """
+    ejecucion_id = ejecucion_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    _ejecucion_actual.set(ejecucion_id)
+    if proyecto is not None:
+        _proyecto_actual.set(str(proyecto))
+    return ejecucion_id
+
+
+@contextmanager
+def proyecto_actual(proyecto) -> Iterator[None]:
+    """Registra las llamadas hechas dentro del bloque con el proyecto indicado."""
+    token = _proyecto_actual.set(str(proyecto))
+    try:
+        yield
+    finally:
+        _proyecto_actual.reset(token)
+
+
 def guardar_registro_tokens(archivo: str = "registro_tokens.csv") -> None:
     """
-    Guarda un RESUMEN agregado por ejecución en un archivo CSV.
-    Escribe SOLO una fila total por ejecución (sin filas parciales por modelo).
+    Anexa al CSV el RESUMEN de la ejecución en curso (una fila por ejecución) e
+    inicia una ejecución nueva, así cada llamada queda en una sola fila del CSV.
+    Solo agrega una línea: no lee ni reescribe el archivo.
 
     Args:
         archivo (str): Nombre del archivo donde guardar el registro.
     """
     try:
-        df_detalle = pd.DataFrame(registro_tokens)
-        if df_detalle.empty:
+        ejecucion_id = _ejecucion_actual.get()
+        df_resumen = registro.resumen(por=(), ejecucion_id=ejecucion_id)
+        if df_resumen.empty or not df_resumen['num_llamadas'].iloc[0]:
             logger.info("No hay registros de tokens para guardar.")
             return
 
-        # Normalizar fechas
-        if 'fecha_hora' in df_detalle.columns:
-            df_detalle['fecha_hora'] = pd.to_datetime(df_detalle['fecha_hora'], errors='coerce')
-
-        # Identificador de ejecución y ventana temporal
-        ejecucion_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-        fecha_inicio = (
-            df_detalle['fecha_hora'].min().strftime('%Y-%m-%d %H:%M:%S')
-            if 'fecha_hora' in df_detalle.columns and df_detalle['fecha_hora'].notna().any()
-            else None
-        )
-        fecha_fin = (
-            df_detalle['fecha_hora'].max().strftime('%Y-%m-%d %H:%M:%S')
-            if 'fecha_hora' in df_detalle.columns and df_detalle['fecha_hora'].notna().any()
-            else None
-        )
-
         # Etiqueta de modelo: único si hay uno; si hay varios, listar separados por coma
-        modelos_unicos = sorted(df_detalle['modelo'].dropna().astype(str).unique())
-        modelo_label = modelos_unicos[0] if len(modelos_unicos) == 1 else ",".join(modelos_unicos)
-
-        # Fila total ÚNICA por ejecución
-        df_resumen = pd.DataFrame([
-            {
-                'modelo': modelo_label,
-                'input_tokens': int(df_detalle['input_tokens'].sum()),
-                'output_tokens': int(df_detalle['output_tokens'].sum()),
-                'costo_usd': float(df_detalle['costo_usd'].sum()),
-                'num_llamadas': int(df_detalle.shape[0]),
-                'ejecucion_id': ejecucion_id,
-                'fecha_inicio': fecha_inicio,
-                'fecha_fin': fecha_fin,
-            }
-        ])
-
-        # Persistir: anexar al archivo de resúmenes
-        if os.path.exists(archivo):
-            df_existente = pd.read_csv(archivo)
-            df_final = pd.concat([df_existente, df_resumen], ignore_index=True)
-        else:
-            df_final = df_resumen
-
-        df_final.to_csv(archivo, index=False)
+        modelos_unicos = registro.resumen(por=('modelo',), ejecucion_id=ejecucion_id)['modelo']
+        df_resumen.insert(0, 'modelo', ",".join(sorted(modelos_unicos)))
+        df_resumen['ejecucion_id'] = ejecucion_id
+        df_resumen = df_resumen[['modelo', 'input_tokens', 'output_tokens', 'costo_usd', 'num_llamadas',
+                                 'ejecucion_id', 'fecha_inicio', 'fecha_fin']]
+
+        df_resumen.to_csv(archivo, mode='a', header=not os.path.exists(archivo), index=False)
+        iniciar_ejecucion()
         logger.info(f"Resumen de tokens (por ejecución) guardado en {archivo} con ejecucion_id={ejecucion_id}")
     except Exception as e:
         logger.error(f"Error al guardar registro de tokens: {str(e)}")
 
 
+# ============================================================================
+# LLAMADAS AL MODELO
+# ============================================================================
+
+# Cliente con la interfaz de openai (chat.completions, files, batches). Por
+# defecto el módulo openai; configurar_transporte() permite usar otro, p. ej.
+# uno apuntando a servidor_llm_simulado para pruebas de carga.
+_cliente = openai
+
+
+def configurar_transporte(cliente=None, base_url: Optional[str] = None, **opciones: Any) -> None:
+    """
+    Cambia el cliente usado para las llamadas y los lotes.
+
+    Args:
+        cliente: Objeto con la interfaz de openai. Sin cliente ni base_url se
+            vuelve al módulo openai (API real, con API_KEY).
+        base_url: Crea un openai.OpenAI contra esa URL (la clave puede faltar).
+        **opciones: Parámetros extra de openai.OpenAI (max_retries, timeout, ...).
+
+    Example:
+        >>> servidor = servidor_llm_simulado.iniciar_servidor(tasa_429=0.05)
+        >>> configurar_transporte(base_url=servidor.url, max_retries=5)
+    """
+    global _cliente
+    if cliente is None and base_url is not None:
+        cliente = openai.OpenAI(base_url=base_url, api_key=_clave_api() or "local", **opciones)
+    _cliente = cliente if cliente is not None else openai
+
+
+@lru_cache(maxsize=None)
+def _cargar_entorno() -> None:
+    """Lee el archivo .env una sola vez, recién cuando se necesita una variable."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def _clave_api() -> Optional[str]:
+    _cargar_entorno()
+    return os.getenv("API_KEY")
+
+
+def _api():
+    """Cliente actual; con el módulo openai toma API_KEY del entorno (.env) en el primer uso."""
+    if _cliente is openai and not openai.api_key:
+        openai.api_key = _clave_api()
+        if not openai.api_key:
+            raise ValueError("API_KEY no encontrada en el archivo .env")
+    return _cliente
+
+
+# Reserva de tokens antes de cada llamada (p. ej. el límite por minuto compartido de
+# cola_informes); recibe los tokens estimados y bloquea hasta que haya cupo
+_limite_tokens: Optional[Callable[[int], None]] = None
+
+
+def configurar_limite_tokens(reservar: Optional[Callable[[int], None]]) -> None:
+    """Instala (o quita, con None) la función que reserva tokens antes de cada llamada."""
+    global _limite_tokens
+    _limite_tokens = reservar
+
+
+def _reservar_tokens(kwargs: Dict[str, Any]) -> None:
+    if _limite_tokens is None:
+        return
+    entrada = sum(estimar_tokens(str(m.get("content", ""))) for m in kwargs["messages"])
+    salida = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 0
+    _limite_tokens(entrada + salida)
+
+
+def _campo(objeto, nombre: str, default=None):
+    """Lee un campo de la respuesta, sea objeto del SDK o dict (resultados de lotes)."""
+    if objeto is None:
+        return default
+    if isinstance(objeto, dict):
+        return objeto.get(nombre, default)
+    return getattr(objeto, nombre, default)
+
+
+def _registrar_uso(modelo: str, usage, factor_precio: float = 1.0, **registro_kwargs: Any) -> float:
+    """Calcula el costo de una llamada, la anota en el registro y retorna el costo."""
+    input_tokens = _campo(usage, 'prompt_tokens', 0)
+    output_tokens = _campo(usage, 'completion_tokens', 0)
+    cached_tokens = _campo(_campo(usage, 'prompt_tokens_details'), 'cached_tokens') or 0
+
+    modelo_base = _detectar_modelo_base(modelo)
+    precios = PRECIOS_MODELOS.get(modelo_base, {'input': 0, 'output': 0})
+    precio_cache = PRECIOS_CACHE.get(modelo_base, precios['input'])
+
+    cost_usd = factor_precio * ((input_tokens - cached_tokens) * precios['input'] + cached_tokens * precio_cache
+                                + output_tokens * precios['output']) / 1000000
+
+    registro.registrar(modelo, input_tokens, output_tokens, cost_usd, cached_tokens=cached_tokens,
+                       **registro_kwargs)
+
+    logger.info(f"Tokens usados - Input: {input_tokens} (caché: {cached_tokens}), "
+                f"Output: {output_tokens}, Costo: ${cost_usd:.6f}")
+    return cost_usd
+
+
+def _argumentos_llamada(prompt: str, modelo: str, max_tokens: int, temperature: float,
+                        system_prompt: str, response_format: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Cuerpo de la petición a chat.completions según el modelo."""
+    kwargs = {
+        "model": modelo,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+    }
+
+    # Modelos GPT-5 usan 'max_completion_tokens'
+    if modelo.startswith("gpt-5"):
+        kwargs["max_completion_tokens"] = max_tokens
+
+        # Algunos GPT-5 (como gpt-5-nano) no aceptan temperatura personalizada
+        if not modelo.endswith("nano"):
+            kwargs["temperature"] = temperature
+    else:
+        # Modelos anteriores (GPT-4 y 4o)
+        kwargs["max_tokens"] = max_tokens
+        kwargs["temperature"] = temperature
+
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    return kwargs
+
+
 def call_gpt(
     prompt: str,
     modelo: str = "gpt-4o-mini",
     max_tokens: int = 1500,
     temperature: float = 0.5,
-    system_prompt: Optional[str] = None
+    system_prompt: Optional[str] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    al_recibir: Optional[Callable[[str], None]] = None,
+    tarea: str = 'seccion'
 ) -> str:
     """
     Llama a la API de OpenAI. Por defecto usa gpt-4o-mini.
 
+    Con modelo='auto' el modelo lo elige elegir_modelos() según `tarea` y el
+    tamaño del prompt; si la llamada falla o supera el timeout de la política se
+    reintenta con el siguiente candidato (en streaming, solo si aún no llegó texto).
+
     Args:
         prompt (str): Texto del prompt a enviar.
-        modelo (str): Modelo de OpenAI a utilizar.
+        modelo (str): Modelo de OpenAI a utilizar, o 'auto'.
         max_tokens (int): Máximo de tokens en la respuesta.
         temperature (float): Control de creatividad (0.0-1.0).
         system_prompt (Optional[str]): Prompt del sistema personalizado.
+        response_format (Optional[Dict]): Formato de respuesta (p. ej. json_schema).
+        al_recibir (Optional[Callable]): Si se indica, la respuesta se recibe en
+            streaming y se llama con cada fragmento de texto a medida que llega.
+        tarea (str): Tipo de tarea para el enrutamiento (ver POLITICAS_MODELOS).
 
     Returns:
-        str: Respuesta del modelo.
+        str: Respuesta del modelo. Dentro de LoteLLM.recolectar(), un Future que
+        se completa cuando el lote termina.
 
     Raises:
         ValueError: Si el prompt está vacío.
@@ -213,64 +563,374 @@ def call_gpt(
     if system_prompt is None:
         system_prompt = SYSTEM_PROMPT
 
-    try:
-    # Preparar argumentos para la llamada según el modelo
-        kwargs = {
-            "model": modelo,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+    candidatos, timeout = _modelos_para(modelo, prompt + system_prompt, tarea)
+
+    # Dentro de LoteLLM.recolectar() la llamada se encola para el lote
+    lote = _lote_actual.get()
+    if lote is not None:
+        return lote.agregar(_argumentos_llamada(prompt, candidatos[0], max_tokens, temperature,
+                                                system_prompt, response_format))
+
+    for i, modelo in enumerate(candidatos):
+        kwargs = _argumentos_llamada(prompt, modelo, max_tokens, temperature, system_prompt, response_format)
+        recibido = False
+        try:
+            _reservar_tokens(kwargs)
+            # Llamada a la API
+            if al_recibir is None:
+                response = _api().chat.completions.create(**kwargs, **_opciones_llamada(timeout))
+                result = response.choices[0].message.content.strip()
+                usage = response.usage
+            else:
+                partes = []
+                for parte in _transmitir(kwargs, timeout):
+                    recibido = True
+                    partes.append(parte)
+                    al_recibir(parte)
+                return ''.join(partes).strip()
+
+            _registrar_uso(modelo, usage)
+            return result
+
+        except openai.OpenAIError as e:
+            if i + 1 < len(candidatos) and not recibido:
+                logger.warning(f"Falló {modelo} ({str(e)}); se reintenta con {candidatos[i + 1]}")
+                continue
+            logger.error(f"Error en la API de OpenAI: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error inesperado: {str(e)}")
+            raise
+
+
+def _opciones_llamada(timeout: Optional[float]) -> Dict[str, Any]:
+    """Opciones del cliente que no van en el cuerpo de la petición (no aplican a lotes)."""
+    return {"timeout": timeout} if timeout is not None else {}
+
+
+def _transmitir(kwargs: Dict[str, Any], timeout: Optional[float] = None) -> Iterator[str]:
+    """Hace la llamada en streaming, entrega cada fragmento y registra el uso al final."""
+    kwargs = dict(kwargs, stream=True, stream_options={"include_usage": True})
+    usage = None
+    for chunk in _api().chat.completions.create(**kwargs, **_opciones_llamada(timeout)):
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+    _registrar_uso(kwargs["model"], usage)
+
+
+def call_gpt_stream(
+    prompt: str,
+    modelo: str = "gpt-4o-mini",
+    max_tokens: int = 1500,
+    temperature: float = 0.5,
+    system_prompt: Optional[str] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    tarea: str = 'seccion'
+) -> Iterator[str]:
+    """
+    Como call_gpt, pero entrega la respuesta por fragmentos a medida que llega.
+
+    El uso de tokens se registra al terminar de recorrer el generador. Con
+    modelo='auto' se pasa al siguiente candidato solo si falla antes del primer
+    fragmento.
+
+    Example:
+        >>> for parte in call_gpt_stream("Resume estos datos: ..."):
+        ...     print(parte, end="")
+
+    Raises:
+        ValueError: Si el prompt está vacío.
+        RuntimeError: Dentro de LoteLLM.recolectar() (los lotes no admiten streaming).
+    """
+    if not prompt or not prompt.strip():
+        raise ValueError("El prompt no puede estar vacío")
+    if _lote_actual.get() is not None:
+        raise RuntimeError("Dentro de un lote no hay streaming: use call_gpt (retorna un Future)")
+
+    if system_prompt is None:
+        system_prompt = SYSTEM_PROMPT
+
+    candidatos, timeout = _modelos_para(modelo, prompt + system_prompt, tarea)
+    for i, modelo in enumerate(candidatos):
+        kwargs = _argumentos_llamada(prompt, modelo, max_tokens, temperature, system_prompt, response_format)
+        recibido = False
+        try:
+            _reservar_tokens(kwargs)
+            for parte in _transmitir(kwargs, timeout):
+                recibido = True
+                yield parte
+            return
+        except openai.OpenAIError as e:
+            if i + 1 < len(candidatos) and not recibido:
+                logger.warning(f"Falló {modelo} ({str(e)}); se reintenta con {candidatos[i + 1]}")
+                continue
+            logger.error(f"Error en la API de OpenAI: {str(e)}")
+            raise
+
+
+# ============================================================================
+# LLAMADAS EN SEGUNDO PLANO
+# ============================================================================
+
+# Llamadas al modelo que pueden estar en curso a la vez mientras se arma el informe
+MAX_LLAMADAS_CONCURRENTES = 4
+
+_ejecutor: Optional[ThreadPoolExecutor] = None
+
+
+def en_segundo_plano(funcion: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """
+    Ejecuta funcion(*args, **kwargs) en un hilo aparte y retorna su Future.
+
+    El hilo hereda el contexto actual (proyecto, ejecución y contexto compartido
+    del prompt), así el registro de tokens queda atribuido igual que una llamada
+    directa.
+    """
+    global _ejecutor
+    if _ejecutor is None:
+        _ejecutor = ThreadPoolExecutor(max_workers=MAX_LLAMADAS_CONCURRENTES, thread_name_prefix="llm")
+    return _ejecutor.submit(copy_context().run, funcion, *args, **kwargs)
+
+
+# ============================================================================
+# LOTES (envío diferido para corridas de fin de mes)
+# ============================================================================
+
+# Los lotes se cobran a la mitad del precio normal
+DESCUENTO_LOTE = 0.5
+
+_lote_actual: ContextVar[Optional['LoteLLM']] = ContextVar('lote_actual', default=None)
+
+
+def _encadenar(futuro: Future, funcion: Callable[[Any], Any]) -> Future:
+    """Future con funcion(resultado) aplicada cuando `futuro` se complete."""
+    derivado = Future()
+
+    def _al_terminar(f: Future) -> None:
+        try:
+            derivado.set_result(funcion(f.result()))
+        except Exception as e:
+            derivado.set_exception(e)
+
+    futuro.add_done_callback(_al_terminar)
+    return derivado
+
+
+class LoteLLM:
+    """
+    Junta las llamadas de uno o varios informes y las envía como lotes (Batch API).
+
+    Dentro de recolectar(), analyze_dataframe / insight_list / call_gpt no llaman
+    a la API: encolan la petición y retornan un Future. ejecutar() arma un JSONL
+    por modelo, lo sube, espera a que el proveedor termine y completa cada Future
+    por su custom_id. El costo se registra con DESCUENTO_LOTE.
+
+    Example:
+        >>> lote = LoteLLM()
+        >>> with lote.recolectar():
+        ...     for p in proyectos:
+        ...         with proyecto_actual(p):
+        ...             textos[p] = analyze_dataframe(resumenes[p], seccion='resumen')
+        >>> lote.ejecutar()
+        >>> textos['72'].result()
+    """
+
+    ENDPOINT = "/v1/chat/completions"
+    ESTADOS_FINALES = ('completed', 'failed', 'expired', 'cancelled')
+
+    def __init__(self, intervalo_consulta: float = 30, ventana: str = "24h"):
+        """
+        Args:
+            intervalo_consulta: Segundos entre consultas del estado de los lotes.
+            ventana: Ventana de completado del lote (la que acepte el proveedor).
+        """
+        self.intervalo_consulta = intervalo_consulta
+        self.ventana = ventana
+        self.lotes: Dict[str, List[str]] = {}
+        self._peticiones: Dict[str, Dict[str, Any]] = {}
+        self._futuros: Dict[str, Future] = {}
+        self._contador = itertools.count(1)
+
+    @contextmanager
+    def recolectar(self) -> Iterator['LoteLLM']:
+        """Encola en este lote las llamadas hechas dentro del bloque."""
+        token = _lote_actual.set(self)
+        try:
+            yield self
+        finally:
+            _lote_actual.reset(token)
+
+    def agregar(self, cuerpo: Dict[str, Any]) -> Future:
+        """Encola el cuerpo de una petición a chat.completions; retorna su Future."""
+        proyecto = _proyecto_actual.get()
+        custom_id = f"{proyecto or 'general'}-{next(self._contador)}"
+        self._peticiones[custom_id] = {
+            'cuerpo': cuerpo, 'proyecto': proyecto, 'ejecucion_id': _ejecucion_actual.get(),
         }
+        self._futuros[custom_id] = Future()
+        return self._futuros[custom_id]
+
+    def enviar(self) -> List[str]:
+        """Sube un archivo JSONL y crea un lote por modelo. Retorna los ids de lote."""
+        por_modelo: Dict[str, List[str]] = {}
+        for custom_id, peticion in self._peticiones.items():
+            if not any(custom_id in ids for ids in self.lotes.values()):
+                por_modelo.setdefault(peticion['cuerpo']['model'], []).append(custom_id)
+
+        nuevos = []
+        for modelo, ids in por_modelo.items():
+            lineas = (
+                json.dumps({"custom_id": custom_id, "method": "POST", "url": self.ENDPOINT,
+                            "body": self._peticiones[custom_id]['cuerpo']}, ensure_ascii=False)
+                for custom_id in ids
+            )
+            archivo = _api().files.create(file=("lote.jsonl", "\n".join(lineas).encode("utf-8")),
+                                            purpose="batch")
+            lote = _api().batches.create(input_file_id=archivo.id, endpoint=self.ENDPOINT,
+                                           completion_window=self.ventana)
+            self.lotes[lote.id] = ids
+            nuevos.append(lote.id)
+            logger.info(f"Lote {lote.id} enviado: {len(ids)} peticiones ({modelo})")
+        return nuevos
+
+    def esperar(self, timeout: Optional[float] = None) -> None:
+        """
+        Consulta los lotes hasta que terminen y completa los Futures.
+
+        Raises:
+            TimeoutError: Si se supera `timeout` (los lotes siguen en curso y se
+                puede volver a llamar a esperar()).
+        """
+        inicio = time.monotonic()
+        pendientes = [lote_id for lote_id, ids in self.lotes.items()
+                      if not all(self._futuros[i].done() for i in ids)]
+        while pendientes:
+            for lote_id in list(pendientes):
+                lote = _api().batches.retrieve(lote_id)
+                if lote.status in self.ESTADOS_FINALES:
+                    self._procesar(lote)
+                    pendientes.remove(lote_id)
+            if not pendientes:
+                break
+            if timeout is not None and time.monotonic() - inicio > timeout:
+                raise TimeoutError(f"Lotes sin terminar: {', '.join(pendientes)}")
+            time.sleep(self.intervalo_consulta)
+
+    def ejecutar(self, timeout: Optional[float] = None) -> 'LoteLLM':
+        """Envía las peticiones pendientes y espera sus resultados."""
+        self.enviar()
+        self.esperar(timeout)
+        return self
+
+    def _procesar(self, lote) -> None:
+        for archivo_id in (lote.output_file_id, lote.error_file_id):
+            if not archivo_id:
+                continue
+            for linea in _api().files.content(archivo_id).text.splitlines():
+                if linea.strip():
+                    self._resolver(json.loads(linea))
+
+        for custom_id in self.lotes[lote.id]:
+            futuro = self._futuros[custom_id]
+            if not futuro.done():
+                futuro.set_exception(RuntimeError(f"Lote {lote.id} terminó ({lote.status}) sin resultado para {custom_id}"))
+        logger.info(f"Lote {lote.id} procesado ({lote.status})")
+
+    def _resolver(self, resultado: Dict[str, Any]) -> None:
+        custom_id = resultado.get("custom_id")
+        futuro = self._futuros.get(custom_id)
+        if futuro is None or futuro.done():
+            return
 
-        # Modelos GPT-5 usan 'max_completion_tokens'
-        if modelo.startswith("gpt-5"):
-            kwargs["max_completion_tokens"] = max_tokens
+        respuesta = resultado.get("response") or {}
+        if resultado.get("error") or respuesta.get("status_code") != 200:
+            error = resultado.get("error") or respuesta.get("body", {}).get("error")
+            futuro.set_exception(RuntimeError(f"Petición {custom_id} falló: {error}"))
+            return
 
-            # Algunos GPT-5 (como gpt-5-nano) no aceptan temperatura personalizada
-            if not modelo.endswith("nano"):
-                kwargs["temperature"] = temperature
-        else:
-            # Modelos anteriores (GPT-4 y 4o)
-            kwargs["max_tokens"] = max_tokens
-            kwargs["temperature"] = temperature
+        cuerpo = respuesta["body"]
+        peticion = self._peticiones[custom_id]
+        _registrar_uso(cuerpo.get("model", peticion['cuerpo']['model']), cuerpo.get("usage"), DESCUENTO_LOTE,
+                       proyecto=peticion['proyecto'], ejecucion_id=peticion['ejecucion_id'])
+        futuro.set_result(cuerpo["choices"][0]["message"]["content"].strip())
 
-        # Llamada a la API
-        response = openai.chat.completions.create(**kwargs)
 
-        result = response.choices[0].message.content.strip()
+# ============================================================================
+# CONTEXTO COMPARTIDO (prefijo estable para el caché de prompts)
+# ============================================================================
+#
+# El proveedor reutiliza el prefijo de prompts que ya vio (system + inicio del
+# mensaje de usuario). Por eso cada prompt empieza por lo que es igual en todas
+# las llamadas de un informe: el contexto del proyecto y el formato de salida;
+# la sección, sus datos y la tarea van al final.
 
-        # Registrar uso de tokens
-        usage = response.usage
-        input_tokens = usage.prompt_tokens
-        output_tokens = usage.completion_tokens
+_contexto_compartido: ContextVar[str] = ContextVar('contexto_compartido', default='')
 
-        modelo_base = _detectar_modelo_base(modelo)
-        precios = PRECIOS_MODELOS.get(modelo_base, {'input': 0, 'output': 0})
 
-        cost_usd = (input_tokens * precios['input'] + output_tokens * precios['output']) / 1000000
+def _datos_a_json(datos: Union[pd.DataFrame, Dict, List[Dict], List]) -> str:
+    """
+    Serializa los datos a JSON de forma determinista (mismo texto para los mismos datos).
 
-        registro_tokens.append({
-            'fecha_hora': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'modelo': modelo,
-            'input_tokens': input_tokens,
-            'output_tokens': output_tokens,
-            'costo_usd': cost_usd,
-        })
+    Raises:
+        ValueError: Si los datos están vacíos o el tipo no es válido.
+    """
+    # CASO 1: Es un DataFrame
+    if isinstance(datos, pd.DataFrame):
+        if datos.empty:
+            raise ValueError("El DataFrame está vacío. No hay datos para analizar.")
+        try:
+            json_str = datos.to_json(orient="records", lines=False, force_ascii=False)
+        except Exception as e:
+            raise ValueError(f"Error al convertir DataFrame a JSON: {str(e)}")
 
-        logger.info(f"Tokens usados - Input: {input_tokens}, Output: {output_tokens}, Costo: ${cost_usd:.6f}")
+    # CASO 2: Es una lista
+    elif isinstance(datos, list):
+        if len(datos) == 0:
+            raise ValueError("La lista está vacía. No hay información para analizar.")
+        try:
+            json_str = json.dumps(datos, ensure_ascii=False, default=str)
+        except Exception as e:
+            raise ValueError(f"Error al convertir lista a JSON: {str(e)}")
 
-        return result
+    # CASO 3: Es un diccionario (puede ser biblioteca o dict simple)
+    elif isinstance(datos, dict):
+        if len(datos) == 0:
+            raise ValueError("El diccionario está vacío. No hay información para analizar.")
+        try:
+            json_str = json.dumps(datos, ensure_ascii=False, indent=2, default=str)
+        except Exception as e:
+            raise ValueError(f"Error al convertir diccionario a JSON: {str(e)}")
 
-    except openai.OpenAIError as e:
-        logger.error(f"Error en la API de OpenAI: {str(e)}")
-        raise
-    except Exception as e:
-        logger.error(f"Error inesperado: {str(e)}")
-        raise
+    else:
+        raise ValueError("El argumento debe ser un DataFrame, diccionario o lista de diccionarios.")
+
+    # Validar que tengamos datos
+    if not json_str or json_str in ["{}", "[]", "null"]:
+        raise ValueError("Los datos están vacíos. No hay información para analizar.")
+    return json_str
+
+
+def establecer_contexto_proyecto(datos: Union[pd.DataFrame, Dict, List, None], descripcion: str = "") -> str:
+    """
+    Fija el contexto del proyecto que encabeza todos los prompts siguientes
+    (analyze_dataframe e insight_list), en lugar de reenviarlo en cada sección.
+
+    Args:
+        datos: Metadatos del proyecto (p. ej. resumen_proyecto + df_proyectos). None lo borra.
+        descripcion: Texto libre adicional sobre el proyecto.
+
+    Returns:
+        str: El bloque de contexto que se antepondrá a los prompts.
+    """
+    bloque = ""
+    if datos is not None:
+        encabezado = "CONTEXTO DEL PROYECTO (común a todas las secciones del informe):"
+        bloque = "\n".join(filter(None, [encabezado, descripcion, _datos_a_json(datos)])) + "\n\n"
+    _contexto_compartido.set(bloque)
+    return bloque
 
-import pandas as pd
-from typing import Union, Dict, List
 
 def analyze_dataframe(
     df: Union[pd.DataFrame, Dict, List[Dict], List],
@@ -293,64 +953,82 @@ def analyze_dataframe(
         seccion (str): Tipo de sección del informe ('introduccion', 'resumen', 'observacion', 'conclusion').
         contexto (str): Contexto adicional sobre los datos (nombre del proyecto, período, etc.).
         tokens (int): Máximo de tokens en la respuesta.
-        modelo (str): Modelo de OpenAI a utilizar.
+        modelo (str): Modelo de OpenAI a utilizar, o 'auto' (ver elegir_modelos).
 
     Returns:
-        str: Texto generado para el informe.
+        str: Texto generado para el informe (un Future con el texto dentro de
+        LoteLLM.recolectar()).
 
     Raises:
         ValueError: Si los datos están vacíos, el tipo no es válido o la sección no es válida.
     """
-    import json
-    import numpy as np
-    
+    prompt = _prompt_analisis(df, seccion, contexto)
+    return call_gpt(prompt, modelo=modelo, max_tokens=tokens, temperature=temperature, tarea=seccion)
+
+
+def analyze_dataframe_stream(
+    df: Union[pd.DataFrame, Dict, List[Dict], List],
+    seccion: str = "observacion",
+    contexto: str = "",
+    tokens: int = 1500,
+    modelo: str = "gpt-4o-mini",
+    temperature: float = 0.5
+) -> Iterator[str]:
+    """
+    Como analyze_dataframe, pero entrega el texto por fragmentos (call_gpt_stream).
+
+    Example:
+        >>> for parte in analyze_dataframe_stream(df, seccion='resumen'):
+        ...     print(parte, end="")
+    """
+    prompt = _prompt_analisis(df, seccion, contexto)
+    return call_gpt_stream(prompt, modelo=modelo, max_tokens=tokens, temperature=temperature, tarea=seccion)
+
+
+def analyze_dataframe_async(
+    df: Union[pd.DataFrame, Dict, List[Dict], List],
+    seccion: str = "observacion",
+    contexto: str = "",
+    tokens: int = 1500,
+    modelo: str = "gpt-4o-mini",
+    temperature: float = 0.5,
+    al_recibir: Optional[Callable[[str], None]] = None
+) -> Future:
+    """
+    Lanza analyze_dataframe en segundo plano y retorna un Future con el texto.
+
+    Pensado para DocumentBuilder.reservar_parrafo: el párrafo queda reservado y el
+    informe sigue armándose (tablas, figuras) mientras el modelo responde.
+
+    Args:
+        al_recibir: Si se indica, se llama (desde el hilo de la llamada) con cada
+            fragmento de texto a medida que llega.
+
+    Example:
+        >>> builder.titulo("Resumen", 1) \\
+        ...        .reservar_parrafo(analyze_dataframe_async(df_resumen, seccion='resumen')) \\
+        ...        .tabla(df_resumen)
+
+    Note:
+        Dentro de LoteLLM.recolectar() retorna el Future del lote (sin hilo aparte).
+    """
+    # Se arma el prompt ya: los errores de datos o sección salen aquí y no en el Future
+    prompt = _prompt_analisis(df, seccion, contexto)
+    if _lote_actual.get() is not None:
+        return call_gpt(prompt, modelo=modelo, max_tokens=tokens, temperature=temperature, tarea=seccion)
+    return en_segundo_plano(call_gpt, prompt, modelo=modelo, max_tokens=tokens,
+                            temperature=temperature, al_recibir=al_recibir, tarea=seccion)
+
+
+def _prompt_analisis(df: Union[pd.DataFrame, Dict, List[Dict], List], seccion: str, contexto: str) -> str:
+    """Prompt de analyze_dataframe para la sección indicada."""
     # Validar sección primero
     secciones_validas = ["introduccion", "resumen", "observacion", "conclusion"]
     if seccion not in secciones_validas:
         raise ValueError(f"Sección debe ser una de: {', '.join(secciones_validas)}")
-    
-    json_str = None
-    
-    # CASO 1: Es un DataFrame
-    if isinstance(df, pd.DataFrame):
-        if df.empty:
-            raise ValueError("El DataFrame está vacío. No hay datos para analizar.")
-        
-        # Convertir DataFrame a JSON
-        try:
-            json_str = df.to_json(orient="records", lines=False, force_ascii=False)
-        except Exception as e:
-            raise ValueError(f"Error al convertir DataFrame a JSON: {str(e)}")
-    
-    # CASO 2: Es una lista
-    elif isinstance(df, list):
-        if len(df) == 0:
-            raise ValueError("La lista está vacía. No hay información para analizar.")
-        
-        # Convertir lista directamente a JSON
-        try:
-            json_str = json.dumps(df, ensure_ascii=False, default=str)
-        except Exception as e:
-            raise ValueError(f"Error al convertir lista a JSON: {str(e)}")
-    
-    # CASO 3: Es un diccionario (puede ser biblioteca o dict simple)
-    elif isinstance(df, dict):
-        if len(df) == 0:
-            raise ValueError("El diccionario está vacío. No hay información para analizar.")
-        
-        # Convertir diccionario directamente a JSON (sin importar si es biblioteca o no)
-        try:
-            json_str = json.dumps(df, ensure_ascii=False, indent=2, default=str)
-        except Exception as e:
-            raise ValueError(f"Error al convertir diccionario a JSON: {str(e)}")
-    
-    else:
-        raise ValueError("El argumento debe ser un DataFrame, diccionario o lista de diccionarios.")
-    
-    # Validar que tengamos datos
-    if not json_str or json_str in ["{}", "[]", "null"]:
-        raise ValueError("Los datos están vacíos. No hay información para analizar.")
-    
+
+    json_str = _datos_a_json(df)
+
     # Instrucciones específicas según la sección
     instrucciones_seccion = {
         "introduccion": "Contextualiza el proyecto y sus objetivos medibles: Redacta una introducción para la seccion basada en los datos disponibles",
@@ -359,26 +1037,195 @@ def analyze_dataframe(
         "conclusion": "Realiza una conclusion del proyecto educativo y sus datos presentados de manera objetiva, destacando las características principales."
     }
 
-    prompt = f"""
+    # Prefijo estable (contexto del proyecto + formato) y al final lo propio de la sección
+    return f"""{_contexto_compartido.get()}FORMATO DE SALIDA:
+- Máximo 4 párrafos
+- Lenguaje profesional y técnico
+- Sin bullets ni listas
+- Texto corrido y formal
 
-Contexto:
+SECCIÓN:
 {contexto if contexto else "Análisis de datos de proyecto educativo"}
 
+DATOS A ANALIZAR:
+{json_str}
+
 TAREA:
 {instrucciones_seccion[seccion]}
+"""
 
-DATOS A ANALIZAR:
-{json_str}
 
-FORMATO DE SALIDA:
-- Máximo 4 párrafos
-- Lenguaje profesional y técnico
-- Sin bullets ni listas
-- Texto corrido y formal
+# ============================================================================
+# SALIDA ESTRUCTURADA DE INSIGHTS
+# ============================================================================
+
+# Esquema estricto (json_schema): las categorías con nombre libre se piden como
+# listas de objetos y se convierten al formato de diccionario en _insights_a_dict
+_LISTA_TEXTOS = {"type": "array", "items": {"type": "string"}}
+
+
+def _objeto(propiedades: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "object", "properties": propiedades,
+            "required": list(propiedades), "additionalProperties": False}
+
+
+SECCIONES_INSIGHTS = {
+    "Contexto General del Diagnóstico": _LISTA_TEXTOS,
+    "Hallazgos Clave y Correlaciones Relevantes": {"type": "array", "items": _objeto({
+        "categoria": {"type": "string"},
+        "insights": _LISTA_TEXTOS,
+        "implicacion": {"type": "string"},
+    })},
+    "Retos Priorizados Identificados": {"type": "array", "items": _objeto({
+        "Eje": {"type": "string"},
+        "Reto": {"type": "string"},
+        "Relevancia": {"type": "string"},
+    })},
+    "Otras Secciones Relevantes": {"type": "array", "items": _objeto({
+        "titulo": {"type": "string"},
+        "insights": _LISTA_TEXTOS,
+    })},
+    "Relevancia del Programa": _LISTA_TEXTOS,
+}
 
-"""
+ESQUEMA_INSIGHTS = _objeto(SECCIONES_INSIGHTS)
 
-    return call_gpt(prompt, modelo=modelo, max_tokens=tokens, temperature=temperature)
+
+def _formato_json_schema(nombre: str, esquema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": nombre, "schema": esquema, "strict": True}}
+
+
+class _SeccionesJSON:
+    """
+    Lector incremental de un objeto JSON que llega por fragmentos: cada par
+    "clave": valor de primer nivel se decodifica en cuanto se cierra, sin esperar
+    al resto de la respuesta. Los pares que no se pueden decodificar quedan en
+    `rotos` (y el último, si la respuesta se cortó, en `pendiente`).
+    """
+
+    def __init__(self):
+        self.texto = ''
+        self.secciones: Dict[str, Any] = {}
+        self.rotos: List[str] = []
+        self._pos = 0
+        self._profundidad = 0
+        self._en_cadena = False
+        self._escape = False
+        self._inicio: Optional[int] = None
+
+    def agregar(self, fragmento: str) -> None:
+        self.texto += fragmento
+        for i in range(self._pos, len(self.texto)):
+            c = self.texto[i]
+            if self._en_cadena:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._en_cadena = False
+            elif c == '"':
+                self._en_cadena = True
+                if self._profundidad == 1 and self._inicio is None:
+                    self._inicio = i
+            elif c in '{[':
+                self._profundidad += 1
+            elif c in '}]':
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._cerrar_par(i)
+            elif c == ',' and self._profundidad == 1:
+                self._cerrar_par(i)
+        self._pos = len(self.texto)
+
+    def _cerrar_par(self, fin: int) -> None:
+        if self._inicio is None:
+            return
+        par = self.texto[self._inicio:fin]
+        self._inicio = None
+        try:
+            self.secciones.update(json.loads('{' + par + '}'))
+            logger.info(f"Sección de insights recibida: {par[:par.find(':')].strip()}")
+        except json.JSONDecodeError:
+            self.rotos.append(par)
+
+    @property
+    def pendiente(self) -> Optional[str]:
+        return self.texto[self._inicio:] if self._inicio is not None else None
+
+
+def _clave_fragmento(fragmento: str) -> Optional[str]:
+    try:
+        return json.loads(fragmento[:fragmento.index(':')].strip())
+    except (ValueError, json.JSONDecodeError):
+        return None
+
+
+def _reparar_seccion(seccion: str, fragmento: str, modelo: str) -> Optional[Any]:
+    """Pide al modelo solo la sección rota, a partir de su fragmento (llamada corta)."""
+    prompt = f"""El siguiente fragmento JSON de la sección "{seccion}" quedó inválido o incompleto.
+Corrígelo y complétalo conservando su contenido; no agregues información nueva.
+
+Fragmento:
+{fragmento}"""
+    try:
+        respuesta = call_gpt(
+            prompt, modelo=modelo, max_tokens=600, temperature=0,
+            system_prompt="Reparas fragmentos JSON. Devuelve solo el JSON pedido.",
+            response_format=_formato_json_schema("seccion", _objeto({seccion: SECCIONES_INSIGHTS[seccion]})),
+        )
+        return json.loads(respuesta)[seccion]
+    except (json.JSONDecodeError, KeyError, openai.OpenAIError) as e:
+        logger.error(f"No se pudo reparar la sección '{seccion}': {str(e)}")
+        return None
+
+
+def _insights_a_dict(datos: Dict[str, Any]) -> Dict[str, Any]:
+    """Convierte la respuesta del esquema al formato de diccionario de insight_list (sin secciones vacías)."""
+    resultado = {}
+    for seccion, valor in datos.items():
+        if seccion == "Hallazgos Clave y Correlaciones Relevantes":
+            valor = {h["categoria"]: h["insights"] + ([f"Implicación: {h['implicacion']}"] if h["implicacion"] else [])
+                     for h in valor}
+        elif seccion == "Otras Secciones Relevantes":
+            valor = {o["titulo"]: o["insights"] for o in valor}
+        if valor:
+            resultado[seccion] = valor
+    return resultado
+
+
+def _insights_estructurados(prompt: str, modelo: str, tokens: int) -> Union[Dict[str, Any], Future]:
+    lector = _SeccionesJSON()
+    respuesta = call_gpt(prompt, modelo=modelo, max_tokens=tokens,
+                         response_format=_formato_json_schema("insights", ESQUEMA_INSIGHTS),
+                         al_recibir=lector.agregar, tarea='sintesis')
+    if isinstance(respuesta, Future):
+        # En un lote la respuesta llega completa al final: se procesa igual, de una vez
+        def _procesar(texto: str) -> Dict[str, Any]:
+            lector.agregar(texto)
+            return _completar_insights(lector, modelo)
+        return _encadenar(respuesta, _procesar)
+    return _completar_insights(lector, modelo)
+
+
+def _completar_insights(lector: _SeccionesJSON, modelo: str) -> Dict[str, Any]:
+    # Reparar solo los fragmentos inválidos o cortados de secciones conocidas
+    fragmentos = lector.rotos + ([lector.pendiente] if lector.pendiente else [])
+    for fragmento in fragmentos:
+        seccion = _clave_fragmento(fragmento)
+        if seccion in SECCIONES_INSIGHTS and seccion not in lector.secciones:
+            logger.warning(f"Sección '{seccion}' inválida; reparando solo ese fragmento")
+            reparada = _reparar_seccion(seccion, fragmento, modelo)
+            if reparada is not None:
+                lector.secciones[seccion] = reparada
+
+    secciones = {k: lector.secciones[k] for k in SECCIONES_INSIGHTS if k in lector.secciones}
+    if not secciones:
+        logger.error(f"Respuesta de insights sin secciones válidas: {lector.texto}")
+        return {"error": "JSON inválido", "respuesta_original": lector.texto}
+
+    logger.info("JSON de insights validado correctamente")
+    return _insights_a_dict(secciones)
 
 
 def insight_list(
@@ -386,20 +1233,28 @@ def insight_list(
     proyectos: Optional[pd.DataFrame] = None,
     introduccion: str = "",
     tokens: int = 2000,
-    modelo: str = "gpt-4o-mini"
-) -> Dict[str, Any]:
+    modelo: str = "gpt-4o-mini",
+    estructurado: bool = True
+) -> Union[Dict[str, Any], Future]:
     """
     Analiza una lista y genera insights estructurados en formato JSON.
 
+    Con `estructurado` la respuesta se pide con el esquema ESQUEMA_INSIGHTS
+    (json_schema) y se recibe en streaming: cada sección se valida apenas se
+    cierra, y si al final alguna quedó inválida o cortada se repara solo ese
+    fragmento con una llamada corta (_reparar_seccion).
+
     Args:
         data_list (List): Lista de datos a analizar.
         proyectos (Optional[pd.DataFrame]): DataFrame con información de proyectos.
         introduccion (str): Introducción o contexto del análisis.
         tokens (int): Máximo de tokens en la respuesta.
-        modelo (str): Modelo de OpenAI a utilizar.
+        modelo (str): Modelo de OpenAI a utilizar, o 'auto' (ver elegir_modelos).
+        estructurado (bool): Si False, usa el formato libre anterior (modelos sin json_schema).
 
     Returns:
-        Dict[str, Any]: Diccionario con los insights estructurados.
+        Dict[str, Any]: Diccionario con los insights estructurados (un Future
+        con ese diccionario dentro de LoteLLM.recolectar()).
 
     Raises:
         ValueError: Si la lista está vacía o si el JSON retornado es inválido.
@@ -418,8 +1273,27 @@ def insight_list(
             logger.warning(f"Error al convertir proyectos a JSON: {str(e)}")
             json_str = ""
 
+    if estructurado:
+        prompt = f"""{_contexto_compartido.get()}Basándote en la siguiente introducción, información de proyectos y conclusiones parciales, genera un resumen estructurado que destaque los principales hallazgos e insights por dimensión o categoría.
+
+Introducción:
+{introduccion}
+
+Proyectos:
+{json_str}
+
+Conclusiones parciales:
+{list_str}
+
+Instrucciones:
+- Si alguna sección no aplica, déjala como lista vacía.
+- Usa nombres de categoría o sección que surjan naturalmente del análisis.
+- Redacta en estilo claro y sintético.
+- Las implicaciones deben reflejar posibles líneas de acción o interpretaciones del dato."""
+        return _insights_estructurados(prompt, modelo, tokens)
+
     # Construir prompt base
-    base_prompt = f"""Basándote en la siguiente introducción, información de proyectos y conclusiones parciales, genera un resumen estructurado en formato JSON que destaque los principales hallazgos e insights por dimensión o categoría.
+    base_prompt = f"""{_contexto_compartido.get()}Basándote en la siguiente introducción, información de proyectos y conclusiones parciales, genera un resumen estructurado en formato JSON que destaque los principales hallazgos e insights por dimensión o categoría.
 
 Introducción:
 {introduccion}
@@ -473,8 +1347,13 @@ Instrucciones:
 - Redacta en estilo claro y sintético.
 - Las implicaciones deben reflejar posibles líneas de acción o interpretaciones del dato."""
 
-    response = call_gpt(base_prompt, modelo=modelo, max_tokens=tokens)
+    response = call_gpt(base_prompt, modelo=modelo, max_tokens=tokens, tarea='sintesis')
+    if isinstance(response, Future):
+        return _encadenar(response, _parsear_insights)
+    return _parsear_insights(response)
+
 
+def _parsear_insights(response: str) -> Dict[str, Any]:
     # Validar que el JSON retornado sea válido
     try:
         # Intentar extraer JSON del texto (por si incluye markdown)
@@ -0,0 +1,543 @@
+from __future__ import annotations
+
+import base64
+import html
+import os
+import warnings
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from importacion_diferida import modulo_diferido
+
+pd = modulo_diferido('pandas')
+
+
+# ============================================================================
+# API COMÚN DE RENDERIZADO
+# ============================================================================
+
+def siguiente_numeracion(contador: Dict[int, int], nivel: int) -> str:
+    """
+    Avanza el contador de títulos y retorna la numeración del nivel (1., 1.1, 1.1.1).
+    """
+    contador[nivel] += 1
+    for deeper in range(nivel + 1, 4):
+        contador[deeper] = 0
+
+    if nivel == 1:
+        return f"{contador[1]}."
+    elif nivel == 2:
+        return f"{contador[1]}.{contador[2]}"
+    return f"{contador[1]}.{contador[2]}.{contador[3]}"
+
+
+def resolver_texto(fuente: Union[str, Future]) -> str:
+    """
+    Texto de un párrafo reservado: espera el Future si hace falta. Si la
+    generación falló, retorna un aviso en lugar del texto (como las figuras).
+    """
+    if not isinstance(fuente, Future):
+        return fuente
+    try:
+        return fuente.result()
+    except Exception as e:
+        return f"[Error al generar texto: {str(e)}]"
+
+
+class Renderizador(ABC):
+    """
+    Interfaz común de los constructores de informes.
+
+    word.DocumentBuilder genera el .docx; RenderizadorHTML y RenderizadorMarkdown
+    generan una vista previa liviana con las mismas llamadas, y RenderizadorMultiple
+    reparte cada llamada entre varios, así un solo script produce todas las salidas.
+    """
+
+    _historial: List[str]
+
+    @abstractmethod
+    def titulo(self, texto: str, nivel: int = 1) -> 'Renderizador': ...
+
+    @abstractmethod
+    def parrafo(self, texto: str) -> 'Renderizador': ...
+
+    @abstractmethod
+    def reservar_parrafo(self, futuro: Union[str, Future]) -> 'Renderizador': ...
+
+    @abstractmethod
+    def tabla(self, df, titulo: Optional[str] = None, con_merge: bool = False,
+              group_cols: Optional[List[str]] = None) -> 'Renderizador': ...
+
+    @abstractmethod
+    def figura(self, figura, titulo: Optional[str] = None, pie: Optional[str] = None,
+               ancho_cm: Optional[float] = None, alto_cm: Optional[float] = None) -> 'Renderizador': ...
+
+    @abstractmethod
+    def vinetas(self, items: List[str], nivel: int = 1, **kwargs) -> 'Renderizador': ...
+
+    @abstractmethod
+    def salto_pagina(self) -> 'Renderizador': ...
+
+    @abstractmethod
+    def indice(self, titulo: str = "Índice") -> 'Renderizador': ...
+
+    @abstractmethod
+    def advertencia_actualizacion(self) -> 'Renderizador': ...
+
+    @abstractmethod
+    def numerar_titulos(self) -> 'Renderizador': ...
+
+    @abstractmethod
+    def guardar(self, ruta: str, verbose: bool = True) -> None: ...
+
+    def obtener_historial(self) -> List[str]:
+        """
+        Retorna una copia del historial de operaciones.
+
+        Returns:
+            Lista de strings describiendo cada operación realizada
+        """
+        return self._historial.copy()
+
+    def mostrar_historial(self) -> 'Renderizador':
+        """
+        Imprime el historial de operaciones en consola.
+
+        Returns:
+            self para permitir encadenamiento de métodos
+        """
+        print("\n=== Historial de Operaciones ===")
+        for i, op in enumerate(self._historial, 1):
+            print(f"{i:2d}. {op}")
+        print(f"\nTotal: {len(self._historial)} operaciones\n")
+        return self
+
+
+def ocultar_repetidos(df: pd.DataFrame, group_cols: Optional[List[str]]) -> pd.DataFrame:
+    """
+    Equivalente en texto de insertar_tabla_con_merge: deja en blanco los valores de
+    group_cols que repiten la fila anterior (jerárquicamente, de izquierda a derecha).
+    """
+    if not group_cols:
+        return df
+    grupos = df[group_cols]
+    repetido = grupos.eq(grupos.shift()).cumprod(axis=1).astype(bool)
+    df = df.copy()
+    df[group_cols] = grupos.astype(object).mask(repetido, '')
+    return df
+
+
+# ============================================================================
+# BACKENDS DE TEXTO (HTML / MARKDOWN)
+# ============================================================================
+
+class _RenderizadorTexto(Renderizador):
+    """
+    Base de los renderizadores de texto. Las tablas y figuras se convierten a texto
+    al agregarlas (no se retienen DataFrames ni figuras); títulos e índice quedan
+    como bloques para poder numerarlos y armar el índice al final.
+    """
+
+    extension = ''
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config: Diccionario con configuración opcional:
+                - titulo_documento: Título de la página / encabezado del archivo
+                - formato_figura: 'svg' (vectorial, embebido) o 'png'
+                - dpi_figura: Resolución de las figuras png
+                - numerar_titulos: Si True, titulo() numera al vuelo (1., 1.1, 1.1.1)
+        """
+        self.config = {
+            'titulo_documento': 'Informe',
+            'formato_figura': 'svg',
+            'dpi_figura': 100,
+            'numerar_titulos': False,
+        }
+        if config:
+            self.config.update(config)
+
+        self._bloques: List[list] = []
+        self._historial: List[str] = []
+        self._contador_titulos = {1: 0, 2: 0, 3: 0}
+
+    # ---- API común --------------------------------------------------------
+
+    def titulo(self, texto: str, nivel: int = 1) -> '_RenderizadorTexto':
+        if self.config['numerar_titulos'] and nivel in self._contador_titulos:
+            texto = f"{siguiente_numeracion(self._contador_titulos, nivel)} {texto}"
+        self._bloques.append(['titulo', nivel, texto])
+        self._historial.append(f"Título nivel {nivel}: {texto}")
+        return self
+
+    def parrafo(self, texto: str) -> '_RenderizadorTexto':
+        self._bloques.append(['texto', self._parrafo(texto)])
+        self._historial.append(f"Párrafo: {texto[:50]}..." if len(texto) > 50 else f"Párrafo: {texto}")
+        return self
+
+    def reservar_parrafo(self, futuro: Union[str, Future]) -> '_RenderizadorTexto':
+        self._bloques.append(['pendiente', futuro])
+        self._historial.append("Párrafo reservado")
+        return self
+
+    def tabla(self, df, titulo: Optional[str] = None, con_merge: bool = False,
+              group_cols: Optional[List[str]] = None) -> '_RenderizadorTexto':
+        if df.empty:
+            self.parrafo("[Tabla vacía: sin datos para mostrar]")
+            self._historial.append("Tabla: vacía")
+            return self
+
+        if titulo:
+            self.titulo(titulo, 3)
+        if con_merge:
+            df = ocultar_repetidos(df, group_cols)
+        self._bloques.append(['texto', self._tabla(df)])
+        self._historial.append(f"Tabla: {len(df)} filas × {len(df.columns)} cols")
+        return self
+
+    def figura(self, figura, titulo: Optional[str] = None, pie: Optional[str] = None,
+               ancho_cm: Optional[float] = None, alto_cm: Optional[float] = None) -> '_RenderizadorTexto':
+        if titulo:
+            self.titulo(titulo, 3)
+        if isinstance(figura, (bytes, bytearray)):
+            # Ya renderizada (graficos.renderizar): se usa tal cual, como png
+            formato, datos = 'png', bytes(figura)
+        else:
+            formato = self.config['formato_figura']
+            buffer = BytesIO()
+            figura.savefig(buffer, format=formato, bbox_inches='tight', dpi=self.config['dpi_figura'])
+            datos = buffer.getvalue()
+        self._bloques.append(['figura', datos, formato, pie, ancho_cm])
+        self._historial.append(f"Figura: {titulo if titulo else 'sin título'}")
+        return self
+
+    def vinetas(self, items: List[str], nivel: int = 1, **kwargs) -> '_RenderizadorTexto':
+        self._bloques.append(['texto', self._vinetas(items, nivel)])
+        self._historial.append(f"Viñetas: {len(items)} items (nivel {nivel})")
+        return self
+
+    def salto_pagina(self) -> '_RenderizadorTexto':
+        self._bloques.append(['texto', self._salto()])
+        self._historial.append("Salto de página")
+        return self
+
+    def indice(self, titulo: str = "Índice") -> '_RenderizadorTexto':
+        self._bloques.append(['indice', titulo])
+        self._historial.append(f"Índice: {titulo}")
+        return self
+
+    def advertencia_actualizacion(self) -> '_RenderizadorTexto':
+        # El índice de la vista previa ya se genera completo: no hay campos que actualizar
+        self._historial.append("Advertencia de actualización (omitida)")
+        return self
+
+    def numerar_titulos(self) -> '_RenderizadorTexto':
+        if self.config['numerar_titulos']:
+            warnings.warn("El renderizador ya numera los títulos al vuelo (config 'numerar_titulos'); "
+                          "numerar_titulos() no hace nada", stacklevel=2)
+            return self
+        contador = {1: 0, 2: 0, 3: 0}
+        for bloque in self._bloques:
+            if bloque[0] == 'titulo' and bloque[1] in contador:
+                bloque[2] = f"{siguiente_numeracion(contador, bloque[1])} {bloque[2]}"
+        self._historial.append("Numeración de títulos aplicada")
+        return self
+
+    # ---- Salida -----------------------------------------------------------
+
+    def _lineas(self, directorio_figuras: Optional[str] = None) -> Iterator[str]:
+        titulos = [(b[1], b[2], f"sec-{i}") for i, b in enumerate(self._bloques) if b[0] == 'titulo']
+        n_figura = 0
+
+        yield self._inicio()
+        for i, bloque in enumerate(self._bloques):
+            tipo = bloque[0]
+            if tipo == 'titulo':
+                yield self._titulo(bloque[1], bloque[2], f"sec-{i}")
+            elif tipo == 'indice':
+                yield self._indice(bloque[1], [t for t in titulos if t[0] <= 3])
+            elif tipo == 'pendiente':
+                bloque[:] = ['texto', self._parrafo(resolver_texto(bloque[1]))]
+                yield bloque[1]
+            elif tipo == 'figura':
+                n_figura += 1
+                _, datos, formato, pie, ancho_cm = bloque
+                src = None
+                if directorio_figuras is not None:
+                    os.makedirs(directorio_figuras, exist_ok=True)
+                    nombre = f"figura_{n_figura}.{formato}"
+                    with open(os.path.join(directorio_figuras, nombre), 'wb') as f:
+                        f.write(datos)
+                    src = f"{os.path.basename(directorio_figuras)}/{nombre}"
+                yield self._figura(datos, formato, pie, ancho_cm, src)
+            else:
+                yield bloque[1]
+        yield self._fin()
+
+    def renderizar(self) -> str:
+        """Retorna el documento completo como texto (figuras embebidas)."""
+        return ''.join(self._lineas())
+
+    def guardar(self, ruta: str, verbose: bool = True) -> None:
+        """
+        Escribe el documento bloque a bloque. Las figuras png van a la carpeta
+        '<ruta>_figuras' y se referencian (carga diferida); las svg se embeben.
+
+        Args:
+            ruta: Ruta del archivo de salida
+            verbose: Si True, imprime información del guardado
+        """
+        directorio = None
+        if self.config['formato_figura'] != 'svg':
+            directorio = f"{os.path.splitext(ruta)[0]}_figuras"
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.writelines(self._lineas(directorio))
+        if verbose:
+            print(f"[OK] Vista previa guardada en: {ruta}")
+            print(f"[OK] Operaciones realizadas: {len(self._historial)}")
+
+    # ---- Formato (cada backend) -------------------------------------------
+
+    def _inicio(self) -> str:
+        return ''
+
+    def _fin(self) -> str:
+        return ''
+
+    @abstractmethod
+    def _titulo(self, nivel: int, texto: str, ancla: str) -> str: ...
+
+    @abstractmethod
+    def _parrafo(self, texto: str) -> str: ...
+
+    @abstractmethod
+    def _tabla(self, df: pd.DataFrame) -> str: ...
+
+    @abstractmethod
+    def _figura(self, datos: bytes, formato: str, pie: Optional[str],
+                ancho_cm: Optional[float], src: Optional[str]) -> str: ...
+
+    @abstractmethod
+    def _vinetas(self, items: List[str], nivel: int) -> str: ...
+
+    @abstractmethod
+    def _salto(self) -> str: ...
+
+    @abstractmethod
+    def _indice(self, titulo: str, titulos: List[tuple]) -> str: ...
+
+
+class RenderizadorHTML(_RenderizadorTexto):
+    """
+    Vista previa HTML del informe, con la misma API que word.DocumentBuilder.
+
+    Ejemplo:
+        >>> preview = RenderizadorHTML({'titulo_documento': 'Cierre proyecto X'})
+        >>> preview.indice().titulo("Resumen", 1).tabla(df).guardar("informe.html")
+    """
+
+    extension = '.html'
+
+    CSS = (
+        "body{font-family:'Segoe UI',sans-serif;font-size:14px;max-width:900px;margin:auto;color:#222}"
+        "h1,h2,h3{font-family:Lora,serif;color:#2E3F5F}"
+        "h1{text-transform:uppercase;text-align:center;border-bottom:2px solid #2E3F5F}"
+        "h2{color:#4F4F4F;border-bottom:1px solid #D3D3D3}"
+        "h3{color:#4F4F4F;font-style:italic}"
+        "p{text-align:justify}"
+        "table.tabla{border-collapse:collapse;margin:8px auto;font-size:12px}"
+        "table.tabla th{background:#2E3F5F;color:#fff}"
+        "table.tabla th,table.tabla td{border:1px solid #ccc;padding:3px 6px;text-align:center}"
+        "figure{text-align:center}figure svg,figure img{max-width:100%;height:auto}"
+        "figcaption{font-size:11px;font-weight:bold;font-style:italic}"
+        "hr.salto{border:0;border-top:1px dashed #ddd}"
+    )
+
+    def _inicio(self) -> str:
+        titulo = html.escape(self.config['titulo_documento'])
+        return (f"<!DOCTYPE html>\n<html lang=\"es\"><head><meta charset=\"utf-8\">"
+                f"<title>{titulo}</title><style>{self.CSS}</style></head><body>\n")
+
+    def _fin(self) -> str:
+        return "</body></html>\n"
+
+    def _titulo(self, nivel: int, texto: str, ancla: str) -> str:
+        etiqueta = f"h{min(nivel, 4)}"
+        return f"<{etiqueta} id=\"{ancla}\">{html.escape(texto)}</{etiqueta}>\n"
+
+    def _parrafo(self, texto: str) -> str:
+        return f"<p>{html.escape(texto)}</p>\n"
+
+    def _tabla(self, df: pd.DataFrame) -> str:
+        return df.to_html(index=False, border=0, classes='tabla', na_rep='') + "\n"
+
+    def _figura(self, datos: bytes, formato: str, pie: Optional[str],
+                ancho_cm: Optional[float], src: Optional[str]) -> str:
+        estilo = f" style=\"width:{ancho_cm}cm\"" if ancho_cm else ""
+        if formato == 'svg':
+            svg = datos.decode('utf-8')
+            contenido = svg[svg.find('<svg'):]
+        else:
+            if src is None:
+                src = f"data:image/{formato};base64,{base64.b64encode(datos).decode('ascii')}"
+            contenido = f"<img src=\"{src}\" loading=\"lazy\" alt=\"{html.escape(pie or '')}\">"
+        leyenda = f"<figcaption>{html.escape(pie)}</figcaption>" if pie else ""
+        return f"<figure{estilo}>{contenido}{leyenda}</figure>\n"
+
+    def _vinetas(self, items: List[str], nivel: int) -> str:
+        margen = f" style=\"margin-left:{12 * (nivel - 1)}pt\"" if nivel > 1 else ""
+        filas = ''.join(f"<li>{html.escape(str(item))}</li>" for item in items)
+        return f"<ul{margen}>{filas}</ul>\n"
+
+    def _salto(self) -> str:
+        return "<hr class=\"salto\">\n"
+
+    def _indice(self, titulo: str, titulos: List[tuple]) -> str:
+        entradas = ''.join(
+            f"<li style=\"margin-left:{(nivel - 1) * 16}px\"><a href=\"#{ancla}\">{html.escape(texto)}</a></li>"
+            for nivel, texto, ancla in titulos
+        )
+        return f"<h1>{html.escape(titulo)}</h1><ul style=\"list-style:none\">{entradas}</ul>\n"
+
+    def _repr_html_(self) -> str:
+        return self.renderizar()
+
+
+class RenderizadorMarkdown(_RenderizadorTexto):
+    """
+    Vista previa Markdown del informe, con la misma API que word.DocumentBuilder.
+    Las tablas se escriben como tablas pipe y las figuras como imágenes.
+    """
+
+    extension = '.md'
+
+    def _inicio(self) -> str:
+        return f"# {self.config['titulo_documento']}\n\n"
+
+    def _titulo(self, nivel: int, texto: str, ancla: str) -> str:
+        return f"<a id=\"{ancla}\"></a>\n{'#' * min(nivel + 1, 6)} {texto}\n\n"
+
+    def _parrafo(self, texto: str) -> str:
+        return f"{texto}\n\n"
+
+    def _tabla(self, df: pd.DataFrame) -> str:
+        # Columna por columna (vectorizado), no celda por celda
+        celdas = df.astype(object).where(df.notna(), '').astype(str)
+        filas = None
+        for columna in celdas.columns:
+            valores = celdas[columna].str.replace('|', r'\|', regex=False).str.replace('\n', ' ', regex=False)
+            filas = '| ' + valores if filas is None else filas + ' | ' + valores
+        encabezado = '| ' + ' | '.join(str(c).replace('|', r'\|') for c in df.columns) + ' |'
+        separador = '|' + '---|' * len(df.columns)
+        return '\n'.join([encabezado, separador, *(filas + ' |')]) + "\n\n"
+
+    def _figura(self, datos: bytes, formato: str, pie: Optional[str],
+                ancho_cm: Optional[float], src: Optional[str]) -> str:
+        if src is None:
+            tipo = 'svg+xml' if formato == 'svg' else formato
+            src = f"data:image/{tipo};base64,{base64.b64encode(datos).decode('ascii')}"
+        return f"![{pie or ''}]({src})\n\n" + (f"*{pie}*\n\n" if pie else "")
+
+    def _vinetas(self, items: List[str], nivel: int) -> str:
+        sangria = '  ' * (nivel - 1)
+        return ''.join(f"{sangria}- {item}\n" for item in items) + "\n"
+
+    def _salto(self) -> str:
+        return "---\n\n"
+
+    def _indice(self, titulo: str, titulos: List[tuple]) -> str:
+        entradas = ''.join(f"{'  ' * (nivel - 1)}- [{texto}](#{ancla})\n" for nivel, texto, ancla in titulos)
+        return f"## {titulo}\n\n{entradas}\n"
+
+    def guardar(self, ruta: str, verbose: bool = True) -> None:
+        # En Markdown las figuras siempre van a archivos: los data URI no se muestran en todos los visores
+        directorio = f"{os.path.splitext(ruta)[0]}_figuras"
+        with open(ruta, 'w', encoding='utf-8') as f:
+            f.writelines(self._lineas(directorio))
+        if verbose:
+            print(f"[OK] Vista previa guardada en: {ruta}")
+            print(f"[OK] Operaciones realizadas: {len(self._historial)}")
+
+
+# ============================================================================
+# REPARTO A VARIOS RENDERIZADORES
+# ============================================================================
+
+class RenderizadorMultiple(Renderizador):
+    """
+    Reparte cada llamada entre varios renderizadores.
+
+    Ejemplo:
+        >>> informe = RenderizadorMultiple(word.DocumentBuilder(), RenderizadorHTML())
+        >>> informe.titulo("Resumen", 1).tabla(df)
+        >>> informe.guardar("informe")   # informe.docx + informe.html
+
+    Las tablas con formato condicional se siguen armando sobre informe.doc (el
+    documento del primer renderizador que lo tenga); solo salen en el .docx.
+    """
+
+    def __init__(self, *renderizadores: Renderizador):
+        if not renderizadores:
+            raise ValueError("Se requiere al menos un renderizador")
+        self.renderizadores = list(renderizadores)
+        self._historial: List[str] = []
+
+    @property
+    def doc(self):
+        for renderizador in self.renderizadores:
+            if hasattr(renderizador, 'doc'):
+                return renderizador.doc
+        raise AttributeError("Ningún renderizador tiene documento Word")
+
+    def _repartir(self, metodo: str, *args, **kwargs) -> 'RenderizadorMultiple':
+        for renderizador in self.renderizadores:
+            getattr(renderizador, metodo)(*args, **kwargs)
+        self._historial.append(f"{metodo} ×{len(self.renderizadores)}")
+        return self
+
+    def titulo(self, texto: str, nivel: int = 1) -> 'RenderizadorMultiple':
+        return self._repartir('titulo', texto, nivel)
+
+    def parrafo(self, texto: str) -> 'RenderizadorMultiple':
+        return self._repartir('parrafo', texto)
+
+    def reservar_parrafo(self, futuro: Union[str, Future]) -> 'RenderizadorMultiple':
+        return self._repartir('reservar_parrafo', futuro)
+
+    def tabla(self, df, titulo: Optional[str] = None, con_merge: bool = False,
+              group_cols: Optional[List[str]] = None) -> 'RenderizadorMultiple':
+        return self._repartir('tabla', df, titulo, con_merge, group_cols)
+
+    def figura(self, figura, titulo: Optional[str] = None, pie: Optional[str] = None,
+               ancho_cm: Optional[float] = None, alto_cm: Optional[float] = None) -> 'RenderizadorMultiple':
+        return self._repartir('figura', figura, titulo, pie, ancho_cm, alto_cm)
+
+    def vinetas(self, items: List[str], nivel: int = 1, **kwargs) -> 'RenderizadorMultiple':
+        return self._repartir('vinetas', items, nivel, **kwargs)
+
+    def salto_pagina(self) -> 'RenderizadorMultiple':
+        return self._repartir('salto_pagina')
+
+    def indice(self, titulo: str = "Índice") -> 'RenderizadorMultiple':
+        return self._repartir('indice', titulo)
+
+    def advertencia_actualizacion(self) -> 'RenderizadorMultiple':
+        return self._repartir('advertencia_actualizacion')
+
+    def numerar_titulos(self) -> 'RenderizadorMultiple':
+        return self._repartir('numerar_titulos')
+
+    def guardar(self, ruta: str, verbose: bool = True) -> None:
+        """
+        Guarda cada salida con la extensión de su renderizador (.docx, .html, .md).
+
+        Args:
+            ruta: Ruta base de salida; si trae extensión, se reemplaza
+        """
+        base = os.path.splitext(ruta)[0]
+        for renderizador in self.renderizadores:
+            extension = getattr(renderizador, 'extension', '.docx')
+            renderizador.guardar(base + extension, verbose=verbose)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+from importacion_diferida import modulo_diferido
+
+pd = modulo_diferido('pandas')
+
+
+# ============================================================================
+# SEGMENTACIÓN DE VALORES NUMÉRICOS EN RANGOS
+# ============================================================================
+
+def segmentar(valores: pd.Series, cortes: Sequence[float], etiquetas: Sequence[str],
+              sin_dato: str = 'Sin información') -> pd.Series:
+    """
+    Asigna cada valor a su rango en una sola operación (pd.cut) y retorna una
+    categoría ordenada: los rangos en el orden de `cortes` y `sin_dato` al final.
+
+    Los rangos son cerrados a la izquierda: [cortes[i], cortes[i+1]). Los valores
+    nulos o fuera de todos los rangos quedan como `sin_dato`.
+
+    Args:
+        valores: Serie numérica
+        cortes: Límites de los rangos (len(etiquetas) + 1 valores, crecientes)
+        etiquetas: Nombre de cada rango
+        sin_dato: Etiqueta para nulos y valores fuera de rango
+
+    Example:
+        >>> segmentar(df['edad'], [-math.inf, 14, 15, math.inf], ['<14', '14', '15+'])
+    """
+    if len(cortes) != len(etiquetas) + 1:
+        raise ValueError(f"Se esperaban {len(etiquetas) + 1} cortes para {len(etiquetas)} etiquetas, hay {len(cortes)}")
+
+    rangos = pd.cut(pd.to_numeric(valores, errors='coerce'), bins=cortes, labels=etiquetas,
+                    right=False, ordered=True)
+    return rangos.cat.add_categories([sin_dato]).fillna(sin_dato)
+
+
+def rangos_de_ancho(inicio: int, fin: int, ancho: int,
+                    ultimo: Optional[str] = None) -> Tuple[List[float], List[str]]:
+    """
+    Cortes y etiquetas de rangos enteros de ancho fijo ("0-4", "5-9", ...).
+
+    El último rango queda abierto a la derecha (incluye `fin` y valores mayores)
+    y se etiqueta `ultimo` si se indica.
+
+    Example:
+        >>> rangos_de_ancho(0, 100, 5, ultimo='95-100')
+        ([0, 5, ..., 95, inf], ['0-4', '5-9', ..., '90-94', '95-100'])
+    """
+    limites = list(range(inicio, fin, ancho))
+    etiquetas = [f"{desde}-{desde + ancho - 1}" for desde in limites]
+    if ultimo is not None:
+        etiquetas[-1] = ultimo
+    return limites + [math.inf], etiquetas
+
+
+# ============================================================================
+# SEGMENTACIONES DEL INFORME
+# ============================================================================
+
+CORTES_EDAD = [-math.inf, 14, 15, 16, 17, 18, 19, math.inf]
+ETIQUETAS_EDAD = ['Menor a 14 años', '14 años', '15 años', '16 años', '17 años', '18 años', 'Mayor a 19 años']
+
+CORTES_NOTAS, ETIQUETAS_NOTAS = rangos_de_ancho(0, 100, 5, ultimo='95-100')
+
+
+def categorizar_edad(edades: pd.Series) -> pd.Series:
+    """Rango de edad de cada estudiante, con 'Sin información' para edades nulas."""
+    return segmentar(edades, CORTES_EDAD, ETIQUETAS_EDAD)
+
+
+def clusterizar_notas(notas: pd.Series) -> pd.Series:
+    """Rango de 5 en 5 puntos de cada nota (95-100 incluye el 100), con 'Sin nota' para nulas."""
+    return segmentar(notas, CORTES_NOTAS, ETIQUETAS_NOTAS, sin_dato='Sin nota')
@@ -0,0 +1,518 @@
+import email.parser
+import email.policy
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+# ============================================================================
+# SERVIDOR LLM SIMULADO
+# ============================================================================
+#
+# Servidor local con el protocolo de chat.completions (con y sin streaming) y un
+# subconjunto de /files y /batches (para LoteLLM) para pruebas de carga y de
+# latencia de la fase LLM sin costo:
+#
+#     >>> servidor = iniciar_servidor(latencia_base=0.8, tasa_429=0.05)
+#     >>> openia_script.configurar_transporte(base_url=servidor.url)
+#     >>> ...                      # generar informes como siempre
+#     >>> servidor.estadisticas()
+#     >>> servidor.detener()
+#
+# o desde consola: python servidor_llm_simulado.py --puerto 8000 --latencia 0.8
+#
+# Las respuestas son deterministas (dependen solo del modelo y de los mensajes);
+# con response_format json_schema se genera un JSON válido para el esquema.
+# Los lotes se resuelven en un hilo aparte con las mismas respuestas, sin
+# latencia ni 429; quedan 'completed' en cuanto se procesan todas sus líneas.
+
+_PALABRAS = (
+    "los datos muestran una distribución de estudiantes por institución grado y sesión "
+    "con un porcentaje de asistencia promedio durante el periodo del proyecto educativo "
+    "mientras las calificaciones se concentran en el rango medio y la satisfacción general "
+    "se mantiene estable entre los participantes de cada sede registrada en el programa"
+).split()
+
+# Los prompts se cachean por bloques de 128 tokens desde los 1024 (como la API)
+_BLOQUE_CACHE = 128
+_MINIMO_CACHE = 1024
+
+
+def _tokens(texto: str) -> int:
+    """Tokens aproximados (~4 caracteres por token, igual que openia_script.estimar_tokens)."""
+    return math.ceil(len(texto) / 4)
+
+
+def _texto(rng: random.Random, palabras: int) -> str:
+    oraciones, restantes = [], palabras
+    while restantes > 0:
+        n = min(restantes, rng.randint(10, 20))
+        oracion = " ".join(rng.choice(_PALABRAS) for _ in range(n))
+        oraciones.append(f"{oracion[0].upper()}{oracion[1:]} ({rng.uniform(1, 99):.1f}%).")
+        restantes -= n
+    return " ".join(oraciones)
+
+
+def _instancia(esquema: Dict[str, Any], rng: random.Random) -> Any:
+    """Valor válido para un esquema json_schema (subconjunto usado por los prompts)."""
+    tipo = esquema.get("type")
+    if "enum" in esquema:
+        return rng.choice(esquema["enum"])
+    if tipo == "object":
+        return {clave: _instancia(sub, rng) for clave, sub in esquema.get("properties", {}).items()}
+    if tipo == "array":
+        return [_instancia(esquema.get("items", {}), rng) for _ in range(rng.randint(1, 3))]
+    if tipo == "integer":
+        return rng.randint(0, 100)
+    if tipo == "number":
+        return round(rng.uniform(0, 100), 1)
+    if tipo == "boolean":
+        return rng.random() < 0.5
+    return _texto(rng, rng.randint(8, 25))
+
+
+def _chat_completion(cuerpo: Dict[str, Any], respuesta: Dict[str, Any]) -> Dict[str, Any]:
+    """Objeto chat.completion para una respuesta de SimuladorLLM.responder."""
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": cuerpo.get("model", ""),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": respuesta["contenido"]},
+            "finish_reason": respuesta["fin"],
+        }],
+        "usage": respuesta["usage"],
+    }
+
+
+class SimuladorLLM:
+    """
+    Estado del servidor: configuración, generador aleatorio, caché de prompts
+    simulado y contadores.
+
+    Args:
+        latencia_base: Mediana (s) del tiempo hasta el primer token (lognormal).
+        dispersion: Sigma de la lognormal (0 = latencia fija).
+        segundos_por_token: Tiempo de generación por token de salida.
+        tasa_429: Probabilidad de responder 429 a una petición.
+        max_concurrentes: Peticiones simultáneas admitidas; las demás reciben 429.
+        palabras_respuesta: Largo aproximado de las respuestas de texto.
+        semilla: Semilla de las latencias y de los 429 (el texto no depende de ella).
+    """
+
+    def __init__(self, latencia_base: float = 0.5, dispersion: float = 0.3,
+                 segundos_por_token: float = 0.0, tasa_429: float = 0.0,
+                 max_concurrentes: Optional[int] = None, palabras_respuesta: int = 120,
+                 semilla: int = 0):
+        self.latencia_base = latencia_base
+        self.dispersion = dispersion
+        self.segundos_por_token = segundos_por_token
+        self.tasa_429 = tasa_429
+        self.max_concurrentes = max_concurrentes
+        self.palabras_respuesta = palabras_respuesta
+
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._prefijos: set = set()
+        self._en_curso = 0
+        self._archivos: Dict[str, Tuple[Dict[str, Any], bytes]] = {}
+        self._lotes: Dict[str, Dict[str, Any]] = {}
+        self._contadores = {'peticiones': 0, 'respuestas': 0, 'rechazadas_429': 0,
+                            'max_en_curso': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                            'cached_tokens': 0, 'lotes': 0}
+
+    # ---- Simulación -------------------------------------------------------
+
+    def admitir(self) -> bool:
+        """Registra una petición entrante; False si se debe responder 429."""
+        with self._lock:
+            self._contadores['peticiones'] += 1
+            saturado = self.max_concurrentes is not None and self._en_curso >= self.max_concurrentes
+            if saturado or self._rng.random() < self.tasa_429:
+                self._contadores['rechazadas_429'] += 1
+                return False
+            self._en_curso += 1
+            self._contadores['max_en_curso'] = max(self._contadores['max_en_curso'], self._en_curso)
+            return True
+
+    def liberar(self) -> None:
+        with self._lock:
+            self._en_curso -= 1
+            self._contadores['respuestas'] += 1
+
+    def latencia(self) -> float:
+        """Segundos hasta el primer token."""
+        with self._lock:
+            if self.dispersion <= 0:
+                return self.latencia_base
+            return self.latencia_base * math.exp(self._rng.gauss(0, self.dispersion))
+
+    def tokens_en_cache(self, prompt: str) -> int:
+        """Tokens del prompt servidos desde el caché (prefijo ya visto) y registra el prefijo."""
+        bloques = _tokens(prompt) // _BLOQUE_CACHE
+        largo = _BLOQUE_CACHE * 4
+        claves = [hashlib.sha256(prompt[:k * largo].encode('utf-8')).hexdigest() for k in range(1, bloques + 1)]
+        with self._lock:
+            vistos = max((k for k, clave in enumerate(claves, 1) if clave in self._prefijos), default=0)
+            self._prefijos.update(claves)
+        cached = vistos * _BLOQUE_CACHE
+        return cached if cached >= _MINIMO_CACHE else 0
+
+    def responder(self, cuerpo: Dict[str, Any]) -> Dict[str, Any]:
+        """Contenido y uso deterministas para un cuerpo de chat.completions."""
+        mensajes = cuerpo.get("messages", [])
+        semilla = hashlib.sha256(json.dumps([cuerpo.get("model"), mensajes], sort_keys=True,
+                                            ensure_ascii=False).encode('utf-8')).hexdigest()
+        rng = random.Random(semilla)
+
+        formato = cuerpo.get("response_format") or {}
+        if formato.get("type") == "json_schema":
+            contenido = json.dumps(_instancia(formato["json_schema"]["schema"], rng), ensure_ascii=False)
+        elif formato.get("type") == "json_object":
+            contenido = json.dumps({"respuesta": _texto(rng, self.palabras_respuesta)}, ensure_ascii=False)
+        else:
+            contenido = _texto(rng, self.palabras_respuesta)
+
+        # Se respeta el máximo de tokens pedido (la respuesta se corta, como en la API)
+        maximo = cuerpo.get("max_completion_tokens") or cuerpo.get("max_tokens")
+        fin = "stop"
+        if maximo and _tokens(contenido) > maximo:
+            contenido, fin = contenido[:maximo * 4], "length"
+
+        prompt = "".join(str(m.get("content", "")) for m in mensajes)
+        uso = {
+            "prompt_tokens": _tokens(prompt),
+            "completion_tokens": _tokens(contenido),
+            "prompt_tokens_details": {"cached_tokens": self.tokens_en_cache(prompt)},
+        }
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        with self._lock:
+            for clave in ("prompt_tokens", "completion_tokens"):
+                self._contadores[clave] += uso[clave]
+            self._contadores['cached_tokens'] += uso["prompt_tokens_details"]["cached_tokens"]
+        return {"contenido": contenido, "fin": fin, "usage": uso}
+
+    # ---- Archivos y lotes (Batch API) --------------------------------------
+
+    def guardar_archivo(self, contenido: bytes, nombre: str, proposito: str) -> Dict[str, Any]:
+        """Registra un archivo subido y retorna su objeto 'file'."""
+        archivo = {"id": f"file-{uuid.uuid4().hex[:24]}", "object": "file", "bytes": len(contenido),
+                   "created_at": int(time.time()), "filename": nombre, "purpose": proposito,
+                   "status": "processed"}
+        with self._lock:
+            self._archivos[archivo["id"]] = (archivo, contenido)
+        return archivo
+
+    def archivo(self, archivo_id: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """(objeto 'file', contenido) o None si no existe."""
+        with self._lock:
+            return self._archivos.get(archivo_id)
+
+    def crear_lote(self, input_file_id: str, endpoint: str, completion_window: str) -> Dict[str, Any]:
+        """
+        Crea un lote sobre un archivo JSONL ya subido y lo resuelve en segundo plano.
+
+        Raises:
+            KeyError: Si el archivo no existe.
+        """
+        if self.archivo(input_file_id) is None:
+            raise KeyError(input_file_id)
+        lote = {"id": f"batch_{uuid.uuid4().hex[:24]}", "object": "batch", "endpoint": endpoint,
+                "input_file_id": input_file_id, "completion_window": completion_window,
+                "status": "in_progress", "created_at": int(time.time()), "output_file_id": None,
+                "error_file_id": None, "completed_at": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+        with self._lock:
+            self._lotes[lote["id"]] = lote
+            self._contadores['lotes'] += 1
+        threading.Thread(target=self._resolver_lote, args=(lote["id"],), name=f"lote-{lote['id']}",
+                         daemon=True).start()
+        return dict(lote)
+
+    def lote(self, lote_id: str) -> Optional[Dict[str, Any]]:
+        """Estado actual del lote (None si no existe)."""
+        with self._lock:
+            lote = self._lotes.get(lote_id)
+            return json.loads(json.dumps(lote)) if lote is not None else None
+
+    def _resolver_lote(self, lote_id: str) -> None:
+        with self._lock:
+            lote = self._lotes[lote_id]
+        _, contenido = self.archivo(lote["input_file_id"])
+
+        salidas, errores = [], []
+        for linea in contenido.decode('utf-8').splitlines():
+            if not linea.strip():
+                continue
+            try:
+                peticion = json.loads(linea)
+            except json.JSONDecodeError:
+                errores.append({"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": None, "response": None,
+                                "error": {"code": "invalid_json", "message": "Línea JSONL inválida"}})
+                continue
+            resultado = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": peticion.get("custom_id")}
+            if not str(peticion.get("url", "")).rstrip("/").endswith("/chat/completions"):
+                errores.append(dict(resultado, response=None, error={
+                    "code": "invalid_url", "message": f"Ruta no soportada: {peticion.get('url')}"}))
+                continue
+            cuerpo = peticion.get("body") or {}
+            salidas.append(dict(resultado, error=None, response={
+                "status_code": 200, "request_id": uuid.uuid4().hex,
+                "body": _chat_completion(cuerpo, self.responder(cuerpo)),
+            }))
+
+        def _jsonl(filas: List[Dict[str, Any]]) -> bytes:
+            return "\n".join(json.dumps(fila, ensure_ascii=False) for fila in filas).encode('utf-8')
+
+        salida = self.guardar_archivo(_jsonl(salidas), "batch_output.jsonl", "batch_output") if salidas else None
+        error = self.guardar_archivo(_jsonl(errores), "batch_errors.jsonl", "batch_output") if errores else None
+        with self._lock:
+            lote.update(status="completed", completed_at=int(time.time()),
+                        output_file_id=salida["id"] if salida else None,
+                        error_file_id=error["id"] if error else None,
+                        request_counts={"total": len(salidas) + len(errores), "completed": len(salidas),
+                                        "failed": len(errores)})
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._contadores, en_curso=self._en_curso)
+
+
+# ============================================================================
+# PROTOCOLO HTTP
+# ============================================================================
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    simulador: SimuladorLLM
+
+    def log_message(self, formato, *args) -> None:
+        pass
+
+    def _json(self, estado: int, datos: Dict[str, Any], encabezados: Optional[Dict[str, str]] = None) -> None:
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in (encabezados or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _error(self, estado: int, mensaje: str) -> None:
+        self._json(estado, {"error": {"message": mensaje, "type": "invalid_request_error"}})
+
+    def _ruta(self) -> List[str]:
+        """Segmentos de la ruta sin el prefijo /v1: '/v1/files/x/content' -> ['files', 'x', 'content']."""
+        partes = [p for p in urlsplit(self.path).path.split("/") if p]
+        return partes[1:] if partes[:1] == ["v1"] else partes
+
+    def do_GET(self) -> None:
+        ruta = self._ruta()
+        if ruta == ["estadisticas"]:
+            self._json(200, self.simulador.estadisticas())
+        elif ruta == ["models"]:
+            self._json(200, {"object": "list", "data": []})
+        elif len(ruta) in (2, 3) and ruta[0] == "files" and ruta[2:] in ([], ["content"]):
+            archivo = self.simulador.archivo(ruta[1])
+            if archivo is None:
+                self._error(404, f"No existe el archivo {ruta[1]}")
+            elif ruta[2:]:
+                self._bytes(archivo[1])
+            else:
+                self._json(200, archivo[0])
+        elif len(ruta) == 2 and ruta[0] == "batches":
+            lote = self.simulador.lote(ruta[1])
+            if lote is None:
+                self._error(404, f"No existe el lote {ruta[1]}")
+            else:
+                self._json(200, lote)
+        else:
+            self._error(404, f"Ruta no soportada: {self.path}")
+
+    def _bytes(self, contenido: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def _subir_archivo(self, datos: bytes) -> None:
+        # multipart/form-data con los campos 'file' y 'purpose' (como lo envía el cliente openai)
+        mensaje = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode('latin-1') + datos)
+        campos: Dict[str, Any] = {}
+        if mensaje.is_multipart():
+            for parte in mensaje.iter_parts():
+                nombre = parte.get_param("name", header="content-disposition")
+                campos[nombre] = (parte.get_filename(), parte.get_payload(decode=True) or b"")
+        if "file" not in campos:
+            self._error(400, "Falta el campo 'file' (multipart/form-data)")
+            return
+        nombre_archivo, contenido = campos["file"]
+        proposito = campos.get("purpose", (None, b"batch"))[1].decode('utf-8')
+        self._json(200, self.simulador.guardar_archivo(contenido, nombre_archivo or "archivo", proposito))
+
+    def do_POST(self) -> None:
+        largo = int(self.headers.get("Content-Length", 0))
+        datos = self.rfile.read(largo)
+        ruta = self._ruta()
+
+        if ruta == ["files"]:
+            self._subir_archivo(datos)
+            return
+
+        try:
+            cuerpo = json.loads(datos or b"{}")
+        except json.JSONDecodeError:
+            self._error(400, "JSON inválido")
+            return
+
+        if ruta == ["batches"]:
+            try:
+                self._json(200, self.simulador.crear_lote(cuerpo.get("input_file_id", ""),
+                                                          cuerpo.get("endpoint", "/v1/chat/completions"),
+                                                          cuerpo.get("completion_window", "24h")))
+            except KeyError:
+                self._error(404, f"No existe el archivo {cuerpo.get('input_file_id')}")
+            return
+
+        if ruta != ["chat", "completions"]:
+            self._error(404, f"Ruta no soportada: {self.path}")
+            return
+
+        if not self.simulador.admitir():
+            self._json(429, {"error": {"message": "Rate limit simulado", "type": "requests",
+                                       "code": "rate_limit_exceeded"}},
+                       {"Retry-After": "1", "x-ratelimit-remaining-requests": "0"})
+            return
+
+        try:
+            respuesta = self.simulador.responder(cuerpo)
+            time.sleep(self.simulador.latencia())
+            if cuerpo.get("stream"):
+                self._stream(cuerpo, respuesta)
+            else:
+                time.sleep(respuesta["usage"]["completion_tokens"] * self.simulador.segundos_por_token)
+                self._json(200, _chat_completion(cuerpo, respuesta))
+        finally:
+            self.simulador.liberar()
+
+    def _stream(self, cuerpo: Dict[str, Any], respuesta: Dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": cuerpo.get("model", "")}
+
+        def _evento(choices: List[Dict[str, Any]], usage=None) -> None:
+            datos = dict(base, choices=choices, usage=usage)
+            self.wfile.write(f"data: {json.dumps(datos, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        # Fragmentos de ~4 tokens, a la velocidad configurada
+        contenido = respuesta["contenido"]
+        _evento([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for inicio in range(0, len(contenido), 16):
+            time.sleep(4 * self.simulador.segundos_por_token)
+            _evento([{"index": 0, "delta": {"content": contenido[inicio:inicio + 16]}, "finish_reason": None}])
+        _evento([{"index": 0, "delta": {}, "finish_reason": respuesta["fin"]}])
+
+        if (cuerpo.get("stream_options") or {}).get("include_usage"):
+            _evento([], respuesta["usage"])
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class ServidorLLM(ThreadingHTTPServer):
+    """Servidor HTTP con su SimuladorLLM; `url` es la base_url para el cliente."""
+
+    daemon_threads = True
+
+    def __init__(self, direccion, simulador: SimuladorLLM):
+        manejador = type("Manejador", (_Manejador,), {"simulador": simulador})
+        super().__init__(direccion, manejador)
+        self.simulador = simulador
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}/v1"
+
+    def estadisticas(self) -> Dict[str, int]:
+        return self.simulador.estadisticas()
+
+    def handle_error(self, request, client_address) -> None:
+        # Clientes que cortan la conexión (timeouts, reintentos) no son errores del servidor
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def detener(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def __enter__(self) -> 'ServidorLLM':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.detener()
+
+
+def iniciar_servidor(host: str = "127.0.0.1", puerto: int = 0, **config: Any) -> ServidorLLM:
+    """
+    Levanta el servidor en un hilo aparte y lo retorna (puerto 0 = uno libre).
+
+    Args:
+        **config: Parámetros de SimuladorLLM (latencia_base, dispersion,
+            segundos_por_token, tasa_429, max_concurrentes, ...)
+    """
+    servidor = ServidorLLM((host, puerto), SimuladorLLM(**config))
+    servidor._hilo = threading.Thread(target=servidor.serve_forever, name="servidor_llm", daemon=True)
+    servidor._hilo.start()
+    return servidor
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor local que simula la API de chat.completions y de lotes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--latencia", type=float, default=0.5, help="Mediana (s) hasta el primer token")
+    parser.add_argument("--dispersion", type=float, default=0.3, help="Sigma de la lognormal de latencia")
+    parser.add_argument("--segundos-por-token", type=float, default=0.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="Probabilidad de responder 429")
+    parser.add_argument("--max-concurrentes", type=int, default=None)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    simulador = SimuladorLLM(latencia_base=args.latencia, dispersion=args.dispersion,
+                             segundos_por_token=args.segundos_por_token, tasa_429=args.tasa_429,
+                             max_concurrentes=args.max_concurrentes, semilla=args.semilla)
+    servidor = ServidorLLM((args.host, args.puerto), simulador)
+    print(f"Servidor LLM simulado en {servidor.url} (Ctrl+C para detener)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(json.dumps(simulador.estadisticas(), indent=2))
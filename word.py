@@ -1,16 +1,35 @@
+from __future__ import annotations
+
+import os
+import re
+import copy
+import shutil
+import tempfile
+import warnings
+import zipfile
+from concurrent.futures import Future
 from io import BytesIO
+from xml.sax.saxutils import escape
 from collections import OrderedDict
-from typing import List, Optional, Tuple, Dict, Any
-import pandas as pd
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 # Librerías para manejo de documentos Word (python-docx)
 from docx import Document
 from docx.shared import Inches, Pt, RGBColor, Cm
 from docx.text.paragraph import Paragraph
-from docx.oxml import OxmlElement
+from docx.opc.part import XmlPart
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls
+from lxml import etree
 from docx.oxml.ns import qn
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT, WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_TABLE_ALIGNMENT, WD_ALIGN_VERTICAL
+from docx.enum.style import WD_STYLE_TYPE
+
+from importacion_diferida import modulo_diferido
+from renderizadores import Renderizador, resolver_texto, siguiente_numeracion
+
+pd = modulo_diferido('pandas')
 
 
 def crear_documento_a4() -> Document:
@@ -32,7 +51,194 @@ def guardar_documento(doc: Document, ruta_salida: str) -> None:
     doc.save(ruta_salida)
 
 
+# ============================================================================
+# ESTILOS CON NOMBRE - Se registran una vez por documento y los elementos los referencian
+# ============================================================================
+
+# Rol del elemento -> nombre del estilo en Word
+ESTILOS_INFORME = {
+    'titulo_1': 'Heading 1',
+    'titulo_2': 'Heading 2',
+    'titulo_3': 'Heading 3',
+    'titulo_4': 'Informe Subtítulo',
+    'texto': 'Informe Texto',
+    'vineta': 'Informe Viñeta',
+    'figura': 'Informe Figura',
+    'pie_figura': 'Informe Pie Figura',
+    'tabla': 'Informe Tabla',
+    'advertencia': 'Informe Advertencia',
+}
+
+INSTRUCCION_TOC = r'TOC \o "1-3" \h \z \u'
+
+# Elementos de w:pPr que deben ir después de w:pBdr (orden del esquema)
+_DESPUES_DE_PBDR = ('w:shd', 'w:tabs', 'w:suppressAutoHyphens', 'w:kinsoku', 'w:wordWrap',
+                    'w:overflowPunct', 'w:topLinePunct', 'w:autoSpaceDE', 'w:autoSpaceDN',
+                    'w:bidi', 'w:adjustRightInd', 'w:snapToGrid', 'w:spacing', 'w:ind',
+                    'w:contextualSpacing', 'w:mirrorIndents', 'w:suppressOverlap', 'w:jc',
+                    'w:textDirection', 'w:textAlignment', 'w:textboxTightWrap',
+                    'w:outlineLvl', 'w:divId', 'w:cnfStyle', 'w:rPr', 'w:sectPr', 'w:pPrChange')
+
+
+def _estilo(doc: Document, nombre: str, tipo, base: Optional[str] = None):
+    """Retorna el estilo con ese nombre, creándolo si no existe."""
+    try:
+        return doc.styles[nombre]
+    except KeyError:
+        estilo = doc.styles.add_style(nombre, tipo)
+        if base:
+            estilo.base_style = doc.styles[base]
+        return estilo
+
+
+def _fuente_estilo(estilo, nombre: Optional[str] = None, size=None, color: Optional[RGBColor] = None,
+                   bold: Optional[bool] = None, italic: Optional[bool] = None,
+                   underline: Optional[bool] = None) -> None:
+    """Define la fuente de un estilo quitando las referencias al tema que la anularían."""
+    font = estilo.font
+    if nombre:
+        font.name = nombre
+        rFonts = estilo.element.get_or_add_rPr().find(qn('w:rFonts'))
+        for attr in ('w:asciiTheme', 'w:hAnsiTheme', 'w:eastAsiaTheme', 'w:cstheme'):
+            rFonts.attrib.pop(qn(attr), None)
+    if size is not None:
+        font.size = size
+    if color is not None:
+        font.color.rgb = color
+        color_elem = estilo.element.rPr.find(qn('w:color'))
+        for attr in ('w:themeColor', 'w:themeShade', 'w:themeTint'):
+            color_elem.attrib.pop(qn(attr), None)
+    if bold is not None:
+        font.bold = bold
+    if italic is not None:
+        font.italic = italic
+    if underline is not None:
+        font.underline = underline
+
+
+def _borde_inferior(pPr, sz: str, color: str) -> None:
+    """Reemplaza el borde inferior de un w:pPr (párrafo o estilo)."""
+    for existente in pPr.findall(qn('w:pBdr')):
+        pPr.remove(existente)
+    pBdr = OxmlElement('w:pBdr')
+    bottom = OxmlElement('w:bottom')
+    bottom.set(qn('w:val'), 'single')
+    bottom.set(qn('w:sz'), sz)
+    bottom.set(qn('w:space'), '1')
+    bottom.set(qn('w:color'), color)
+    pBdr.append(bottom)
+    pPr.insert_element_before(pBdr, *_DESPUES_DE_PBDR)
+
+
+def registrar_estilos(doc: Document, config: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Registra (o actualiza) en el documento los estilos de párrafo, carácter y tabla
+    del informe a partir de la configuración del DocumentBuilder.
+
+    Una vez registrados, agregar_titulo, agregar_parrafo, agregar_viñetas,
+    insertar_figura e insertar_tabla referencian los estilos en lugar de escribir
+    fuente, tamaño y color en cada run.
+
+    Returns:
+        Diccionario rol -> nombre de estilo (ESTILOS_INFORME).
+    """
+    fuente_titulo = config['fuente_titulo']
+    fuente_texto = config['fuente_texto']
+
+    # Títulos 1-3: se redefinen los Heading nativos (el índice y la numeración los usan)
+    t1 = _estilo(doc, ESTILOS_INFORME['titulo_1'], WD_STYLE_TYPE.PARAGRAPH)
+    _fuente_estilo(t1, fuente_titulo, config['size_titulo_1'], config['color_titulo'], bold=True)
+    t1.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    t1.paragraph_format.space_before = Pt(18)
+    t1.paragraph_format.space_after = Pt(12)
+    _borde_inferior(t1.element.get_or_add_pPr(), '8', config['color_borde_titulo_1'])
+
+    t2 = _estilo(doc, ESTILOS_INFORME['titulo_2'], WD_STYLE_TYPE.PARAGRAPH)
+    _fuente_estilo(t2, fuente_titulo, config['size_titulo_2'], config['color_subtitulo'], bold=True)
+    t2.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+    t2.paragraph_format.space_before = Pt(14)
+    t2.paragraph_format.space_after = Pt(8)
+    _borde_inferior(t2.element.get_or_add_pPr(), '6', config['color_borde_titulo_2'])
+
+    t3 = _estilo(doc, ESTILOS_INFORME['titulo_3'], WD_STYLE_TYPE.PARAGRAPH)
+    _fuente_estilo(t3, fuente_titulo, config['size_titulo_3'], config['color_subtitulo'], italic=True)
+    t3.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+    t3.paragraph_format.space_before = Pt(10)
+    t3.paragraph_format.space_after = Pt(4)
+
+    texto = _estilo(doc, ESTILOS_INFORME['texto'], WD_STYLE_TYPE.PARAGRAPH, 'Normal')
+    _fuente_estilo(texto, fuente_texto, config['size_texto'])
+    texto.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.JUSTIFY
+
+    t4 = _estilo(doc, ESTILOS_INFORME['titulo_4'], WD_STYLE_TYPE.PARAGRAPH, ESTILOS_INFORME['texto'])
+    _fuente_estilo(t4, bold=True, underline=True)
+
+    vineta = _estilo(doc, ESTILOS_INFORME['vineta'], WD_STYLE_TYPE.PARAGRAPH, ESTILOS_INFORME['texto'])
+    vineta.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+    vineta.paragraph_format.space_before = Pt(4)
+    vineta.paragraph_format.space_after = Pt(4)
+
+    figura = _estilo(doc, ESTILOS_INFORME['figura'], WD_STYLE_TYPE.PARAGRAPH, 'Normal')
+    figura.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+
+    pie = _estilo(doc, ESTILOS_INFORME['pie_figura'], WD_STYLE_TYPE.PARAGRAPH, ESTILOS_INFORME['texto'])
+    _fuente_estilo(pie, size=config['size_pie_figura'], bold=True, italic=True)
+    pie.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+
+    # Entradas del índice (nombres nativos de Word: 'toc 1', 'toc 2', ...)
+    for nivel in (1, 2, 3):
+        toc = _estilo(doc, f'toc {nivel}', WD_STYLE_TYPE.PARAGRAPH, ESTILOS_INFORME['texto'])
+        _fuente_estilo(toc, bold=(nivel == 1))
+        toc.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+        toc.paragraph_format.left_indent = Pt(12) * (nivel - 1)
+        toc.paragraph_format.space_after = Pt(2)
+
+    advertencia = _estilo(doc, ESTILOS_INFORME['advertencia'], WD_STYLE_TYPE.CHARACTER)
+    _fuente_estilo(advertencia, color=config['color_advertencia'], italic=True)
+
+    # Tabla: bordes de 'Table Grid', centrada, celdas centradas y primera fila como
+    # encabezado. Las celdas no llevan propiedades propias: todo sale del estilo.
+    tabla = _estilo(doc, ESTILOS_INFORME['tabla'], WD_STYLE_TYPE.TABLE, 'Table Grid')
+    elemento = tabla.element
+    for tag in ('w:pPr', 'w:rPr', 'w:tblPr', 'w:tcPr', 'w:tblStylePr'):
+        for existente in elemento.findall(qn(tag)):
+            elemento.remove(existente)
+    tabla.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    tabla.paragraph_format.space_after = Pt(0)
+    tabla.font.size = config['size_tabla_datos']
+    size_encabezado = int(config['size_tabla_header'].pt * 2)
+    elemento.append(parse_xml(
+        f'<w:tblPr {nsdecls("w")}><w:jc w:val="center"/></w:tblPr>'
+    ))
+    elemento.append(parse_xml(
+        f'<w:tcPr {nsdecls("w")}><w:vAlign w:val="center"/></w:tcPr>'
+    ))
+    elemento.append(parse_xml(
+        f'<w:tblStylePr {nsdecls("w")} w:type="firstRow"><w:rPr>'
+        f'<w:rFonts w:ascii="{fuente_texto}" w:hAnsi="{fuente_texto}"/><w:b/>'
+        f'<w:sz w:val="{size_encabezado}"/><w:szCs w:val="{size_encabezado}"/>'
+        f'</w:rPr></w:tblStylePr>'
+    ))
+
+    return dict(ESTILOS_INFORME)
+
+
+def _estilos_documento(doc: Document) -> Optional[Dict[str, str]]:
+    """Retorna ESTILOS_INFORME si el documento tiene los estilos registrados."""
+    if doc.styles.element.get_by_name(ESTILOS_INFORME['texto']) is None:
+        return None
+    return ESTILOS_INFORME
+
+
 def agregar_titulo(doc: Document, texto: str, nivel: int) -> None:
+    estilos = _estilos_documento(doc)
+    if estilos:
+        if nivel in (1, 2, 3):
+            doc.add_heading(texto.upper() if nivel == 1 else texto, level=nivel)
+        else:
+            doc.add_paragraph(texto, style=estilos['titulo_4'])
+        return
+
     # Paleta de colores corporativos sobrios
     COLOR_TITULO = RGBColor(0x2E, 0x3F, 0x5F)  # Azul marino oscuro
     COLOR_SUBTITULO = RGBColor(0x4F, 0x4F, 0x4F)  # Gris oscuro
@@ -108,22 +314,32 @@ def agregar_titulo(doc: Document, texto: str, nivel: int) -> None:
         run.font.bold = True
 
 
-def agregar_parrafo(doc: Document, texto: str) -> None:
+def agregar_parrafo(doc: Document, texto: str) -> Paragraph:
+    estilos = _estilos_documento(doc)
+    if estilos:
+        return doc.add_paragraph(texto, style=estilos['texto'])
+
     parrafo = doc.add_paragraph(texto)
     parrafo.alignment = WD_PARAGRAPH_ALIGNMENT.JUSTIFY
     run = parrafo.runs[0]
     run.font.name = 'Segoe UI Light'
     run.font.size = Pt(8)
+    return parrafo
 
 
 def insertar_figura(doc: Document, figura, titulo: Optional[str] = None, pie: Optional[str] = None, ancho_cm: Optional[float] = None, alto_cm: Optional[float] = None) -> None:
     if titulo:
         agregar_titulo(doc, titulo, 3)
-    imagen_stream = BytesIO()
-    figura.savefig(imagen_stream, format='png', bbox_inches='tight')
-    imagen_stream.seek(0)
+    # La figura puede venir ya renderizada (bytes png, ver graficos.renderizar)
+    if isinstance(figura, (bytes, bytearray)):
+        imagen_stream = BytesIO(figura)
+    else:
+        imagen_stream = BytesIO()
+        figura.savefig(imagen_stream, format='png', bbox_inches='tight')
+        imagen_stream.seek(0)
 
-    p = doc.add_paragraph()
+    estilos = _estilos_documento(doc)
+    p = doc.add_paragraph(style=estilos['figura'] if estilos else None)
     run = p.add_run()
 
     # Determinar dimensiones de la imagen
@@ -136,10 +352,13 @@ def insertar_figura(doc: Document, figura, titulo: Optional[str] = None, pie: Op
     else:
         run.add_picture(imagen_stream, width=Inches(5.5))
 
-    p.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    if not estilos:
+        p.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
     imagen_stream.close()
 
-    if pie:
+    if pie and estilos:
+        doc.add_paragraph(pie, style=estilos['pie_figura'])
+    elif pie:
         pie_p = doc.add_paragraph(pie)
         pie_p.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
         run = pie_p.runs[0]
@@ -169,10 +388,45 @@ def set_cell_width(cell, width_inches: float) -> None:
     tcPr.append(tcW)
 
 
+def _fila_xml(valores) -> str:
+    celdas = []
+    for valor in valores:
+        lineas = [escape(linea) for linea in str(valor).split('\n')]
+        contenido = '</w:t><w:br/><w:t xml:space="preserve">'.join(lineas)
+        celdas.append(f'<w:tc><w:p><w:r><w:t xml:space="preserve">{contenido}</w:t></w:r></w:p></w:tc>')
+    return f'<w:tr {nsdecls("w")}>{"".join(celdas)}</w:tr>'
+
+
+def _tabla_con_estilos(doc: Document, df, estilos: Dict[str, str], ancho_total: float = 6.0):
+    """
+    Crea la tabla con el estilo registrado. El ancho va en la grilla (sin w:tcW por
+    celda) y fuente, alineación y encabezado salen del estilo de tabla, así cada
+    celda es solo texto. Las filas se arman directamente como XML.
+    """
+    tabla = doc.add_table(rows=0, cols=len(df.columns))
+    tabla.style = estilos['tabla']
+    tabla.autofit = False
+
+    ancho_columna = Inches(ancho_total / len(df.columns))
+    for columna in tabla.columns:
+        columna.width = ancho_columna
+
+    tbl = tabla._tbl
+    tbl.append(parse_xml(_fila_xml(df.columns)))
+    for row in df.itertuples(index=False, name=None):
+        tbl.append(parse_xml(_fila_xml(row)))
+
+    return tabla
+
+
 def insertar_tabla(doc: Document, df, titulo: Optional[str] = None):
     if titulo:
         agregar_titulo(doc, titulo, 3)
 
+    estilos = _estilos_documento(doc)
+    if estilos:
+        return _tabla_con_estilos(doc, df, estilos)
+
     tabla = doc.add_table(rows=1, cols=len(df.columns))
     tabla.style = 'Table Grid'
     tabla.alignment = WD_TABLE_ALIGNMENT.CENTER
@@ -209,40 +463,13 @@ def insertar_tabla(doc: Document, df, titulo: Optional[str] = None):
 
 
 def insertar_tabla_con_merge(doc: Document, df, titulo: Optional[str] = None, group_cols: Optional[List[str]] = None):
-    if titulo:
-        agregar_titulo(doc, titulo, 3)
-
-    tabla = doc.add_table(rows=1, cols=len(df.columns))
-    tabla.style = 'Table Grid'
-    tabla.alignment = WD_TABLE_ALIGNMENT.CENTER
-
-    ancho_total = 6.0
-    ancho_columna = ancho_total / len(df.columns)
-
-    # Encabezados
-    hdr_cells = tabla.rows[0].cells
-    for i, col in enumerate(df.columns):
-        cell = hdr_cells[i]
-        cell.text = str(col)
-        run = cell.paragraphs[0].runs[0]
-        run.font.bold = True
-        run.font.size = Pt(6.5)
-        run.font.name = 'Segoe UI Light'
-        set_cell_width(cell, ancho_columna)
-        cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-        cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-
-    # Filas de datos
-    for _, row in df.iterrows():
-        row_cells = tabla.add_row().cells
-        for i, val in enumerate(row):
-            cell = row_cells[i]
-            cell.text = str(val)
-            run = cell.paragraphs[0].runs[0]
-            run.font.size = Pt(7)
-            set_cell_width(cell, ancho_columna)
-            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+    estilos = _estilos_documento(doc)
+    if estilos:
+        if titulo:
+            agregar_titulo(doc, titulo, 3)
+        tabla = _tabla_con_estilos(doc, df, estilos)
+    else:
+        tabla = insertar_tabla(doc, df, titulo)
 
     if group_cols:
         col2idx = {col: idx for idx, col in enumerate(df.columns)}
@@ -265,8 +492,9 @@ def insertar_tabla_con_merge(doc: Document, df, titulo: Optional[str] = None, gr
                     for r in range(current_row + 1, current_row + size):
                         tabla.cell(r, c_idx).text = ''
                     start.merge(end)
-                    start.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    start.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+                    if not estilos:
+                        start.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+                        start.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
             current_row += size
 
     return tabla
@@ -288,6 +516,19 @@ def agregar_viñetas(
     """
     indent_por_nivel = Pt(12)
 
+    estilos = _estilos_documento(doc)
+    if estilos:
+        for texto in items:
+            p = doc.add_paragraph(f"- {texto}", style=estilos['vineta'])
+            # Solo se escribe en el párrafo lo que difiere del estilo
+            if espacio_antes != Pt(4):
+                p.paragraph_format.space_before = espacio_antes
+            if espacio_despues != Pt(4):
+                p.paragraph_format.space_after = espacio_despues
+            if nivel > 1:
+                p.paragraph_format.left_indent = indent_por_nivel * (nivel - 1)
+        return
+
     for texto in items:
         p = doc.add_paragraph()
         p.paragraph_format.space_before = espacio_antes
@@ -310,38 +551,45 @@ def insertar_en_posicion(
     """
     Inserta contenido generado por una función en una posición específica del documento.
     posicion: 'inicio', 'final' o 'index:<n>'
+
+    La función escribe directamente en `doc` (así imágenes y estilos quedan en el
+    documento correcto) y los elementos nuevos se mueven luego a la posición pedida.
     """
-    doc_temp = Document()
-    funcion_contenido(doc_temp, *args, **kwargs)
+    if posicion not in ('inicio', 'final') and not posicion.startswith('index:'):
+        raise ValueError("La posición debe ser 'inicio', 'final' o 'index:<n>'")
 
-    elementos_temp = list(doc_temp.element.body)
     body = doc.element.body
+    # Mantener las referencias vivas garantiza que lxml devuelva los mismos objetos
+    existentes = list(body)
+    ids_existentes = {id(elem) for elem in existentes}
 
-    if posicion == 'inicio':
-        for elem in reversed(elementos_temp):
-            body.insert(0, elem)
-    elif posicion == 'final':
-        for elem in elementos_temp:
-            body.append(elem)
-    elif posicion.startswith('index:'):
-        idx = int(posicion.split(':')[1])
-        for i, elem in enumerate(elementos_temp):
-            body.insert(idx + i, elem)
-    else:
-        raise ValueError("La posición debe ser 'inicio', 'final' o 'index:<n>'")
+    funcion_contenido(doc, *args, **kwargs)
+
+    if posicion == 'final':
+        return
+
+    nuevos = [elem for elem in body if id(elem) not in ids_existentes]
+    idx = 0 if posicion == 'inicio' else int(posicion.split(':')[1])
+    for i, elem in enumerate(nuevos):
+        body.insert(idx + i, elem)
 
 
-def insertar_indice(doc: Document, titulo: str = "Índice") -> None:
+def insertar_indice(doc: Document, titulo: str = "Índice") -> Paragraph:
+    """
+    Inserta el título y un campo TOC vacío marcado para actualizarse al abrir en Word.
+    Retorna el párrafo del campo, que poblar_indice() puede reemplazar por las entradas.
+    """
     agregar_titulo(doc, titulo, 1)
     p = doc.add_paragraph()
     run = p.add_run()
 
     fldChar1 = OxmlElement('w:fldChar')
     fldChar1.set(qn('w:fldCharType'), 'begin')
+    fldChar1.set(qn('w:dirty'), 'true')
 
     instrText = OxmlElement('w:instrText')
     instrText.set(qn('xml:space'), 'preserve')
-    instrText.text = r'TOC \o "1-3" \h \z \u'
+    instrText.text = INSTRUCCION_TOC
 
     fldChar2 = OxmlElement('w:fldChar')
     fldChar2.set(qn('w:fldCharType'), 'separate')
@@ -356,13 +604,135 @@ def insertar_indice(doc: Document, titulo: str = "Índice") -> None:
 
     p.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
     p.paragraph_format.space_after = Pt(6)
+    return p
+
+
+def _texto_elemento(elem) -> str:
+    return ''.join(t.text or '' for t in elem.iter(qn('w:t')))
+
+
+def _marcar_titulo(p, nombre: str, bookmark_id: int) -> None:
+    """Envuelve el contenido del título en un marcador (bookmark)."""
+    inicio = OxmlElement('w:bookmarkStart')
+    inicio.set(qn('w:id'), str(bookmark_id))
+    inicio.set(qn('w:name'), nombre)
+    fin = OxmlElement('w:bookmarkEnd')
+    fin.set(qn('w:id'), str(bookmark_id))
+
+    pPr = p.find(qn('w:pPr'))
+    if pPr is not None:
+        pPr.addnext(inicio)
+    else:
+        p.insert(0, inicio)
+    p.append(fin)
+
+
+def _ids_estilo_titulos(doc: Document, niveles: int = 3) -> Dict[str, int]:
+    """styleId de cada Heading 1..niveles -> nivel."""
+    ids_estilo = {}
+    for nivel in range(1, niveles + 1):
+        try:
+            ids_estilo[doc.styles[f'Heading {nivel}'].style_id] = nivel
+        except KeyError:
+            continue
+    return ids_estilo
+
+
+def _entrada_indice(p, ids_estilo: Dict[str, int], siguiente_id: int) -> Tuple[Optional[Tuple[int, str, str]], int]:
+    """
+    Si el párrafo es un título, le asegura un marcador `_Toc...` y retorna su entrada
+    (nivel, marcador, texto) junto con el próximo id de marcador libre.
+    """
+    pStyle = p.find(f"{qn('w:pPr')}/{qn('w:pStyle')}")
+    nivel = ids_estilo.get(pStyle.get(qn('w:val'))) if pStyle is not None else None
+    if nivel is None:
+        return None, siguiente_id
+
+    for bookmark in p.iterchildren(qn('w:bookmarkStart')):
+        if bookmark.get(qn('w:name'), '').startswith('_Toc'):
+            return (nivel, bookmark.get(qn('w:name')), _texto_elemento(p)), siguiente_id
+
+    nombre = f'_Toc{siguiente_id:09d}'
+    _marcar_titulo(p, nombre, siguiente_id)
+    return (nivel, nombre, _texto_elemento(p)), siguiente_id + 1
+
+
+def _parrafos_indice_xml(doc: Document, entradas: List[Tuple[int, str, str]], niveles: int = 3) -> List[str]:
+    """XML de los párrafos del índice: el campo TOC envuelve todas las entradas."""
+    for nivel in range(1, niveles + 1):
+        _estilo(doc, f'toc {nivel}', WD_STYLE_TYPE.PARAGRAPH, 'Normal')
+    id_estilo_toc = {nivel: doc.styles[f'toc {nivel}'].style_id for nivel in range(1, niveles + 1)}
+
+    inicio_campo = (
+        '<w:r><w:fldChar w:fldCharType="begin" w:dirty="true"/></w:r>'
+        f'<w:r><w:instrText xml:space="preserve"> {escape(INSTRUCCION_TOC)} </w:instrText></w:r>'
+        '<w:r><w:fldChar w:fldCharType="separate"/></w:r>'
+    )
+    fin_campo = '<w:r><w:fldChar w:fldCharType="end"/></w:r>'
+
+    parrafos = []
+    for i, (nivel, nombre, texto) in enumerate(entradas):
+        parrafos.append(
+            f'<w:p {nsdecls("w")}><w:pPr><w:pStyle w:val="{id_estilo_toc[nivel]}"/></w:pPr>'
+            f'{inicio_campo if i == 0 else ""}'
+            f'<w:hyperlink w:anchor="{nombre}" w:history="1">'
+            f'<w:r><w:t xml:space="preserve">{escape(texto)}</w:t></w:r></w:hyperlink>'
+            f'{fin_campo if i == len(entradas) - 1 else ""}</w:p>'
+        )
+    if not parrafos:
+        parrafos.append(f'<w:p {nsdecls("w")}>{inicio_campo}{fin_campo}</w:p>')
+    return parrafos
+
+
+def poblar_indice(doc: Document, marcador: List, niveles: int = 3) -> List:
+    """
+    Reemplaza el campo TOC por un índice ya calculado: una entrada por título
+    (Heading 1..niveles) con hipervínculo a un marcador `_Toc...` en el título.
+
+    El campo se conserva (marcado como pendiente de actualizar), de modo que Word
+    lo regenera con números de página, pero cualquier conversor que no ejecute
+    la maquetación de Word ya ve el índice completo.
+
+    Args:
+        doc: Documento.
+        marcador: Elementos que ocupa hoy el índice (el párrafo que retorna
+            insertar_indice o la lista que retornó una llamada previa).
+        niveles: Niveles de título a incluir.
+
+    Returns:
+        Lista de los párrafos del índice, para volver a poblarlo más adelante.
+    """
+    body = doc.element.body
+    ids_estilo = _ids_estilo_titulos(doc, niveles)
+    ids_usados = [int(b.get(qn('w:id'))) for b in body.iter(qn('w:bookmarkStart'))]
+    siguiente_id = max(ids_usados, default=0) + 1
+
+    entradas = []
+    for p in body.iterchildren(qn('w:p')):
+        entrada, siguiente_id = _entrada_indice(p, ids_estilo, siguiente_id)
+        if entrada:
+            entradas.append(entrada)
+
+    parrafos = _parrafos_indice_xml(doc, entradas, niveles)
+    nuevos = [parse_xml(xml) for xml in parrafos]
+    marcador = [m._p if isinstance(m, Paragraph) else m for m in marcador]
+    ancla = marcador[0]
+    for elem in nuevos:
+        ancla.addprevious(elem)
+    for elem in marcador:
+        elem.getparent().remove(elem)
+    return nuevos
 
 
 def agregar_advertencia_actualizacion(doc: Document) -> None:
     p = doc.add_paragraph()
     run = p.add_run("⚠️ Al abrir este documento, recuerde actualizar los campos (índice, referencias cruzadas, etc.).")
-    run.font.italic = True
-    run.font.color.rgb = RGBColor(0x80, 0x00, 0x00)
+    estilos = _estilos_documento(doc)
+    if estilos:
+        run.style = estilos['advertencia']
+    else:
+        run.font.italic = True
+        run.font.color.rgb = RGBColor(0x80, 0x00, 0x00)
     p.paragraph_format.space_before = Pt(12)
 
 
@@ -412,38 +782,32 @@ def reemplazar_parrafo(original: Paragraph, nuevo: Paragraph) -> None:
 
 
 def numerar_titulos_existentes(doc: Document) -> None:
+    """
+    Numera los títulos (Heading 1-3) en una sola pasada, editando el texto del
+    primer run de cada título en el lugar. Se conserva el formato del título.
+    """
     contador = {1: 0, 2: 0, 3: 0}
-    reemplazos: List[Tuple[Paragraph, Paragraph]] = []
 
-    for _, parrafo in enumerate(doc.paragraphs):
+    for parrafo in doc.paragraphs:
         estilo = parrafo.style.name.strip()
-        if estilo.startswith("Heading"):
-            try:
-                nivel = int(estilo.split()[-1])
-            except (ValueError, IndexError):
+        if not estilo.startswith("Heading"):
+            continue
+        try:
+            nivel = int(estilo.split()[-1])
+        except (ValueError, IndexError):
+            continue
+
+        if nivel in contador:
+            numeracion = siguiente_numeracion(contador, nivel)
+            texto = parrafo.text.strip()
+            if texto.startswith(numeracion):
                 continue
 
-            if nivel in contador:
-                contador[nivel] += 1
-                for deeper in range(nivel + 1, 4):
-                    contador[deeper] = 0
-
-                if nivel == 1:
-                    numeracion = f"{contador[1]}."
-                elif nivel == 2:
-                    numeracion = f"{contador[1]}.{contador[2]}"
-                else:
-                    numeracion = f"{contador[1]}.{contador[2]}.{contador[3]}"
-
-                texto = parrafo.text.strip()
-                if not texto.startswith(numeracion):
-                    doc_temp = Document()
-                    agregar_titulo(doc_temp, f"{numeracion} {texto}", nivel)
-                    nuevo_parrafo = doc_temp.paragraphs[0]
-                    reemplazos.append((parrafo, nuevo_parrafo))
-
-    for original, nuevo in reemplazos:
-        reemplazar_parrafo(original, nuevo)
+            runs = parrafo.runs
+            if runs:
+                runs[0].text = f"{numeracion} {runs[0].text.lstrip()}"
+            else:
+                parrafo.add_run(numeracion)
 
 
 # ============================================================================
@@ -822,16 +1186,237 @@ class PaletaColores:
     CYAN = 'D0F0FD'
     BLANCO = 'FFFFFF'
 
+# ============================================================================
+# ESCRITURA EN STREAMING - Cuerpo e imágenes a disco a medida que se agregan
+# ============================================================================
+
+class _EscritorStreaming:
+    """
+    Serializa los elementos del cuerpo a un `document.xml` temporal y escribe
+    cada imagen en el .docx de salida apenas su párrafo se vuelca.
+
+    En memoria solo quedan los elementos agregados desde el último volcado; las
+    partes de imagen ya escritas se vacían (conservan nombre y relación). Al
+    finalizar, el paquete python-docx (ya sin cuerpo ni imágenes) se guarda y se
+    combina con el cuerpo temporal en el archivo final.
+    """
+
+    _NS_DECL = re.compile(rb' xmlns:(\w+)="([^"]*)"')
+    _TAM_BLOQUE = 1024 * 1024
+
+    def __init__(self, doc: Document, directorio: Optional[str] = None):
+        self.doc = doc
+        self.dir = tempfile.mkdtemp(prefix='informe_', dir=directorio)
+        self.cuerpo = open(os.path.join(self.dir, 'body.xml'), 'w+b')
+        self.ruta_zip = os.path.join(self.dir, 'documento.docx')
+        self.zip = zipfile.ZipFile(self.ruta_zip, 'w', zipfile.ZIP_DEFLATED)
+        self.medios: set = set()
+        self.titulos: List[Tuple[int, str, str]] = []
+        self.offset_indice: Optional[int] = None
+        self.siguiente_bookmark = 1
+        self.cerrado = False
+        self._ids_estilo = _ids_estilo_titulos(doc)
+        # Declaraciones ya presentes en <w:document>: se omiten en cada elemento
+        self._ns_raiz = {
+            prefijo.encode(): uri.encode() for prefijo, uri in doc.element.nsmap.items() if prefijo
+        }
+
+    def _serializar(self, elem) -> bytes:
+        xml = etree.tostring(elem, encoding='utf-8')
+        fin_tag = xml.index(b'>')
+
+        def _quitar(match):
+            return b'' if self._ns_raiz.get(match.group(1)) == match.group(2) else match.group(0)
+
+        return self._NS_DECL.sub(_quitar, xml[:fin_tag]) + xml[fin_tag:]
+
+    def _volcar_medios(self, elem) -> None:
+        part = self.doc.part
+        for blip in elem.iter(qn('a:blip')):
+            rId = blip.get(qn('r:embed'))
+            imagen = part.related_parts.get(rId) if rId else None
+            if imagen is None or imagen.partname in self.medios:
+                continue
+            self.zip.writestr(imagen.partname.lstrip('/'), imagen.blob)
+            self.medios.add(imagen.partname)
+            # Se libera la imagen; la parte queda para conservar nombre y relación
+            imagen._blob = b''
+            imagen._image = None
+
+    def volcar(self, marcador_indice=None, detener_en=None) -> bool:
+        """
+        Escribe y quita del árbol todos los elementos del cuerpo salvo sectPr.
+
+        Si se indica `detener_en`, el volcado se detiene antes de ese elemento (un
+        párrafo reservado aún sin texto): él y los siguientes quedan en memoria.
+
+        Returns:
+            True si en este volcado pasó el párrafo del índice (queda reservado su lugar).
+        """
+        if self.cerrado:
+            raise RuntimeError("El documento en modo streaming ya fue guardado")
+
+        body = self.doc.element.body
+        paso_indice = False
+        for elem in list(body):
+            if elem.tag == qn('w:sectPr'):
+                continue
+            if detener_en is not None and elem is detener_en:
+                break
+            if marcador_indice is not None and elem is marcador_indice:
+                self.offset_indice = self.cuerpo.tell()
+                paso_indice = True
+            else:
+                if elem.tag == qn('w:p'):
+                    entrada, self.siguiente_bookmark = _entrada_indice(elem, self._ids_estilo, self.siguiente_bookmark)
+                    if entrada:
+                        self.titulos.append(entrada)
+                self._volcar_medios(elem)
+                self.cuerpo.write(self._serializar(elem))
+            body.remove(elem)
+        return paso_indice
+
+    def _copiar_cuerpo(self, destino, desde: int, hasta: Optional[int]) -> None:
+        self.cuerpo.seek(desde)
+        restante = None if hasta is None else hasta - desde
+        while restante is None or restante > 0:
+            bloque = self.cuerpo.read(self._TAM_BLOQUE if restante is None else min(self._TAM_BLOQUE, restante))
+            if not bloque:
+                break
+            destino.write(bloque)
+            if restante is not None:
+                restante -= len(bloque)
+
+    def finalizar(self, ruta: str, con_indice: bool = False) -> None:
+        """Arma el .docx final en `ruta` y elimina los temporales."""
+        try:
+            # El índice se calcula antes de guardar: puede registrar los estilos 'toc N'
+            indice = [self._serializar(parse_xml(xml)) for xml in _parrafos_indice_xml(self.doc, self.titulos)]
+
+            buffer = BytesIO()
+            self.doc.save(buffer)
+            buffer.seek(0)
+
+            with zipfile.ZipFile(buffer) as paquete:
+                document_xml = paquete.read('word/document.xml')
+                for info in paquete.infolist():
+                    if info.filename == 'word/document.xml' or f'/{info.filename}' in self.medios:
+                        continue
+                    self.zip.writestr(info, paquete.read(info.filename))
+
+            inicio_body = document_xml.index(b'<w:body>') + len(b'<w:body>')
+            fin = self.cuerpo.seek(0, os.SEEK_END)
+            with self.zip.open('word/document.xml', 'w') as destino:
+                destino.write(document_xml[:inicio_body])
+                if con_indice and self.offset_indice is not None:
+                    self._copiar_cuerpo(destino, 0, self.offset_indice)
+                    for xml in indice:
+                        destino.write(xml)
+                    self._copiar_cuerpo(destino, self.offset_indice, fin)
+                else:
+                    self._copiar_cuerpo(destino, 0, fin)
+                destino.write(document_xml[inicio_body:])
+
+            self.zip.close()
+            shutil.move(self.ruta_zip, ruta)
+        finally:
+            self.cerrado = True
+            self.cuerpo.close()
+            if self.zip.fp is not None:
+                self.zip.close()
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# ============================================================================
+# PLANTILLAS - Clonado del paquete en memoria para generación en lote
+# ============================================================================
+
+def clonar_documento(doc: Document) -> Document:
+    """
+    Retorna una copia independiente del documento sin serializar ni volver a parsear.
+
+    Cada parte XML se clona con deepcopy de su árbol lxml; las partes binarias
+    (imágenes, tema) comparten el blob, que es inmutable. Las relaciones se
+    rehacen con los mismos rId.
+    """
+    origen = doc.part.package
+    destino = type(origen)()
+
+    copias = {}
+    for part in origen.iter_parts():
+        if isinstance(part, XmlPart):
+            copias[part] = type(part)(part.partname, part.content_type, copy.deepcopy(part.element), destino)
+        else:
+            copias[part] = type(part).load(part.partname, part.content_type, part.blob, destino)
+
+    def _copiar_relaciones(rels_origen, rels_destino):
+        for rId, rel in rels_origen.items():
+            target = rel.target_ref if rel.is_external else copias[rel.target_part]
+            rels_destino.add_relationship(rel.reltype, target, rId, rel.is_external)
+
+    _copiar_relaciones(origen.rels, destino.rels)
+    for part, copia in copias.items():
+        _copiar_relaciones(part.rels, copia.rels)
+
+    return destino.main_document_part.document
+
+
+class PlantillaInforme:
+    """
+    Encabezado común de un informe (índice, advertencia, títulos y textos fijos)
+    construido una sola vez; cada informe parte de un clon en memoria.
+
+    Ejemplo:
+        >>> def preparar(builder):
+        ...     builder.indice().salto_pagina().titulo("INFORME DE ANÁLISIS", 1)
+        >>> plantilla = PlantillaInforme(preparar, config={'numerar_titulos': True})
+        >>> for proyecto in proyectos:
+        ...     builder = plantilla.nuevo()
+        ...     builder.titulo(proyecto, 2).guardar(f"{proyecto}.docx")
+    """
+
+    def __init__(self, preparar: Optional[Callable[['DocumentBuilder'], Any]] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            preparar: Función que recibe el DocumentBuilder base y agrega el contenido fijo.
+            config: Configuración del DocumentBuilder (el streaming se elige en nuevo()).
+        """
+        config = dict(config or {})
+        config['streaming'] = False
+        self._base = DocumentBuilder(config=config)
+        if preparar is not None:
+            preparar(self._base)
+
+    def nuevo(self, streaming: bool = False) -> 'DocumentBuilder':
+        """Retorna un DocumentBuilder independiente que continúa desde la plantilla."""
+        return self._base._clonar(streaming=streaming)
+
+
+_plantillas: Dict[str, PlantillaInforme] = {}
+
+
+def obtener_plantilla(nombre: str, preparar: Optional[Callable[['DocumentBuilder'], Any]] = None,
+                      config: Optional[Dict[str, Any]] = None) -> PlantillaInforme:
+    """
+    Retorna la plantilla `nombre`, construyéndola la primera vez que se pide.
+    """
+    if nombre not in _plantillas:
+        _plantillas[nombre] = PlantillaInforme(preparar, config)
+    return _plantillas[nombre]
+
+
 # ============================================================================
 # CLASE DOCUMENTBUILDER - Patrón Builder para construcción fluida de documentos
 # ============================================================================
 
-class DocumentBuilder:
+class DocumentBuilder(Renderizador):
     """
     Constructor fluido de documentos Word con configuración centralizada.
 
     Permite crear documentos mediante encadenamiento de métodos y mantiene
-    un historial de operaciones para debugging.
+    un historial de operaciones para debugging. Comparte la API de
+    renderizadores.Renderizador (ver RenderizadorHTML para una vista previa).
 
     Ejemplo básico:
         >>> builder = DocumentBuilder()
@@ -852,6 +1437,8 @@ class DocumentBuilder:
         ...        .guardar("documento.docx")
     """
 
+    extension = '.docx'
+
     def __init__(self, config: Optional[Dict[str, Any]] = None):
         """
         Inicializa el constructor con configuración personalizable.
@@ -861,9 +1448,15 @@ class DocumentBuilder:
                 - page_height, page_width: Dimensiones de página (Inches)
                 - margin_top, margin_bottom, margin_left, margin_right: Márgenes (Inches)
                 - fuente_titulo, fuente_texto: Nombres de fuentes
-                - color_titulo, color_subtitulo: Colores RGB
+                - color_titulo, color_subtitulo, color_advertencia: Colores RGB
+                - color_borde_titulo_1, color_borde_titulo_2: Color hex de la línea bajo el título
                 - size_titulo_1, size_titulo_2, size_titulo_3, size_texto: Tamaños (Pt)
+                - size_pie_figura, size_tabla_header, size_tabla_datos: Tamaños (Pt)
                 - ancho_tabla_default: Ancho por defecto de tablas (float)
+                - numerar_titulos: Si True, titulo() numera al vuelo (1., 1.1, 1.1.1)
+                - streaming: Si True, los elementos terminados se escriben a disco a medida
+                  que se agregan (ver _volcar) y la memoria no crece con el informe
+                - directorio_temporal: Carpeta para los archivos intermedios del streaming
         """
         self.doc = Document()
         self.config = self._configuracion_default()
@@ -872,7 +1465,13 @@ class DocumentBuilder:
             self.config.update(config)
 
         self._configurar_pagina()
+        self.estilos = registrar_estilos(self.doc, self.config)
         self._historial: List[str] = []
+        self._indice: Optional[List] = None
+        self._contador_titulos = {1: 0, 2: 0, 3: 0}
+        self._pendientes: List[Tuple[Paragraph, Union[str, Future]]] = []
+        self._stream = _EscritorStreaming(self.doc, self.config['directorio_temporal']) \
+            if self.config['streaming'] else None
 
     def _configuracion_default(self) -> Dict[str, Any]:
         """
@@ -897,6 +1496,9 @@ class DocumentBuilder:
             # Colores corporativos
             'color_titulo': RGBColor(0x2E, 0x3F, 0x5F),
             'color_subtitulo': RGBColor(0x4F, 0x4F, 0x4F),
+            'color_borde_titulo_1': '2E3F5F',
+            'color_borde_titulo_2': 'D3D3D3',
+            'color_advertencia': RGBColor(0x80, 0x00, 0x00),
 
             # Tamaños de fuente
             'size_titulo_1': Pt(14),
@@ -909,6 +1511,13 @@ class DocumentBuilder:
             'ancho_tabla_default': 6.0,
             'size_tabla_header': Pt(6.5),
             'size_tabla_datos': Pt(7),
+
+            # Numeración de títulos al construir (evita la pasada de numerar_titulos)
+            'numerar_titulos': False,
+
+            # Escritura incremental a disco para informes muy grandes
+            'streaming': False,
+            'directorio_temporal': None,
         }
 
     def _configurar_pagina(self) -> None:
@@ -921,6 +1530,64 @@ class DocumentBuilder:
         section.left_margin = self.config['margin_left']
         section.right_margin = self.config['margin_right']
 
+    def _clonar(self, streaming: bool = False) -> 'DocumentBuilder':
+        """Copia independiente del builder y su documento (ver clonar_documento)."""
+        if self._stream is not None:
+            raise RuntimeError("No se puede clonar un builder en modo streaming")
+        if self._pendientes:
+            raise RuntimeError("No se puede clonar un builder con párrafos reservados sin completar")
+
+        clon = DocumentBuilder.__new__(DocumentBuilder)
+        clon.doc = clonar_documento(self.doc)
+        clon.config = dict(self.config, streaming=streaming)
+        clon.estilos = dict(self.estilos)
+        clon._historial = list(self._historial)
+        clon._contador_titulos = dict(self._contador_titulos)
+        clon._pendientes = []
+
+        # El marcador del índice se ubica por posición en el cuerpo clonado
+        clon._indice = None
+        if self._indice:
+            cuerpo = list(self.doc.element.body)
+            cuerpo_clon = list(clon.doc.element.body)
+            elementos = [m._p if isinstance(m, Paragraph) else m for m in self._indice]
+            clon._indice = [cuerpo_clon[cuerpo.index(elem)] for elem in elementos]
+
+        clon._stream = _EscritorStreaming(clon.doc, clon.config['directorio_temporal']) if streaming else None
+        return clon
+
+    def _volcar(self) -> None:
+        """
+        En modo streaming, escribe a disco todos los elementos ya agregados.
+
+        Se llama al inicio de cada operación del builder, así el elemento recién
+        agregado (p. ej. una tabla insertada con word.insertar_tabla(builder.doc, ...))
+        puede formatearse hasta la siguiente operación; después ya no está en memoria.
+        """
+        if self._stream is None:
+            return
+        self._completar_pendientes(esperar=False)
+        marcador = self._indice[0] if self._indice and not isinstance(self._indice, str) else None
+        if isinstance(marcador, Paragraph):
+            marcador = marcador._p
+        detener_en = self._pendientes[0][0]._p if self._pendientes else None
+        if self._stream.volcar(marcador, detener_en):
+            self._indice = 'volcado'
+
+    def _completar_pendientes(self, esperar: bool = True) -> None:
+        """
+        Escribe el texto de los párrafos reservados cuyo Future ya terminó (o de
+        todos, esperándolos, si `esperar`). Se ejecuta en el hilo del builder:
+        los hilos de las llamadas nunca tocan el documento.
+        """
+        restantes = []
+        for parrafo, futuro in self._pendientes:
+            if esperar or not isinstance(futuro, Future) or futuro.done():
+                parrafo.text = resolver_texto(futuro)
+            else:
+                restantes.append((parrafo, futuro))
+        self._pendientes = restantes
+
     def titulo(self, texto: str, nivel: int = 1) -> 'DocumentBuilder':
         """
         Agrega un título al documento con formato jerárquico.
@@ -937,10 +1604,18 @@ class DocumentBuilder:
             >>> builder.titulo("Sección 1.1", 2)
             >>> builder.titulo("Subsección 1.1.1", 3)
         """
+        self._volcar()
+        texto = self._numerar(texto, nivel)
         agregar_titulo(self.doc, texto, nivel)
         self._historial.append(f"Título nivel {nivel}: {texto}")
         return self
 
+    def _numerar(self, texto: str, nivel: int) -> str:
+        """Antepone la numeración al título si el builder numera al vuelo."""
+        if self.config['numerar_titulos'] and nivel in self._contador_titulos:
+            return f"{siguiente_numeracion(self._contador_titulos, nivel)} {texto}"
+        return texto
+
     def parrafo(self, texto: str) -> 'DocumentBuilder':
         """
         Agrega un párrafo justificado al documento.
@@ -951,10 +1626,38 @@ class DocumentBuilder:
         Returns:
             self para permitir encadenamiento de métodos
         """
+        self._volcar()
         agregar_parrafo(self.doc, texto)
         self._historial.append(f"Párrafo: {texto[:50]}..." if len(texto) > 50 else f"Párrafo: {texto}")
         return self
 
+    def reservar_parrafo(self, futuro: Union[str, Future]) -> 'DocumentBuilder':
+        """
+        Reserva el lugar de un párrafo cuyo texto todavía se está generando y
+        sigue armando el documento sin esperarlo.
+
+        El texto se escribe cuando el Future termina (en la siguiente operación
+        del builder) o, a más tardar, en guardar(), que espera los que falten.
+        En modo streaming el volcado a disco se detiene en el primer párrafo
+        reservado sin texto.
+
+        Args:
+            futuro: Future con el texto (p. ej. openia_script.analyze_dataframe_async)
+
+        Returns:
+            self para permitir encadenamiento de métodos
+
+        Example:
+            >>> builder.titulo("Resumen", 1) \\
+            ...        .reservar_parrafo(analyze_dataframe_async(df, seccion='resumen')) \\
+            ...        .tabla(df) \\
+            ...        .figura(fig)
+        """
+        self._volcar()
+        self._pendientes.append((agregar_parrafo(self.doc, ''), futuro))
+        self._historial.append("Párrafo reservado")
+        return self
+
     def tabla(self, df, titulo: Optional[str] = None, con_merge: bool = False,
               group_cols: Optional[List[str]] = None) -> 'DocumentBuilder':
         """
@@ -972,12 +1675,16 @@ class DocumentBuilder:
         Raises:
             ValueError: Si df está vacío o no es válido
         """
+        self._volcar()
         try:
             if df.empty:
                 self.parrafo("[Tabla vacía: sin datos para mostrar]")
                 self._historial.append("Tabla: vacía")
                 return self
 
+            # El título de la tabla es de nivel 3 y sigue la numeración del builder
+            if titulo:
+                titulo = self._numerar(titulo, 3)
             if con_merge:
                 insertar_tabla_con_merge(self.doc, df, titulo, group_cols)
                 self._historial.append(f"Tabla con merge: {len(df)} filas × {len(df.columns)} cols")
@@ -996,13 +1703,16 @@ class DocumentBuilder:
         Inserta una figura (matplotlib) en el documento.
 
         Args:
-            figura: Objeto Figure de matplotlib
+            figura: Objeto Figure de matplotlib o bytes png (graficos.renderizar)
             titulo: Título opcional sobre la figura
             pie: Texto de pie de figura
 
         Returns:
             self para permitir encadenamiento de métodos
         """
+        self._volcar()
+        if titulo:
+            titulo = self._numerar(titulo, 3)
         try:
             insertar_figura(self.doc, figura, titulo, pie, ancho_cm, alto_cm)
             self._historial.append(f"Figura: {titulo if titulo else 'sin título'}")
@@ -1027,6 +1737,7 @@ class DocumentBuilder:
         Returns:
             self para permitir encadenamiento de métodos
         """
+        self._volcar()
         agregar_viñetas(self.doc, items, nivel, espacio_antes, espacio_despues)
         self._historial.append(f"Viñetas: {len(items)} items (nivel {nivel})")
         return self
@@ -1038,6 +1749,7 @@ class DocumentBuilder:
         Returns:
             self para permitir encadenamiento de métodos
         """
+        self._volcar()
         insertar_salto_pagina(self.doc)
         self._historial.append("Salto de página")
         return self
@@ -1053,9 +1765,11 @@ class DocumentBuilder:
             self para permitir encadenamiento de métodos
 
         Note:
-            El índice debe actualizarse manualmente en Word (clic derecho > Actualizar campos)
+            Al guardar, el índice se completa con los títulos del documento (con
+            hipervínculos). Los números de página los agrega Word al actualizar el campo.
         """
-        insertar_indice(self.doc, titulo)
+        self._volcar()
+        self._indice = [insertar_indice(self.doc, titulo)]
         self._historial.append(f"Índice: {titulo}")
         return self
 
@@ -1066,6 +1780,7 @@ class DocumentBuilder:
         Returns:
             self para permitir encadenamiento de métodos
         """
+        self._volcar()
         agregar_advertencia_actualizacion(self.doc)
         self._historial.append("Advertencia de actualización")
         return self
@@ -1074,9 +1789,18 @@ class DocumentBuilder:
         """
         Numera automáticamente todos los títulos existentes (1., 1.1, 1.1.1, etc.).
 
+        Si el builder ya numera al vuelo (config 'numerar_titulos'), no hace nada
+        y emite un warning: la llamada sobra.
+
         Returns:
             self para permitir encadenamiento de métodos
         """
+        if self.config['numerar_titulos']:
+            warnings.warn("El builder ya numera los títulos al vuelo (config 'numerar_titulos'); "
+                          "numerar_titulos() no hace nada", stacklevel=2)
+            return self
+        if self._stream is not None:
+            raise RuntimeError("En modo streaming los títulos se numeran al vuelo: use config {'numerar_titulos': True}")
         numerar_titulos_existentes(self.doc)
         self._historial.append("Numeración de títulos aplicada")
         return self
@@ -1090,7 +1814,14 @@ class DocumentBuilder:
             verbose: Si True, imprime información del guardado
         """
         try:
-            guardar_documento(self.doc, ruta)
+            self._completar_pendientes()
+            if self._stream is not None:
+                self._volcar()
+                self._stream.finalizar(ruta, con_indice=self._indice is not None)
+            else:
+                if self._indice is not None:
+                    self._indice = poblar_indice(self.doc, self._indice)
+                guardar_documento(self.doc, ruta)
             if verbose:
                 print(f"[OK] Documento guardado en: {ruta}")
                 print(f"[OK] Operaciones realizadas: {len(self._historial)}")
@@ -1098,28 +1829,6 @@ class DocumentBuilder:
             print(f"[ERROR] Error al guardar documento: {e}")
             raise
 
-    def obtener_historial(self) -> List[str]:
-        """
-        Retorna una copia del historial de operaciones.
-
-        Returns:
-            Lista de strings describiendo cada operación realizada
-        """
-        return self._historial.copy()
-
-    def mostrar_historial(self) -> 'DocumentBuilder':
-        """
-        Imprime el historial de operaciones en consola.
-
-        Returns:
-            self para permitir encadenamiento de métodos
-        """
-        print("\n=== Historial de Operaciones ===")
-        for i, op in enumerate(self._historial, 1):
-            print(f"{i:2d}. {op}")
-        print(f"\nTotal: {len(self._historial)} operaciones\n")
-        return self
-
     def obtener_documento(self) -> Document:
         """
         Retorna el objeto Document interno para manipulación avanzada.